@@ -1,94 +1,554 @@
+import asyncio
+import hashlib
+import json
 import logging
 import os
-import subprocess
-from typing import Optional
+import re
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
-from openai import OpenAI
+import numpy as np
+
+from core.asr_engines import get_engine
+from core.process import FFMPEG_STALL_SECONDS, FFMPEG_TIMEOUT_SECONDS, ProcessTimeout, run_process_sync
 
 logger = logging.getLogger(__name__)
 
-_client = None
+OPENAI_FILE_LIMIT = 25 * 1024 * 1024  # 25 MB
+SAMPLE_RATE = 16000
+# Time limit for the ffprobe duration lookup
+PROBE_TIMEOUT_SECONDS = 60
 
 
-def _get_client() -> OpenAI:
-    global _client
-    if _client is None:
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if not api_key:
-            raise RuntimeError(
-                "OPENAI_API_KEY is not set. "
-                "Add it in Settings or create backend/.env with: OPENAI_API_KEY=sk-..."
-            )
-        _client = OpenAI(api_key=api_key)
-    return _client
+# Upload encodings, best first. Each is (codec, container, extension, bitrate kbps).
+# Speech-tuned 16 kHz mono Opus is ~2x smaller than MP3 at equal intelligibility.
+_AUDIO_ENCODINGS = {
+    "opus": [("libopus", "ogg", "ogg", kbps) for kbps in (32, 24, 16, 12, 8)],
+    "mp3": [("libmp3lame", "mp3", "mp3", kbps) for kbps in (64, 48, 32, 24, 16)],
+}
+ASR_AUDIO_CODEC = os.environ.get("ASR_AUDIO_CODEC", "opus")
+# Leave headroom for container overhead and VBR overshoot
+_UPLOAD_BUDGET_RATIO = 0.9
 
 
-def reset_client():
-    """Reset cached client so it picks up new API key from env."""
-    global _client
-    _client = None
+def _choose_audio_encoding(duration: float, codec: str = ASR_AUDIO_CODEC) -> Tuple[str, str, str, int]:
+    """
+    Pick the highest-quality encoding whose output fits OPENAI_FILE_LIMIT for
+    a clip of the given duration. Falls back to the smallest one if none fits.
+    """
+    ladder = _AUDIO_ENCODINGS.get(codec, _AUDIO_ENCODINGS["opus"])
+    if duration <= 0:
+        return ladder[0]
+    budget_kbps = OPENAI_FILE_LIMIT * _UPLOAD_BUDGET_RATIO * 8 / 1000 / duration
+    for encoding in ladder:
+        if encoding[3] <= budget_kbps:
+            return encoding
+    return ladder[-1]
+
+
+def _encoding_args(codec: str, container: str, kbps: int) -> List[str]:
+    """FFmpeg output arguments for mono 16 kHz upload audio written to stdout."""
+    args = [
+        "-c:a", codec,
+        "-b:a", f"{kbps}k",
+        "-ar", str(SAMPLE_RATE),
+        "-ac", "1",
+    ]
+    if codec == "libopus":
+        args += ["-application", "voip"]
+    return args + ["-f", container, "pipe:1"]
 
-OPENAI_FILE_LIMIT = 25 * 1024 * 1024  # 25 MB
 
+def _run_ffmpeg(command: List[str], input: Optional[bytes] = None, on_stdout=None) -> Tuple[int, bytes, str]:
+    """
+    Run an ffmpeg command that streams its output to stdout under the process
+    supervisor: niced, stderr drained concurrently, killed when it stalls or
+    runs past FFMPEG_TIMEOUT_SECONDS (ProcessTimeout).
+    """
+    return run_process_sync(
+        command, input=input, on_stdout=on_stdout,
+        timeout=FFMPEG_TIMEOUT_SECONDS, stall_timeout=FFMPEG_STALL_SECONDS,
+    )
 
-def _extract_audio(video_path: str) -> str:
-    """Extract audio from video as mp3 to reduce file size for API upload."""
-    audio_path = video_path.rsplit(".", 1)[0] + "_audio.mp3"
+
+def _extract_audio(
+    video_path: str,
+    duration: float = 0,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+) -> Tuple[bytes, str]:
+    """
+    Extract the audio track (or the [start, end) slice of it) as mono 16 kHz
+    audio, piped from FFmpeg straight into memory.
+    Returns (encoded bytes, upload filename).
+    """
+    span = (end - start) if start is not None and end is not None else duration
+    codec, container, ext, kbps = _choose_audio_encoding(span)
+
+    command = ["ffmpeg", "-v", "error"]
+    if start is not None:
+        command += ["-ss", f"{start:.3f}"]
+    command += ["-i", video_path]
+    if start is not None and end is not None:
+        command += ["-t", f"{end - start:.3f}"]
+    command += ["-vn"] + _encoding_args(codec, container, kbps)
+
+    logger.info("Extracting audio: %s", " ".join(command))
+    returncode, audio, stderr = _run_ffmpeg(command)
+    if returncode != 0:
+        logger.error("Audio extraction failed: %s", stderr)
+        raise RuntimeError(f"FFmpeg audio extraction failed: {stderr[:500]}")
+    logger.info("Extracted %d bytes of %s audio at %dk", len(audio), ext, kbps)
+    return audio, f"audio.{ext}"
+
+
+def compute_audio_hash(file_path: str) -> str:
+    """
+    SHA-256 of the decoded audio stream (mono 16 kHz PCM).
+    Re-muxed or re-encoded copies with identical audio map to the same hash.
+    """
     command = [
-        "ffmpeg", "-y",
-        "-i", video_path,
+        "ffmpeg", "-v", "error",
+        "-i", file_path,
         "-vn",
-        "-acodec", "libmp3lame",
-        "-ab", "64k",
-        "-ar", "16000",
         "-ac", "1",
-        audio_path,
+        "-ar", str(SAMPLE_RATE),
+        "-f", "s16le",
+        "pipe:1",
     ]
-    logger.info("Extracting audio: %s", " ".join(command))
-    result = subprocess.run(command, capture_output=True, text=True)
-    if result.returncode != 0:
-        logger.error("Audio extraction failed: %s", result.stderr)
-        raise RuntimeError(f"FFmpeg audio extraction failed: {result.stderr[:500]}")
-    return audio_path
+    digest = hashlib.sha256()
+    # Hashed as it streams: the PCM of a long upload never sits in memory
+    returncode, _, stderr = _run_ffmpeg(command, on_stdout=digest.update)
+    if returncode != 0:
+        raise RuntimeError(f"FFmpeg audio decode failed: {stderr[:500]}")
+    return digest.hexdigest()
 
 
-def transcribe_audio(file_path: str, language: Optional[str] = None):
+def transcription_cache_key(audio_hash: str, language: Optional[str], model: str) -> str:
     """
-    Transcribes audio/video file using OpenAI Whisper API.
-    Returns list of words with timestamps.
+    Cache key for a transcription: decoded audio hash + language hint + model
+    + whether VAD trimming is on (it shifts the returned timestamps).
     """
-    logger.info("Starting transcription for %s (language=%s)", file_path, language or "auto-detect")
+    vad = "vad" if ASR_VAD_ENABLED else "novad"
+    return hashlib.sha256(f"{audio_hash}|{language or 'auto'}|{model}|{vad}".encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Voice activity trimming
+# ---------------------------------------------------------------------------
+# Energy-based VAD over decoded PCM: non-speech stretches are cut down to
+# VAD_KEEP_GAP seconds of silence before upload, and an offset map translates
+# returned timestamps back to the source timeline.
+ASR_VAD_ENABLED = os.environ.get("ASR_VAD", "1").strip().lower() not in ("0", "false", "no", "off")
+VAD_FRAME_SECONDS = 0.03
+VAD_THRESHOLD_DB = 12.0        # speech must be this far above the noise floor
+VAD_MIN_LEVEL_DBFS = -50.0     # ...and above this absolute level
+VAD_PAD_SECONDS = 0.25         # context kept around each speech region
+VAD_MIN_SILENCE_SECONDS = 1.0  # shorter pauses are kept as-is
+VAD_KEEP_GAP = 0.4             # silence left between compressed regions
+VAD_MIN_SAVING_RATIO = 0.1     # skip trimming when it would save less than this
+
+# Offset map entries: (trimmed_start, source_start, length) in seconds
+OffsetMap = List[Tuple[float, float, float]]
+
 
-    # Extract audio if the file is too large for the API
-    upload_path = file_path
-    cleanup_path = None
-    if os.path.getsize(file_path) > OPENAI_FILE_LIMIT:
-        logger.info("File exceeds 25MB, extracting audio track...")
-        upload_path = _extract_audio(file_path)
-        cleanup_path = upload_path
+def _decode_pcm(file_path: str, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+    """Decode the audio track (or a slice of it) to mono 16 kHz int16 samples."""
+    command = ["ffmpeg", "-v", "error"]
+    if start is not None:
+        command += ["-ss", f"{start:.3f}"]
+    command += ["-i", file_path]
+    if start is not None and end is not None:
+        command += ["-t", f"{end - start:.3f}"]
+    command += ["-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"]
+
+    returncode, pcm, stderr = _run_ffmpeg(command)
+    if returncode != 0:
+        raise RuntimeError(f"FFmpeg audio decode failed: {stderr[:500]}")
+    return np.frombuffer(pcm, dtype=np.int16)
+
+
+def _detect_speech(pcm: np.ndarray, sample_rate: int = SAMPLE_RATE) -> List[Tuple[float, float]]:
+    """Return padded (start, end) speech regions in seconds using frame energy."""
+    frame = max(1, int(sample_rate * VAD_FRAME_SECONDS))
+    n_frames = len(pcm) // frame
+    if n_frames == 0:
+        return []
+
+    frames = pcm[: n_frames * frame].astype(np.float32).reshape(n_frames, frame) / 32768.0
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    level_db = 20 * np.log10(np.maximum(rms, 1e-10))
+
+    noise_floor = np.percentile(level_db, 10)
+    threshold = max(noise_floor + VAD_THRESHOLD_DB, VAD_MIN_LEVEL_DBFS)
+    active = level_db > threshold
+    if not active.any():
+        return []
+
+    # Rising/falling edges of the activity mask -> frame ranges
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    total = len(pcm) / sample_rate
+    regions: List[Tuple[float, float]] = []
+    for s, e in zip(starts, ends):
+        r_start = max(0.0, s * VAD_FRAME_SECONDS - VAD_PAD_SECONDS)
+        r_end = min(total, e * VAD_FRAME_SECONDS + VAD_PAD_SECONDS)
+        if regions and r_start - regions[-1][1] < VAD_MIN_SILENCE_SECONDS:
+            regions[-1] = (regions[-1][0], r_end)
+        else:
+            regions.append((r_start, r_end))
+    return [(round(a, 3), round(b, 3)) for a, b in regions]
+
+
+def _build_offset_map(regions: List[Tuple[float, float]], total: float) -> Optional[OffsetMap]:
+    """
+    Lay speech regions end to end, VAD_KEEP_GAP apart. Returns None when there
+    is nothing to trim (no speech found, or the saving is negligible).
+    """
+    if not regions or total <= 0:
+        return None
+
+    offset_map: OffsetMap = []
+    cursor = 0.0
+    for start, end in regions:
+        offset_map.append((round(cursor, 3), start, round(end - start, 3)))
+        cursor += (end - start) + VAD_KEEP_GAP
+    trimmed = cursor - VAD_KEEP_GAP
+    if trimmed > total * (1 - VAD_MIN_SAVING_RATIO):
+        return None
+    return offset_map
+
+
+def _trim_pcm(pcm: np.ndarray, offset_map: OffsetMap, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Concatenate the mapped speech regions with VAD_KEEP_GAP of silence between them."""
+    gap = np.zeros(int(VAD_KEEP_GAP * sample_rate), dtype=pcm.dtype)
+    pieces = []
+    for i, (_, source_start, length) in enumerate(offset_map):
+        if i:
+            pieces.append(gap)
+        a = int(source_start * sample_rate)
+        pieces.append(pcm[a: a + int(length * sample_rate)])
+    return np.concatenate(pieces) if pieces else pcm[:0]
+
+
+def _map_to_source(t: float, offset_map: OffsetMap) -> float:
+    """Translate a timestamp on the trimmed timeline back to the source timeline."""
+    for trimmed_start, source_start, length in reversed(offset_map):
+        if t >= trimmed_start:
+            # Times inside an inserted gap snap to the end of the preceding region
+            return round(source_start + min(t - trimmed_start, length), 3)
+    return round(offset_map[0][1], 3) if offset_map else t
+
+
+def _map_words_to_source(words: List[Dict], offset_map: Optional[OffsetMap]) -> List[Dict]:
+    if not offset_map:
+        return words
+    return [
+        {"word": w["word"], "start": _map_to_source(w["start"], offset_map), "end": _map_to_source(w["end"], offset_map)}
+        for w in words
+    ]
+
+
+def _encode_pcm(pcm: np.ndarray) -> Tuple[bytes, str]:
+    """Encode int16 PCM for upload, choosing the encoding for its duration."""
+    codec, container, ext, kbps = _choose_audio_encoding(len(pcm) / SAMPLE_RATE)
+    command = [
+        "ffmpeg", "-v", "error",
+        "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1",
+        "-i", "pipe:0",
+    ] + _encoding_args(codec, container, kbps)
+    returncode, audio, stderr = _run_ffmpeg(command, input=pcm.tobytes())
+    if returncode != 0:
+        raise RuntimeError(f"FFmpeg audio encode failed: {stderr[:500]}")
+    return audio, f"audio.{ext}"
+
+
+def _prepare_audio(
+    file_path: str,
+    duration: float = 0,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+) -> Tuple[bytes, str, Optional[OffsetMap]]:
+    """
+    Produce upload audio for the file (or a slice of it), trimmed by VAD when
+    enabled. Returns (audio bytes, upload filename, offset map or None);
+    the offset map is relative to the slice start. Engines with pcm_input
+    get the decoded 16 kHz PCM as is; the others get an encoded upload.
+    """
+    pcm_input = get_engine().pcm_input
+    if not ASR_VAD_ENABLED and not pcm_input:
+        audio, filename = _extract_audio(file_path, duration, start, end)
+        return audio, filename, None
 
+    pcm = _decode_pcm(file_path, start, end)
+    offset_map = None
+    if ASR_VAD_ENABLED:
+        total = len(pcm) / SAMPLE_RATE
+        offset_map = _build_offset_map(_detect_speech(pcm), total)
+        if offset_map:
+            pcm = _trim_pcm(pcm, offset_map)
+            logger.info("VAD: trimmed %.1fs of audio to %.1fs (%d speech regions)", total, len(pcm) / SAMPLE_RATE, len(offset_map))
+    if pcm_input:
+        return pcm.tobytes(), "audio.pcm", offset_map
+    audio, filename = _encode_pcm(pcm)
+    return audio, filename, offset_map
+
+
+# Chunked transcription: long inputs are split at silence points into pieces of
+# at most CHUNK_MAX_SECONDS and transcribed concurrently.
+CHUNK_MAX_SECONDS = float(os.environ.get("ASR_CHUNK_SECONDS", 120))
+CHUNK_MIN_SECONDS = 20.0
+CHUNKING_THRESHOLD_SECONDS = float(os.environ.get("ASR_CHUNKING_THRESHOLD_SECONDS", 150))
+# Streamed transcriptions cut a short first chunk so the first subtitles arrive
+# early; shorter clips are chunked too once they exceed it by CHUNK_MIN_SECONDS.
+# 0 disables (streamed jobs then chunk like any other).
+FIRST_CHUNK_SECONDS = float(os.environ.get("ASR_FIRST_CHUNK_SECONDS", 30))
+SILENCE_NOISE_DB = -35
+SILENCE_MIN_DURATION = 0.3
+
+
+def _get_media_duration(file_path: str) -> float:
+    """Return media duration in seconds via ffprobe (0 if unknown)."""
+    command = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "json",
+        file_path,
+    ]
+    try:
+        returncode, stdout, stderr = run_process_sync(command, timeout=PROBE_TIMEOUT_SECONDS)
+    except ProcessTimeout as e:
+        logger.warning("ffprobe failed for %s: %s", file_path, e)
+        return 0.0
+    if returncode != 0:
+        logger.warning("ffprobe failed for %s: %s", file_path, stderr[:200])
+        return 0.0
+    try:
+        return float(json.loads(stdout)["format"]["duration"])
+    except (KeyError, ValueError, TypeError):
+        return 0.0
+
+
+_SILENCE_START = re.compile(r"silence_start: (-?[\d.]+)")
+_SILENCE_END = re.compile(r"silence_end: (-?[\d.]+)")
+
+
+def _detect_silences(file_path: str) -> List[Tuple[float, float]]:
+    """Return (start, end) pairs of silent stretches using FFmpeg's silencedetect."""
+    command = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", file_path,
+        "-vn",
+        "-af", f"silencedetect=noise={SILENCE_NOISE_DB}dB:d={SILENCE_MIN_DURATION}",
+        "-f", "null", "-",
+    ]
+    silences = []
+    current_start = None
+
+    def on_line(line: str):
+        # silencedetect reports on stderr, which may outgrow the kept tail
+        nonlocal current_start
+        m = _SILENCE_START.search(line)
+        if m:
+            current_start = max(float(m.group(1)), 0.0)
+            return
+        m = _SILENCE_END.search(line)
+        if m and current_start is not None:
+            silences.append((current_start, float(m.group(1))))
+            current_start = None
+
+    # No stall limit: with -nostats a long stretch without silence prints nothing
     try:
-        kwargs = {
-            "model": "whisper-1",
-            "response_format": "verbose_json",
-            "timestamp_granularities": ["word"],
-        }
-        if language:
-            kwargs["language"] = language
-
-        with open(upload_path, "rb") as audio_file:
-            result = _get_client().audio.transcriptions.create(file=audio_file, **kwargs)
-    finally:
-        if cleanup_path and os.path.exists(cleanup_path):
-            os.remove(cleanup_path)
-
-    words = []
-    for w in result.words:
-        words.append({
-            "word": w.word.strip(),
-            "start": round(w.start, 3),
-            "end": round(w.end, 3),
-        })
+        returncode, _, stderr = run_process_sync(command, on_stderr_line=on_line, timeout=FFMPEG_TIMEOUT_SECONDS)
+    except ProcessTimeout as e:
+        logger.warning("Silence detection failed, falling back to fixed cuts: %s", e)
+        return []
+    if returncode != 0:
+        logger.warning("Silence detection failed, falling back to fixed cuts: %s", stderr[:200])
+        return []
+    return silences
+
+
+def _plan_chunks(
+    duration: float,
+    silences: List[Tuple[float, float]],
+    max_chunk: float = CHUNK_MAX_SECONDS,
+    min_chunk: float = CHUNK_MIN_SECONDS,
+    first_chunk: Optional[float] = None,
+) -> List[Tuple[float, float]]:
+    """
+    Split [0, duration] into consecutive (start, end) ranges no longer than max_chunk.
+    Cuts are placed in the middle of the latest silence that keeps the chunk
+    between min_chunk and max_chunk; without a usable silence we cut hard at max_chunk.
+    first_chunk, when set, caps the first range instead (min_chunk shrinks to fit).
+    """
+    if duration <= 0:
+        return []
+
+    chunks = []
+    cursor = 0.0
+    while True:
+        size = first_chunk if first_chunk and not chunks else max_chunk
+        if duration - cursor <= size:
+            break
+        shortest = min(min_chunk, size / 2)
+        limit = cursor + size
+        cut = None
+        for s_start, s_end in silences:
+            mid = (s_start + s_end) / 2
+            if cursor + shortest <= mid <= limit:
+                cut = mid
+            elif mid > limit:
+                break
+        if cut is None:
+            cut = limit
+        chunks.append((round(cursor, 3), round(cut, 3)))
+        cursor = cut
+    chunks.append((round(cursor, 3), round(duration, 3)))
+    return chunks
+
+
+def _offset_words(words: List[Dict], offset: float, limit: Optional[float] = None) -> List[Dict]:
+    """Shift chunk-relative word timestamps onto the source timeline."""
+    shifted = []
+    for w in words:
+        start = round(w["start"] + offset, 3)
+        end = round(w["end"] + offset, 3)
+        if limit is not None:
+            start = min(start, limit)
+            end = min(end, limit)
+        shifted.append({"word": w["word"], "start": start, "end": end})
+    return shifted
+
+
+# Awaited as (chunk_index, chunk_count, words) when a chunk is done, in completion order
+ChunkCallback = Callable[[int, int, List[Dict]], Awaitable[None]]
+
+# Max FFmpeg extractions running at once while preparing chunks ahead of time
+PREPARE_MAX_WORKERS = int(os.environ.get("ASR_PREPARE_WORKERS", 4))
+
+
+async def prepare_audio(
+    file_path: str,
+    chunked: Optional[bool] = None,
+    extract_all: bool = False,
+    duration: Optional[float] = None,
+    stream: bool = False,
+) -> Dict:
+    """
+    Probe the file and plan its transcription: a single request, or
+    silence-aligned chunks for long inputs (chunked=False forces a single one).
+    stream=True plans for partial results: a short first chunk
+    (ASR_FIRST_CHUNK_SECONDS), and clips chunked well below the usual threshold.
+
+    Returns {"file_path", "duration", "spans", "uploads"}. spans holds
+    (start, end) per chunk, or [None] for a whole-file request; uploads maps
+    span index -> (audio bytes, upload filename, offset map) for audio that is
+    already extracted. extract_all=True extracts every chunk up front so the
+    result can be prepared ahead of time (e.g. right after upload). Pass a
+    known duration (e.g. from probe_media) to skip the ffprobe call.
+    """
+    if duration is None:
+        duration = await asyncio.to_thread(_get_media_duration, file_path)
+    prepared = {"file_path": file_path, "duration": duration, "spans": [None], "uploads": {}}
+
+    allow_chunking = chunked is not False and duration > 0
+    first_chunk = FIRST_CHUNK_SECONDS if stream and FIRST_CHUNK_SECONDS > 0 else None
+    if chunked is None:
+        threshold = CHUNKING_THRESHOLD_SECONDS
+        if first_chunk:
+            threshold = min(threshold, first_chunk + CHUNK_MIN_SECONDS)
+        chunked = duration > threshold
+
+    if not (chunked and allow_chunking):
+        upload = await asyncio.to_thread(_prepare_audio, file_path, duration)
+        # The size limit is the API's; PCM for a local engine never leaves the box
+        if get_engine().pcm_input or len(upload[0]) <= OPENAI_FILE_LIMIT or not allow_chunking:
+            prepared["uploads"][0] = upload
+            return prepared
+        logger.info("Extracted audio exceeds 25MB, switching to chunked mode")
+
+    silences = await asyncio.to_thread(_detect_silences, file_path)
+    prepared["spans"] = _plan_chunks(duration, silences, first_chunk=first_chunk)
+
+    if extract_all:
+        slots = asyncio.Semaphore(max(1, PREPARE_MAX_WORKERS))
+
+        async def _extract(index: int):
+            async with slots:
+                prepared["uploads"][index] = await _prepare_span(prepared, index)
+
+        await asyncio.gather(*(_extract(i) for i in range(len(prepared["spans"]))))
+    return prepared
+
+
+async def _prepare_span(prepared: Dict, index: int) -> Tuple[bytes, str, Optional[OffsetMap]]:
+    """Upload audio for one span, extracting it now unless it was prepared earlier."""
+    upload = prepared["uploads"].get(index)
+    if upload is not None:
+        return upload
+    span = prepared["spans"][index]
+    if span is None:
+        return await asyncio.to_thread(_prepare_audio, prepared["file_path"], prepared["duration"])
+    return await asyncio.to_thread(_prepare_audio, prepared["file_path"], 0, span[0], span[1])
+
+
+async def transcribe_prepared(
+    prepared: Dict,
+    language: Optional[str] = None,
+    on_chunk: Optional[ChunkCallback] = None,
+) -> List[Dict]:
+    """Transcribe the spans of a prepare_audio() result concurrently and stitch the words."""
+    engine = get_engine()
+    spans = prepared["spans"]
+    workers = engine.max_concurrency
+    if len(spans) > 1:
+        logger.info("Chunked transcription: %d chunks, %d workers (%s)", len(spans), workers, engine.name)
+
+    # Bounds this job's in-flight chunks; providers apply their own global limit
+    slots = asyncio.Semaphore(workers)
+
+    async def _run_span(index: int) -> List[Dict]:
+        async with slots:
+            audio, filename, offset_map = await _prepare_span(prepared, index)
+            words = _map_words_to_source(await engine.transcribe(audio, filename, language), offset_map)
+        span = spans[index]
+        if span is not None:
+            logger.info("Chunk %d/%d transcribed (%.1f-%.1fs, %d words)", index + 1, len(spans), span[0], span[1], len(words))
+            words = _offset_words(words, span[0], span[1])
+        if on_chunk:
+            await on_chunk(index, len(spans), words)
+        return words
+
+    results = await asyncio.gather(*(_run_span(i) for i in range(len(spans))))
+    return [w for span_words in results for w in span_words]
+
+
+async def transcribe_audio(
+    file_path: str,
+    language: Optional[str] = None,
+    chunked: Optional[bool] = None,
+    on_chunk: Optional[ChunkCallback] = None,
+    prepared: Optional[Dict] = None,
+):
+    """
+    Transcribes audio/video file with the configured ASR engine
+    (OpenAI Whisper API by default). Returns list of words with timestamps.
+
+    The audio track is always extracted in memory at a bitrate chosen to fit
+    the API limit, with long non-speech stretches trimmed out (ASR_VAD).
+    Long inputs (or chunked=True) are split at silences and transcribed
+    concurrently; chunked=False forces a single request. Pass a result of
+    prepare_audio() as prepared to skip probing and extraction.
+    on_chunk is awaited in completion order with each chunk's words on the
+    source timeline.
+    """
+    logger.info("Starting transcription for %s (language=%s)", file_path, language or "auto-detect")
+
+    if prepared is None:
+        prepared = await prepare_audio(file_path, chunked)
+    words = await transcribe_prepared(prepared, language, on_chunk)
 
     logger.info("Transcription complete: %d words extracted", len(words))
     return words
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from openai import AsyncOpenAI
+
+from core.providers import call_with_retries, get_http_client
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+ASR_ENGINE = os.environ.get("ASR_ENGINE", "openai").strip().lower()
+WHISPER_MODEL = "whisper-1"
+# Concurrent Whisper API requests per job (chunked mode)
+ASR_MAX_WORKERS = int(os.environ.get("ASR_MAX_WORKERS", 4))
+LOCAL_ASR_MODEL = os.environ.get("LOCAL_ASR_MODEL", "base")
+LOCAL_ASR_WORKERS = int(os.environ.get("LOCAL_ASR_WORKERS", max(1, (os.cpu_count() or 2) // 4)))
+LOCAL_ASR_THREADS = int(os.environ.get("LOCAL_ASR_THREADS", max(1, (os.cpu_count() or 2) // LOCAL_ASR_WORKERS)))
+
+
+class ASREngine(ABC):
+    """Transcription backend. transcribe() takes encoded audio (or raw PCM,
+    see pcm_input) and returns a list of {"word", "start", "end"} dicts with
+    timestamps in seconds."""
+
+    name = "base"
+    # True: transcribe() receives mono 16 kHz s16le PCM instead of an encoded upload
+    pcm_input = False
+
+    @property
+    @abstractmethod
+    def model_id(self) -> str:
+        """Identifies engine+model, used as part of transcription cache keys."""
+
+    @property
+    def max_concurrency(self) -> int:
+        """How many chunks of one job may be in flight at once."""
+        return 1
+
+    @abstractmethod
+    async def transcribe(self, audio: bytes, filename: str, language: Optional[str] = None) -> List[Dict]:
+        """Transcribe one upload (or PCM buffer) into timed words."""
+
+    def warm_up(self):
+        """Prepare the engine ahead of the first job (no-op by default)."""
+
+    def shutdown(self):
+        """Release engine resources (no-op by default)."""
+
+
+# ---------------------------------------------------------------------------
+# OpenAI Whisper API
+# ---------------------------------------------------------------------------
+_client = None
+
+
+def _get_client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        api_key = os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError(
+                "OPENAI_API_KEY is not set. "
+                "Add it in Settings or create backend/.env with: OPENAI_API_KEY=sk-..."
+            )
+        # Retries are handled by call_with_retries (jittered, concurrency-aware)
+        _client = AsyncOpenAI(api_key=api_key, http_client=get_http_client(), max_retries=0)
+    return _client
+
+
+def reset_client():
+    """Reset cached client so it picks up new API key from env."""
+    global _client
+    _client = None
+
+
+class OpenAIEngine(ASREngine):
+    name = "openai"
+
+    @property
+    def model_id(self) -> str:
+        return WHISPER_MODEL
+
+    @property
+    def max_concurrency(self) -> int:
+        return max(1, ASR_MAX_WORKERS)
+
+    async def transcribe(self, audio: bytes, filename: str, language: Optional[str] = None) -> List[Dict]:
+        kwargs = {
+            "model": WHISPER_MODEL,
+            "response_format": "verbose_json",
+            "timestamp_granularities": ["word"],
+        }
+        if language:
+            kwargs["language"] = language
+
+        result = await call_with_retries(
+            "openai", _get_client().audio.transcriptions.create, file=(filename, audio), **kwargs
+        )
+
+        return [
+            {"word": w.word.strip(), "start": round(w.start, 3), "end": round(w.end, 3)}
+            for w in (result.words or [])
+        ]
+
+
+# ---------------------------------------------------------------------------
+# Local CPU Whisper (faster-whisper, falling back to openai-whisper)
+# ---------------------------------------------------------------------------
+# Per-process model handle, loaded once by the pool initializer: (kind, model)
+_worker_model = None
+
+
+def _load_local_model(model_name: str, threads: int):
+    try:
+        from faster_whisper import WhisperModel
+        return ("faster_whisper", WhisperModel(model_name, device="cpu", compute_type="int8", cpu_threads=threads))
+    except ImportError:
+        pass
+    try:
+        import torch
+        import whisper
+    except ImportError:
+        raise RuntimeError(
+            "Local ASR needs faster-whisper or openai-whisper. "
+            "Run: pip install faster-whisper"
+        )
+    torch.set_num_threads(threads)
+    return ("whisper", whisper.load_model(model_name, device="cpu"))
+
+
+def _init_local_worker(model_name: str, threads: int):
+    global _worker_model
+    _worker_model = _load_local_model(model_name, threads)
+
+
+def _warm_local_worker() -> int:
+    return os.getpid()
+
+
+def _local_transcribe(audio: bytes, language: Optional[str]) -> List[Dict]:
+    """Runs inside a pool worker with the model already loaded; audio is s16le PCM."""
+    import numpy as np
+
+    kind, model = _worker_model
+    pcm = np.frombuffer(audio, dtype=np.int16).astype(np.float32) / 32768.0
+
+    words = []
+    if kind == "faster_whisper":
+        segments, _ = model.transcribe(pcm, language=language, word_timestamps=True)
+        for segment in segments:
+            for w in segment.words or []:
+                words.append({"word": w.word.strip(), "start": round(w.start, 3), "end": round(w.end, 3)})
+    else:
+        result = model.transcribe(pcm, language=language, word_timestamps=True, fp16=False)
+        for segment in result.get("segments", []):
+            for w in segment.get("words", []):
+                words.append({"word": w["word"].strip(), "start": round(w["start"], 3), "end": round(w["end"], 3)})
+    return words
+
+
+class LocalWhisperEngine(ASREngine):
+    """Runs Whisper on local CPU cores in a pool of warm worker processes."""
+
+    name = "local"
+    # No upload limit to fit: skip the lossy encode and the decode in the worker
+    pcm_input = True
+
+    def __init__(self, model_name: str = LOCAL_ASR_MODEL, workers: int = LOCAL_ASR_WORKERS, threads: int = LOCAL_ASR_THREADS):
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        self.threads = max(1, threads)
+        self._pool = None
+
+    @property
+    def model_id(self) -> str:
+        return f"local:{self.model_name}"
+
+    @property
+    def max_concurrency(self) -> int:
+        return self.workers
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_local_worker,
+                initargs=(self.model_name, self.threads),
+            )
+        return self._pool
+
+    def warm_up(self):
+        pool = self._get_pool()
+        pids = {f.result() for f in [pool.submit(_warm_local_worker) for _ in range(self.workers)]}
+        logger.info(
+            "Local ASR ready: model=%s, %d worker process(es), %d thread(s) each",
+            self.model_name, len(pids), self.threads,
+        )
+
+    async def transcribe(self, audio: bytes, filename: str, language: Optional[str] = None) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), _local_transcribe, audio, language)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# ---------------------------------------------------------------------------
+# Engine registry
+# ---------------------------------------------------------------------------
+_ENGINES = {
+    "openai": OpenAIEngine,
+    "local": LocalWhisperEngine,
+}
+
+_engine = None
+
+
+def get_engine() -> ASREngine:
+    """Return the configured ASR engine (ASR_ENGINE env: openai | local)."""
+    global _engine
+    if _engine is None:
+        engine_cls = _ENGINES.get(ASR_ENGINE)
+        if engine_cls is None:
+            raise RuntimeError(f"Unknown ASR_ENGINE '{ASR_ENGINE}'. Choose one of: {', '.join(sorted(_ENGINES))}")
+        _engine = engine_cls()
+    return _engine
+
+
+def warm_up_engine():
+    get_engine().warm_up()
+
+
+def shutdown_engine():
+    global _engine
+    if _engine is not None:
+        _engine.shutdown()
+        _engine = None
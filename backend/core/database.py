@@ -1,10 +1,18 @@
 import aiosqlite
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "app.db")
 
+# Transcription cache limits (evicted least-recently-used first)
+TRANSCRIPTION_CACHE_MAX_BYTES = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+TRANSCRIPTION_CACHE_MAX_AGE_SECONDS = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_AGE_SECONDS", 30 * 24 * 60 * 60))
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES", 5 * 1024 * 1024 * 1024))
+RENDER_CACHE_MAX_AGE_SECONDS = int(os.environ.get("RENDER_CACHE_MAX_AGE_SECONDS", 24 * 60 * 60))
+PROBE_CACHE_MAX_BYTES = int(os.environ.get("PROBE_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+PROBE_CACHE_MAX_AGE_SECONDS = int(os.environ.get("PROBE_CACHE_MAX_AGE_SECONDS", 30 * 24 * 60 * 60))
+
 async def init_db():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     async with aiosqlite.connect(DB_PATH) as db:
@@ -29,6 +37,40 @@ async def init_db():
                 value TEXT NOT NULL
             )
         """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS transcription_cache (
+                key TEXT PRIMARY KEY,
+                words TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                last_used_at TEXT NOT NULL
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS render_cache (
+                key TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                last_used_at TEXT NOT NULL
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS probe_cache (
+                key TEXT PRIMARY KEY,
+                info TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                last_used_at TEXT NOT NULL DEFAULT ''
+            )
+        """)
+        # Databases created before probe cache eviction lack the LRU columns
+        cursor = await db.execute("PRAGMA table_info(probe_cache)")
+        columns = {row[1] for row in await cursor.fetchall()}
+        if "size_bytes" not in columns:
+            await db.execute("ALTER TABLE probe_cache ADD COLUMN size_bytes INTEGER NOT NULL DEFAULT 0")
+        if "last_used_at" not in columns:
+            await db.execute("ALTER TABLE probe_cache ADD COLUMN last_used_at TEXT NOT NULL DEFAULT ''")
         await db.commit()
 
 async def save_project(project_id, name, video_filename, subtitles, styles, language, duration=0, width=1080, height=1920):
@@ -81,6 +123,11 @@ async def delete_project(project_id):
         await db.execute("DELETE FROM projects WHERE id = ?", (project_id,))
         await db.commit()
 
+async def get_project_video_filenames():
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute("SELECT video_filename FROM projects WHERE video_filename IS NOT NULL")
+        return [row[0] for row in await cursor.fetchall()]
+
 async def get_setting(key):
     async with aiosqlite.connect(DB_PATH) as db:
         cursor = await db.execute("SELECT value FROM settings WHERE key = ?", (key,))
@@ -100,3 +147,161 @@ async def get_all_settings():
         cursor = await db.execute("SELECT key, value FROM settings")
         rows = await cursor.fetchall()
         return {row[0]: json.loads(row[1]) for row in rows}
+
+async def get_cached_transcription(key):
+    """Return the cached word list for key (refreshing its LRU timestamp), or None."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute("SELECT words, created_at FROM transcription_cache WHERE key = ?", (key,))
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        cutoff = (datetime.utcnow() - timedelta(seconds=TRANSCRIPTION_CACHE_MAX_AGE_SECONDS)).isoformat()
+        if row[1] < cutoff:
+            await db.execute("DELETE FROM transcription_cache WHERE key = ?", (key,))
+            await db.commit()
+            return None
+        await db.execute(
+            "UPDATE transcription_cache SET last_used_at = ? WHERE key = ?",
+            (datetime.utcnow().isoformat(), key)
+        )
+        await db.commit()
+        return json.loads(row[0])
+
+async def save_cached_transcription(key, words):
+    payload = json.dumps(words)
+    async with aiosqlite.connect(DB_PATH) as db:
+        now = datetime.utcnow().isoformat()
+        await db.execute("""
+            INSERT OR REPLACE INTO transcription_cache (key, words, size_bytes, created_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (key, payload, len(payload), now, now))
+        await db.commit()
+    await evict_transcription_cache()
+
+async def evict_transcription_cache(max_bytes=None, max_age_seconds=None):
+    """Drop expired entries, then least-recently-used ones until under the size budget."""
+    max_bytes = TRANSCRIPTION_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_seconds = TRANSCRIPTION_CACHE_MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds
+    async with aiosqlite.connect(DB_PATH) as db:
+        cutoff = (datetime.utcnow() - timedelta(seconds=max_age_seconds)).isoformat()
+        await db.execute("DELETE FROM transcription_cache WHERE created_at < ?", (cutoff,))
+
+        cursor = await db.execute("SELECT key, size_bytes FROM transcription_cache ORDER BY last_used_at DESC")
+        rows = await cursor.fetchall()
+        total = 0
+        stale = []
+        for key, size in rows:
+            total += size
+            if total > max_bytes:
+                stale.append((key,))
+        if stale:
+            await db.executemany("DELETE FROM transcription_cache WHERE key = ?", stale)
+        await db.commit()
+        return len(stale)
+
+async def get_cached_probe(key):
+    """Return the cached probe result for key (refreshing its LRU timestamp), or None."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute("SELECT info FROM probe_cache WHERE key = ?", (key,))
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        await db.execute(
+            "UPDATE probe_cache SET last_used_at = ? WHERE key = ?",
+            (datetime.utcnow().isoformat(), key)
+        )
+        await db.commit()
+        return json.loads(row[0])
+
+async def save_cached_probe(key, info):
+    payload = json.dumps(info)
+    async with aiosqlite.connect(DB_PATH) as db:
+        now = datetime.utcnow().isoformat()
+        await db.execute("""
+            INSERT OR REPLACE INTO probe_cache (key, info, size_bytes, created_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (key, payload, len(payload), now, now))
+        await db.commit()
+
+async def evict_probe_cache(max_bytes=None, max_age_seconds=None):
+    """Drop entries unused for max_age_seconds, then least-recently-used ones until under the size budget."""
+    max_bytes = PROBE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_seconds = PROBE_CACHE_MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds
+    async with aiosqlite.connect(DB_PATH) as db:
+        cutoff = (datetime.utcnow() - timedelta(seconds=max_age_seconds)).isoformat()
+        await db.execute("DELETE FROM probe_cache WHERE last_used_at < ?", (cutoff,))
+
+        cursor = await db.execute("SELECT key, size_bytes FROM probe_cache ORDER BY last_used_at DESC")
+        rows = await cursor.fetchall()
+        total = 0
+        stale = []
+        for key, size in rows:
+            total += size
+            if total > max_bytes:
+                stale.append((key,))
+        if stale:
+            await db.executemany("DELETE FROM probe_cache WHERE key = ?", stale)
+        await db.commit()
+        return len(stale)
+
+async def get_cached_render(key):
+    """Filename of the cached export for key (marking it recently used), or None."""
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute("SELECT filename FROM render_cache WHERE key = ?", (key,))
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        await db.execute(
+            "UPDATE render_cache SET last_used_at = ? WHERE key = ?",
+            (datetime.utcnow().isoformat(), key)
+        )
+        await db.commit()
+        return row[0]
+
+async def save_cached_render(key, filename, size_bytes):
+    async with aiosqlite.connect(DB_PATH) as db:
+        now = datetime.utcnow().isoformat()
+        await db.execute("""
+            INSERT OR REPLACE INTO render_cache (key, filename, size_bytes, created_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (key, filename, size_bytes, now, now))
+        await db.commit()
+
+async def delete_cached_render(key):
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute("DELETE FROM render_cache WHERE key = ?", (key,))
+        await db.commit()
+
+async def get_cached_render_filenames():
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute("SELECT filename FROM render_cache")
+        return {row[0] for row in await cursor.fetchall()}
+
+async def evict_render_cache(max_bytes=None, max_age_seconds=None, protected=()):
+    """
+    Drop entries unused for max_age_seconds, then least-recently-used ones
+    until under the size budget. Entries whose file is in protected are
+    kept. Returns the evicted filenames; deleting the files is up to the caller.
+    """
+    max_bytes = RENDER_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_seconds = RENDER_CACHE_MAX_AGE_SECONDS if max_age_seconds is None else max_age_seconds
+    cutoff = (datetime.utcnow() - timedelta(seconds=max_age_seconds)).isoformat()
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute(
+            "SELECT key, filename, size_bytes, last_used_at FROM render_cache ORDER BY last_used_at DESC"
+        )
+        rows = await cursor.fetchall()
+        # Protected files stay regardless, so they use up the budget first
+        total = sum(size for _, filename, size, _ in rows if filename in protected)
+        stale = []
+        for key, filename, size, last_used_at in rows:
+            if filename in protected:
+                continue
+            if last_used_at < cutoff or total + size > max_bytes:
+                stale.append((key, filename))
+            else:
+                total += size
+        if stale:
+            await db.executemany("DELETE FROM render_cache WHERE key = ?", [(key,) for key, _ in stale])
+        await db.commit()
+        return [filename for _, filename in stale]
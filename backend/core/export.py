@@ -1,13 +1,28 @@
 import asyncio
+import hashlib
+import io
 import logging
 import os
 import re
-import subprocess
-import json
-from typing import List, Dict, Optional, Callable
+import time
+from contextlib import contextmanager
+from fractions import Fraction
+from functools import lru_cache
+from typing import List, Dict, Iterator, Optional, Callable, TextIO
+
+from core.process import FFMPEG_STALL_SECONDS, FFMPEG_TIMEOUT_SECONDS, run_process, run_process_sync
 
 logger = logging.getLogger(__name__)
 
+# Total ffmpeg threads shared by all concurrent encodes
+FFMPEG_THREAD_BUDGET = int(os.environ.get("FFMPEG_THREAD_BUDGET", os.cpu_count() or 2))
+
+X264_PRESET = "fast"
+X264_CRF = "23"
+
+# encode id -> {"threads": int, "started_at": float}
+_thread_allocations: Dict[str, dict] = {}
+
 
 def _escape_ffmpeg_filter_path(path: str) -> str:
     """Escape a path for use inside FFmpeg filter option values (single-quoted)."""
@@ -36,32 +51,42 @@ def format_timestamp(seconds: float) -> str:
         secs += 1
     return f"{hours}:{minutes:02d}:{secs:02d}.{centisecs:02d}"
 
-def generate_ass_content(subtitles: List[Dict], styles: Dict, video_width: int, video_height: int) -> str:
-    """
-    Generates Advanced Substation Alpha (ASS) content.
-    Supports pixel-perfect positioning, custom fonts, and styling.
-    """
-    font_name = styles.get("fontFamily", "Arial")
-    font_size = styles.get("fontSize", 24)
-    text_color = styles.get("textColor", "#FFFFFF").lstrip('#')
-    # ASS uses BGR hex format: &Hbbggrr&
-    bgr_color = f"&H{text_color[4:6]}{text_color[2:4]}{text_color[0:2]}&"
+# Karaoke encodings besides the default per-word events ("word"): a single
+# event per subtitle with \k (instant) or \kf (sweeping) timing tags
+KARAOKE_TAG_MODES = ("k", "kf")
 
-    # Outline color (hex RGB -> BGR)
-    outline_hex = styles.get("outlineColor", "#000000").lstrip('#')
-    bgr_outline_color = f"&H{outline_hex[4:6]}{outline_hex[2:4]}{outline_hex[0:2]}&"
 
-    outline_width = styles.get("outlineWidth", 2.0)
-    shadow_depth = styles.get("shadowDepth", 2.0)
-    bold_val = -1 if styles.get("bold", True) else 0
+def _bgr(hex_color: str) -> str:
+    """Hex RGB ("#RRGGBB") to the ASS &Hbbggrr& colour format."""
+    rgb = hex_color.lstrip('#')
+    return f"&H{rgb[4:6]}{rgb[2:4]}{rgb[0:2]}&"
 
-    # Calculate position (pixel offset from center)
-    pos_x = int(video_width / 2 + styles["position"]["x"])
-    pos_y = int(video_height / 2 - styles["position"]["y"])
 
-    uppercase = styles.get("uppercase", False)
-
-    ass_header = f"""[Script Info]
+@lru_cache(maxsize=64)
+def _ass_header(
+    font_name: str,
+    font_size: int,
+    bgr_color: str,
+    bgr_outline_color: str,
+    outline_width: float,
+    shadow_depth: float,
+    bold_val: int,
+    video_width: int,
+    video_height: int,
+    bgr_highlight: Optional[str] = None,
+) -> str:
+    """
+    Script info and style sections; cached per (styles, resolution). With
+    bgr_highlight a Karaoke style is added for \\k-tagged events: libass
+    shows SecondaryColour until a syllable's time and PrimaryColour after.
+    """
+    karaoke_style = ""
+    if bgr_highlight:
+        karaoke_style = (
+            f"Style: Karaoke,{font_name},{font_size},{bgr_highlight},{bgr_color},{bgr_outline_color},&H80000000,"
+            f"{bold_val},0,0,0,100,100,0,0,1,{outline_width},{shadow_depth},2,10,10,10,1\n"
+        )
+    return f"""[Script Info]
 ScriptType: v4.00+
 PlayResX: {video_width}
 PlayResY: {video_height}
@@ -70,98 +95,448 @@ ScaledBorderAndShadow: yes
 [V4+ Styles]
 Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
 Style: Default,{font_name},{font_size},{bgr_color},&H000000FF,{bgr_outline_color},&H80000000,{bold_val},0,0,0,100,100,0,0,1,{outline_width},{shadow_depth},2,10,10,10,1
-
+{karaoke_style}
 [Events]
 Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
 """
 
+
+def _karaoke_tagged_text(sub: Dict, word_texts: List[str], tag: str) -> str:
+    """
+    One line of text with a \\k/\\kf duration (centiseconds) before each word.
+    Durations come from absolute offsets so rounding never accumulates.
+    """
+    words = sub["words"]
+
+    def offset(t: float) -> int:
+        return max(0, int(round((t - sub["start"]) * 100)))
+
+    parts = []
+    lead = offset(words[0]["start"])
+    if lead:
+        parts.append(f"{{\\{tag}{lead}}}")
+    for wi, word in enumerate(words):
+        until = words[wi + 1]["start"] if wi < len(words) - 1 else word["end"]
+        duration = max(0, offset(until) - offset(word["start"]))
+        separator = " " if wi < len(words) - 1 else ""
+        parts.append(f"{{\\{tag}{duration}}}{word_texts[wi]}{separator}")
+    return "".join(parts)
+
+
+def _iter_ass_events(subtitles: List[Dict], styles: Dict, video_width: int, video_height: int) -> Iterator[str]:
+    """Yield Dialogue lines one at a time."""
+    bgr_color = _bgr(styles.get("textColor", "#FFFFFF"))
+
+    # Calculate position (pixel offset from center)
+    pos_x = int(video_width / 2 + styles["position"]["x"])
+    pos_y = int(video_height / 2 - styles["position"]["y"])
+    override = f"{{\\an5\\pos({pos_x},{pos_y})}}"
+
+    def dialogue(start: float, end: float, text: str, style: str = "Default") -> str:
+        return f"Dialogue: 0,{format_timestamp(start)},{format_timestamp(end)},{style},,0,0,0,,{override}{text}"
+
+    uppercase = styles.get("uppercase", False)
     karaoke_enabled = styles.get("karaokeEnabled", False)
-    highlight_hex = styles.get("highlightColor", "#FFFF00").lstrip('#')
-    bgr_highlight = f"&H{highlight_hex[4:6]}{highlight_hex[2:4]}{highlight_hex[0:2]}&"
+    karaoke_mode = styles.get("karaokeMode", "word")
+    bgr_highlight = _bgr(styles.get("highlightColor", "#FFFF00"))
+    highlight_open = f"{{\\c{bgr_highlight}}}"
+    highlight_close = f"{{\\c{bgr_color}}}"
 
-    events = []
     for sub in subtitles:
         words = sub.get("words", [])
 
-        if karaoke_enabled and words:
+        if karaoke_enabled and words and karaoke_mode in KARAOKE_TAG_MODES:
+            # One event per subtitle; libass advances the highlight itself
+            word_texts = [_escape_ass_text(w["word"].upper() if uppercase else w["word"]) for w in words]
+            text = _karaoke_tagged_text(sub, word_texts, karaoke_mode)
+            yield dialogue(sub["start"], sub["end"], text, style="Karaoke")
+        elif karaoke_enabled and words:
             MIN_HL = 0.2  # 200ms minimum highlight duration
             # Generate per-word dialogue lines: each line shows full subtitle text
             # but only the current word is highlighted
             word_texts = [_escape_ass_text(w["word"].upper() if uppercase else w["word"]) for w in words]
             full_text = " ".join(word_texts)
+            # Offset of each word in full_text: the text around word i is a slice,
+            # so every line is built in time proportional to its own length
+            offsets = []
+            offset = 0
+            for wt in word_texts:
+                offsets.append(offset)
+                offset += len(wt) + 1
 
             for wi, word in enumerate(words):
                 next_start = words[wi + 1]["start"] if wi < len(words) - 1 else sub["end"]
                 effective_end = min(max(word["end"], word["start"] + MIN_HL), next_start)
 
-                w_start = format_timestamp(word["start"])
-                w_end = format_timestamp(effective_end)
-
                 # Build text with inline color overrides
-                parts = []
-                for j, wt in enumerate(word_texts):
-                    if j == wi:
-                        parts.append(f"{{\\c{bgr_highlight}}}{wt}{{\\c{bgr_color}}}")
-                    else:
-                        parts.append(wt)
-                colored_text = " ".join(parts)
-
-                line = f"Dialogue: 0,{w_start},{w_end},Default,,0,0,0,,{{\\an5\\pos({pos_x},{pos_y})}}{colored_text}"
-                events.append(line)
+                word_start = offsets[wi]
+                word_end = word_start + len(word_texts[wi])
+                colored_text = (
+                    full_text[:word_start] + highlight_open + word_texts[wi] + highlight_close + full_text[word_end:]
+                )
+                yield dialogue(word["start"], effective_end, colored_text)
 
                 # Fill gaps between words with no-highlight version
                 if wi < len(words) - 1:
                     gap_start = effective_end
                     gap_end = words[wi + 1]["start"]
                     if gap_end > gap_start + 0.01:
-                        gs = format_timestamp(gap_start)
-                        ge = format_timestamp(gap_end)
-                        line = f"Dialogue: 0,{gs},{ge},Default,,0,0,0,,{{\\an5\\pos({pos_x},{pos_y})}}{full_text}"
-                        events.append(line)
+                        yield dialogue(gap_start, gap_end, full_text)
         else:
-            start = format_timestamp(sub["start"])
-            end = format_timestamp(sub["end"])
             text = _escape_ass_text(sub["text"].upper() if uppercase else sub["text"])
-            line = f"Dialogue: 0,{start},{end},Default,,0,0,0,,{{\\an5\\pos({pos_x},{pos_y})}}{text}"
-            events.append(line)
+            yield dialogue(sub["start"], sub["end"], text)
 
-    return ass_header + "\n".join(events)
 
-def burn_subtitles(input_path: str, output_path: str, ass_path: str, fontsdir: str = None):
+def write_ass(out: TextIO, subtitles: List[Dict], styles: Dict, video_width: int, video_height: int) -> str:
     """
-    Uses FFmpeg to burn subtitles into the video (synchronous version).
+    Stream an Advanced Substation Alpha (ASS) document to out, event by
+    event, and return the SHA-256 hex digest of what was written (so
+    callers can key caches without holding the document in memory).
     """
-    abs_ass_path = os.path.abspath(ass_path)
-    escaped_path = _escape_ffmpeg_filter_path(abs_ass_path)
+    header = _ass_header(
+        styles.get("fontFamily", "Arial"),
+        styles.get("fontSize", 24),
+        _bgr(styles.get("textColor", "#FFFFFF")),
+        _bgr(styles.get("outlineColor", "#000000")),
+        styles.get("outlineWidth", 2.0),
+        styles.get("shadowDepth", 2.0),
+        -1 if styles.get("bold", True) else 0,
+        video_width,
+        video_height,
+        _bgr(styles.get("highlightColor", "#FFFF00"))
+        if styles.get("karaokeEnabled", False) and styles.get("karaokeMode", "word") in KARAOKE_TAG_MODES
+        else None,
+    )
+    digest = hashlib.sha256()
+
+    def emit(chunk: str):
+        out.write(chunk)
+        digest.update(chunk.encode("utf-8"))
 
-    vf_filter = f"subtitles='{escaped_path}'"
+    emit(header)
+    for index, line in enumerate(_iter_ass_events(subtitles, styles, video_width, video_height)):
+        emit(line if index == 0 else "\n" + line)
+    return digest.hexdigest()
+
+
+def generate_ass_content(subtitles: List[Dict], styles: Dict, video_width: int, video_height: int) -> str:
+    """
+    Generates Advanced Substation Alpha (ASS) content.
+    Supports pixel-perfect positioning, custom fonts, and styling.
+    """
+    buffer = io.StringIO()
+    write_ass(buffer, subtitles, styles, video_width, video_height)
+    return buffer.getvalue()
+
+# ---------------------------------------------------------------------------
+# Render cache keys
+# ---------------------------------------------------------------------------
+# (path, size, mtime_ns) -> sha256 of a font file
+_font_digests: Dict[tuple, str] = {}
+
+
+def font_digest(path: str) -> str:
+    """SHA-256 of a font file, memoized by path, size and mtime."""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    if key not in _font_digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        _font_digests[key] = digest.hexdigest()
+    return _font_digests[key]
+
+
+def encoder_fingerprint(mode: str = "burn", container: str = "mp4") -> str:
+    """Settings that change the bytes of an export: x264 params, or the mux target."""
+    if mode == "soft":
+        return f"mux|{container}"
+    return f"libx264|{X264_PRESET}|{X264_CRF}"
+
+
+def render_cache_key(source_hash: str, ass_hash: str, font_digests: List[str], encoder: str) -> str:
+    """Cache key for an export: source content + exact ASS (its write_ass digest) + fonts used + encoder settings."""
+    parts = [source_hash, ass_hash, *sorted(font_digests), encoder]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Thread budget
+# ---------------------------------------------------------------------------
+@contextmanager
+def thread_budget(job_id: str, expected_jobs: int = 1):
+    """
+    Reserve a share of FFMPEG_THREAD_BUDGET for one encode and yield its
+    thread count. The budget is split evenly between the encodes already
+    running, this one, and any the caller expects to start alongside it
+    (expected_jobs), so a lone export gets every core while a busy box
+    runs each encode on its own slice instead of oversubscribing.
+    """
+    slots = max(len(_thread_allocations) + 1, expected_jobs, 1)
+    threads = max(1, FFMPEG_THREAD_BUDGET // slots)
+    _thread_allocations[job_id] = {"threads": threads, "started_at": time.time()}
+    logger.info(
+        "Thread budget: encode %s gets %d thread(s) (%d active encode(s), budget %d)",
+        job_id, threads, len(_thread_allocations), FFMPEG_THREAD_BUDGET,
+    )
+    try:
+        yield threads
+    finally:
+        _thread_allocations.pop(job_id, None)
+
+
+def thread_budget_stats() -> Dict:
+    """Current allocations, for logs and the export stats endpoint."""
+    now = time.time()
+    return {
+        "budget": FFMPEG_THREAD_BUDGET,
+        "allocated": sum(a["threads"] for a in _thread_allocations.values()),
+        "encodes": {
+            job_id: {"threads": a["threads"], "running_seconds": round(now - a["started_at"], 1)}
+            for job_id, a in _thread_allocations.items()
+        },
+    }
+
+
+def _subtitles_filter(ass_path: str, fontsdir: Optional[str] = None) -> str:
+    escaped_path = _escape_ffmpeg_filter_path(os.path.abspath(ass_path))
     if fontsdir:
         escaped_fontsdir = _escape_ffmpeg_filter_path(fontsdir)
-        vf_filter = f"subtitles='{escaped_path}':fontsdir='{escaped_fontsdir}'"
+        return f"subtitles='{escaped_path}':fontsdir='{escaped_fontsdir}'"
+    return f"subtitles='{escaped_path}'"
 
-    command = [
-        "ffmpeg", "-y",
+
+def _burn_command(
+    input_path: str,
+    output_path: str,
+    ass_path: str,
+    fontsdir: Optional[str] = None,
+    threads: Optional[int] = None,
+    progress: bool = False,
+    time_range: Optional[tuple] = None,
+    audio: bool = True,
+    video_args: Optional[List[str]] = None,
+) -> List[str]:
+    """
+    Build the libx264 subtitle burn command. With threads set, x264 gets the
+    full allocation; decoding and the (single-threaded) libass filter cost a
+    fraction of the encode, so they get half. time_range=(start, end) seeks
+    the input and renders only that range; audio=False drops the audio.
+    video_args are extra encoder options (e.g. profile and pix_fmt).
+    """
+    command = ["ffmpeg", "-y"]
+    if threads:
+        side_threads = max(1, threads // 2)
+        command += ["-filter_threads", str(side_threads), "-threads", str(side_threads)]
+    if time_range:
+        start, end = time_range
+        command += ["-ss", f"{start:.6f}", "-t", f"{end - start:.6f}"]
+    command += [
         "-i", input_path,
-        "-vf", vf_filter,
+        "-vf", _subtitles_filter(ass_path, fontsdir),
         "-c:v", "libx264",
-        "-c:a", "copy",
-        "-preset", "fast",
-        "-crf", "23",
-        output_path
     ]
+    if threads:
+        command += ["-threads", str(threads)]
+    command += video_args or []
+    command += ["-c:a", "copy"] if audio else ["-an"]
+    command += [
+        "-preset", X264_PRESET,
+        "-crf", X264_CRF,
+    ]
+    if progress:
+        command += ["-progress", "pipe:1"]
+    command.append(output_path)
+    return command
+
+
+def burn_subtitles(input_path: str, output_path: str, ass_path: str, fontsdir: str = None, threads: Optional[int] = None):
+    """
+    Uses FFmpeg to burn subtitles into the video (synchronous version).
+    """
+    command = _burn_command(input_path, output_path, ass_path, fontsdir, threads)
 
     logger.info("Running FFmpeg: %s", " ".join(command))
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    stdout, stderr = process.communicate()
+    # ffmpeg redraws its stats line on stderr while encoding, so silence there means a stall
+    returncode, _, stderr = run_process_sync(command, timeout=FFMPEG_TIMEOUT_SECONDS, stall_timeout=FFMPEG_STALL_SECONDS)
 
-    if process.returncode != 0:
-        logger.error("FFmpeg failed (rc=%d): %s", process.returncode, stderr)
-        raise Exception(f"FFmpeg failed with return code {process.returncode}: {stderr[-500:] if stderr else 'no stderr'}")
+    if returncode != 0:
+        logger.error("FFmpeg failed (rc=%d): %s", returncode, stderr)
+        raise Exception(f"FFmpeg failed with return code {returncode}: {stderr[-500:] if stderr else 'no stderr'}")
 
     logger.info("FFmpeg completed successfully: %s", output_path)
     return output_path
 
 
+# ---------------------------------------------------------------------------
+# Encode telemetry
+# ---------------------------------------------------------------------------
+# Minimum seconds between progress messages for one export (0 = every ffmpeg update)
+EXPORT_PROGRESS_INTERVAL = float(os.environ.get("EXPORT_PROGRESS_INTERVAL", 0.5))
+ETA_SMOOTHING = 0.3
+
+_PROGRESS_NUMBER = re.compile(r"\s*(-?\d+(?:\.\d+)?)")
+
+
+def _progress_number(value: Optional[str]) -> Optional[float]:
+    """Numeric part of an ffmpeg -progress value ("1234.5kbits/s", "1.5x", "N/A")."""
+    match = _PROGRESS_NUMBER.match(value or "")
+    return float(match.group(1)) if match else None
+
+
+def parse_progress_block(fields: Dict[str, str]) -> Dict:
+    """
+    Stats from one -progress block (the key=value lines up to progress=).
+    Unknown or "N/A" values are None.
+    """
+    # out_time_ms is in microseconds too (a long-standing ffmpeg quirk)
+    out_time = _progress_number(fields.get("out_time_us") or fields.get("out_time_ms"))
+    frame = _progress_number(fields.get("frame"))
+    total_size = _progress_number(fields.get("total_size"))
+    return {
+        "out_time": out_time / 1_000_000 if out_time is not None and out_time >= 0 else None,
+        "frame": int(frame) if frame is not None else None,
+        "fps": _progress_number(fields.get("fps")),
+        "bitrate_kbps": _progress_number(fields.get("bitrate")),
+        "total_size": int(total_size) if total_size is not None else None,
+        "speed": _progress_number(fields.get("speed")),
+    }
+
+
+def _log_fields(fields: Dict) -> str:
+    return " ".join(f"{key}={value}" for key, value in fields.items() if value is not None)
+
+
+class EncodeProgress:
+    """
+    Turns ffmpeg -progress stats from one or more concurrent processes (the
+    parts of a segmented render) into progress_callback(percent, telemetry)
+    calls, at most one per EXPORT_PROGRESS_INTERVAL, with an ETA smoothed
+    over the observed encode rate.
+
+    Stream-copied parts (smart render) count towards the percentage only:
+    their stats and near-instant progress would inflate fps, speed and the
+    rate, so copy_duration seconds are left out of the ETA instead.
+    """
+
+    def __init__(
+        self,
+        duration: float,
+        progress_callback: Optional[Callable] = None,
+        label: str = "encode",
+        copy_duration: float = 0.0,
+    ):
+        self.duration = duration
+        self.progress_callback = progress_callback
+        self.label = label
+        self.copy_duration = copy_duration
+        self.started_at = time.monotonic()
+        self._encoded: Dict[int, float] = {}
+        self._copied: Dict[int, float] = {}
+        self._stats: Dict[int, Dict] = {}
+        self._last_report: Optional[float] = None  # monotonic time
+        self._rate_sample: Optional[tuple] = None  # (monotonic time, encoded seconds)
+        self._rate: Optional[float] = None  # media seconds encoded per wall second
+
+    def on_time(self, source: int = 0, limit: Optional[float] = None, copy: bool = False) -> Callable:
+        """
+        An on_time callback for _run_ffmpeg; source tells concurrent processes
+        apart and copy marks a stream-copy process.
+        """
+        async def update(seconds: float, stats: Optional[Dict] = None):
+            await self.update(min(seconds, limit) if limit is not None else seconds, stats, source, copy)
+        return update
+
+    def _total(self, key: str):
+        values = [stats[key] for stats in self._stats.values() if stats.get(key) is not None]
+        return sum(values) if values else None
+
+    def telemetry(self) -> Dict:
+        encoded = sum(self._encoded.values())
+        total_size = self._total("total_size")
+        fps, speed = self._total("fps"), self._total("speed")
+        eta = None
+        if self._rate and self.duration > 0:
+            eta = round(max(0.0, self.duration - self.copy_duration - encoded) / self._rate, 1)
+        return {
+            "frame": self._total("frame"),
+            "fps": round(fps, 1) if fps is not None else None,
+            "speed": round(speed, 2) if speed is not None else None,
+            # Derived from the size so that concurrent parts add up correctly
+            "bitrate_kbps": round(total_size * 8 / 1000 / encoded, 1) if total_size and encoded > 0 else self._total("bitrate_kbps"),
+            "total_size": total_size,
+            "encoded_seconds": round(encoded, 2),
+            "copied_seconds": round(sum(self._copied.values()), 2),
+            "elapsed_seconds": round(time.monotonic() - self.started_at, 1),
+            "eta_seconds": eta,
+        }
+
+    async def update(self, encoded_seconds: float, stats: Optional[Dict] = None, source: int = 0, copy: bool = False):
+        if copy:
+            self._copied[source] = encoded_seconds
+        else:
+            self._encoded[source] = encoded_seconds
+            if stats:
+                self._stats[source] = stats
+        now = time.monotonic()
+        if self._last_report is not None and now - self._last_report < EXPORT_PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+
+        encoded = sum(self._encoded.values())
+        if not copy:
+            if self._rate_sample is not None and now > self._rate_sample[0]:
+                instant = (encoded - self._rate_sample[1]) / (now - self._rate_sample[0])
+                self._rate = instant if self._rate is None else self._rate + ETA_SMOOTHING * (instant - self._rate)
+            elif self._rate is None:
+                # Nothing measured yet: start from ffmpeg's own speed estimate
+                self._rate = self._total("speed") or None
+            self._rate_sample = (now, encoded)
+
+        telemetry = self.telemetry()
+        done = encoded + sum(self._copied.values())
+        percent = min(int(done / self.duration * 100), 99) if self.duration > 0 else 0
+        logger.debug("Encode progress %s: percent=%d %s", self.label, percent, _log_fields(telemetry))
+        if self.duration > 0 and self.progress_callback:
+            await self.progress_callback(percent, telemetry)
+
+    async def finish(self):
+        telemetry = {**self.telemetry(), "eta_seconds": 0.0}
+        logger.info("Encode finished %s: %s", self.label, _log_fields(telemetry))
+        if self.progress_callback:
+            await self.progress_callback(100, telemetry)
+
+
+async def _run_ffmpeg(command: List[str], on_time: Optional[Callable] = None):
+    """
+    Run an ffmpeg command that writes -progress to stdout under the process
+    supervisor, awaiting on_time(seconds_encoded, stats) at the end of each
+    progress block (see parse_progress_block). Since -progress reports
+    every half second, a silent stdout means a stalled encode.
+    """
+    block: Dict[str, str] = {}
+
+    async def on_line(line: str):
+        nonlocal block
+        key, sep, value = line.partition("=")
+        if not sep:
+            return
+        block[key] = value
+        if key == "progress":
+            stats = parse_progress_block(block)
+            block = {}
+            if on_time and stats["out_time"] is not None:
+                await on_time(stats["out_time"], stats)
+
+    returncode, _, stderr_text = await run_process(
+        command, on_line, timeout=FFMPEG_TIMEOUT_SECONDS, stall_timeout=FFMPEG_STALL_SECONDS,
+    )
+    if returncode != 0:
+        logger.error("FFmpeg failed (rc=%d): %s", returncode, stderr_text)
+        raise Exception(f"FFmpeg failed with return code {returncode}: {stderr_text[-500:]}")
+
+
 async def burn_subtitles_async(
     input_path: str,
     output_path: str,
@@ -169,105 +544,675 @@ async def burn_subtitles_async(
     duration: float,
     progress_callback: Optional[Callable] = None,
     fontsdir: str = None,
+    threads: Optional[int] = None,
 ):
     """
     Uses FFmpeg to burn subtitles into the video (async version with progress).
-    Parses FFmpeg stderr to report encoding progress.
+    Parses FFmpeg stderr to report encoding progress. threads limits the
+    encode to an allocation from thread_budget().
     """
-    abs_ass_path = os.path.abspath(ass_path)
-    escaped_path = _escape_ffmpeg_filter_path(abs_ass_path)
+    command = _burn_command(input_path, output_path, ass_path, fontsdir, threads, progress=True)
+    progress = EncodeProgress(duration, progress_callback, label=os.path.basename(output_path))
+
+    logger.info("Running async FFmpeg: %s", " ".join(command))
+    await _run_ffmpeg(command, progress.on_time())
+    await progress.finish()
+
+    logger.info("Async FFmpeg completed successfully: %s", output_path)
+    return output_path
+
+
+# ---------------------------------------------------------------------------
+# Multi-output: one decode feeding several scaled/cropped encodes
+# ---------------------------------------------------------------------------
+def target_scale(src_width: int, src_height: int, width: int, height: int, fit: str = "crop") -> float:
+    """Source-to-target scale factor: cover the frame for "crop", fit inside it for "pad"."""
+    if fit == "pad":
+        return min(width / src_width, height / src_height)
+    return max(width / src_width, height / src_height)
+
+
+def scale_styles_for_target(styles: Dict, src_width: int, src_height: int, width: int, height: int, fit: str = "crop") -> Dict:
+    """
+    Styles for rendering at a target resolution: the position offset from
+    centre, font size, outline and shadow scale with the picture. The
+    position is the caption's centre, so it is clamped to stay half a line
+    (plus outline) inside the frame: a crop can't push the caption off-screen.
+    """
+    scale = target_scale(src_width, src_height, width, height, fit)
+    position = styles["position"]
+    font_size = max(1, int(round(styles.get("fontSize", 24) * scale)))
+    outline = round(styles.get("outlineWidth", 2.0) * scale, 2)
+    margin = font_size / 2 + outline
+    x_limit = max(0.0, width / 2 - margin)
+    y_limit = max(0.0, height / 2 - margin)
+    x = max(-x_limit, min(x_limit, position["x"] * scale))
+    y = max(-y_limit, min(y_limit, position["y"] * scale))
+    return {
+        **styles,
+        "position": {"x": x, "y": y},
+        "fontSize": font_size,
+        "outlineWidth": outline,
+        "shadowDepth": round(styles.get("shadowDepth", 2.0) * scale, 2),
+    }
+
+
+def _target_filter(width: int, height: int, fit: str) -> str:
+    if fit == "pad":
+        return (
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1"
+        )
+    return f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},setsar=1"
+
+
+def _multi_output_command(
+    input_path: str,
+    outputs: List[Dict],
+    fontsdir: Optional[str] = None,
+    threads: Optional[int] = None,
+) -> List[str]:
+    """
+    One ffmpeg invocation: decode once, split, then scale/crop (or pad),
+    burn that output's ASS and encode each branch. outputs items have
+    path, ass_path, width, height, fit and optional video_bitrate (kbps).
+    """
+    labels = [f"v{i}" for i in range(len(outputs))]
+    graph = [f"[0:v]split={len(outputs)}" + "".join(f"[s{i}]" for i in range(len(outputs)))]
+    for i, out in enumerate(outputs):
+        graph.append(
+            f"[s{i}]{_target_filter(out['width'], out['height'], out.get('fit', 'crop'))},"
+            f"{_subtitles_filter(out['ass_path'], fontsdir)}[{labels[i]}]"
+        )
+
+    command = ["ffmpeg", "-y"]
+    if threads:
+        command += ["-filter_threads", str(threads)]
+    command += ["-i", input_path, "-filter_complex", ";".join(graph)]
+    encoder_threads = max(1, threads // len(outputs)) if threads else None
+    for label, out in zip(labels, outputs):
+        command += ["-map", f"[{label}]", "-map", "0:a:0?", "-c:v", "libx264", "-preset", X264_PRESET]
+        if out.get("video_bitrate"):
+            kbps = int(out["video_bitrate"])
+            command += ["-b:v", f"{kbps}k", "-maxrate", f"{kbps}k", "-bufsize", f"{kbps * 2}k"]
+        else:
+            command += ["-crf", X264_CRF]
+        if encoder_threads:
+            command += ["-threads", str(encoder_threads)]
+        command += ["-c:a", "copy", "-movflags", "+faststart", out["path"]]
+    # Global option: may appear anywhere, applies to the whole run
+    command[2:2] = ["-progress", "pipe:1"]
+    return command
+
+
+async def burn_subtitles_multi(
+    input_path: str,
+    outputs: List[Dict],
+    duration: float,
+    progress_callback: Optional[Callable] = None,
+    fontsdir: str = None,
+    threads: Optional[int] = None,
+):
+    """Render several resolutions from a single decode of the source."""
+    command = _multi_output_command(input_path, outputs, fontsdir, threads)
+    progress = EncodeProgress(duration, progress_callback, label=os.path.basename(outputs[0]["path"]))
+
+    logger.info("Running multi-output FFmpeg (%d outputs): %s", len(outputs), " ".join(command))
+    await _run_ffmpeg(command, progress.on_time())
+    await progress.finish()
+
+    logger.info("Multi-output FFmpeg completed successfully: %s", ", ".join(o["path"] for o in outputs))
+    return [o["path"] for o in outputs]
+
+
+# ---------------------------------------------------------------------------
+# Soft subtitles: mux a caption track, no re-encode
+# ---------------------------------------------------------------------------
+# Attached font MIME types for Matroska
+_FONT_MIMETYPES = {
+    ".ttf": "application/x-truetype-font",
+    ".ttc": "application/x-truetype-font",
+    ".otf": "application/vnd.ms-opentype",
+}
 
-    vf_filter = f"subtitles='{escaped_path}'"
-    if fontsdir:
-        escaped_fontsdir = _escape_ffmpeg_filter_path(fontsdir)
-        vf_filter = f"subtitles='{escaped_path}':fontsdir='{escaped_fontsdir}'"
 
+def _mux_command(input_path: str, output_path: str, ass_path: str, font_path: Optional[str] = None) -> List[str]:
+    """
+    Stream-copy video and audio and add the subtitles as a track: styled
+    ASS (with the font attached) for .mkv, plain mov_text for .mp4.
+    """
     command = [
         "ffmpeg", "-y",
         "-i", input_path,
-        "-vf", vf_filter,
-        "-c:v", "libx264",
-        "-c:a", "copy",
-        "-preset", "fast",
-        "-crf", "23",
-        "-progress", "pipe:1",
-        output_path
+        "-i", ass_path,
+        "-map", "0:v:0", "-map", "0:a:0?", "-map", "1:0",
+        "-c:v", "copy", "-c:a", "copy",
     ]
+    if output_path.lower().endswith(".mkv"):
+        command += ["-c:s", "ass"]
+        ext = os.path.splitext(font_path or "")[1].lower()
+        if font_path and ext in _FONT_MIMETYPES:
+            command += ["-attach", font_path, "-metadata:s:t", f"mimetype={_FONT_MIMETYPES[ext]}"]
+    else:
+        command += ["-c:s", "mov_text", "-movflags", "+faststart"]
+    command += ["-disposition:s:0", "default", "-progress", "pipe:1", output_path]
+    return command
+
+
+async def mux_subtitles(
+    input_path: str,
+    output_path: str,
+    ass_path: str,
+    duration: float,
+    progress_callback: Optional[Callable] = None,
+    font_path: Optional[str] = None,
+):
+    """
+    Add the subtitles as a soft track without re-encoding; runs in about
+    the time it takes to copy the file. The container follows output_path.
+    """
+    command = _mux_command(input_path, output_path, ass_path, font_path)
+    progress = EncodeProgress(duration, progress_callback, label=os.path.basename(output_path))
+
+    logger.info("Muxing subtitles: %s", " ".join(command))
+    await _run_ffmpeg(command, progress.on_time())
+    await progress.finish()
+
+    logger.info("Subtitle mux completed successfully: %s", output_path)
+    return output_path
 
-    logger.info("Running async FFmpeg: %s", " ".join(command))
-    process = await asyncio.create_subprocess_exec(
-        *command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
 
-    time_pattern = re.compile(r"out_time_ms=(\d+)")
+# ---------------------------------------------------------------------------
+# Segmented (keyframe-split) parallel render
+# ---------------------------------------------------------------------------
+EXPORT_SEGMENTED = os.environ.get("EXPORT_SEGMENTED", "1").strip().lower() not in ("0", "false", "no")
+# Shortest time range worth its own ffmpeg process
+SEGMENT_MIN_SECONDS = float(os.environ.get("EXPORT_SEGMENT_MIN_SECONDS", 10))
+# x264 threads per part; narrow parts scale better than one wide encode
+SEGMENT_THREADS = int(os.environ.get("EXPORT_SEGMENT_THREADS", 2))
+SEGMENT_MAX_PARTS = 16
 
-    while True:
-        line = await process.stdout.readline()
-        if not line:
+
+def _parse_ass_timestamp(value: str) -> float:
+    hours, minutes, seconds = value.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def segment_count(duration: float, threads: Optional[int] = None) -> int:
+    """How many parallel parts an encode of this length and thread grant should use."""
+    if not EXPORT_SEGMENTED or duration <= 0:
+        return 1
+    threads = threads or FFMPEG_THREAD_BUDGET
+    return max(1, min(threads // max(1, SEGMENT_THREADS), int(duration // SEGMENT_MIN_SECONDS), SEGMENT_MAX_PARTS))
+
+
+def plan_segments(duration: float, keyframes: List[float], parts: int) -> List[tuple]:
+    """
+    Split [0, duration) into up to `parts` (start, end) ranges whose
+    boundaries sit on keyframes nearest the even split points, so each part
+    can start with an exact input seek. Returns a single range when the
+    keyframe index is unavailable or too sparse.
+    """
+    if parts <= 1 or duration <= 0 or not keyframes:
+        return [(0.0, duration)]
+
+    boundaries = [0.0]
+    for i in range(1, parts):
+        target = duration * i / parts
+        candidates = [
+            k for k in keyframes
+            if k - boundaries[-1] >= SEGMENT_MIN_SECONDS / 2 and duration - k >= SEGMENT_MIN_SECONDS / 2
+        ]
+        if not candidates:
             break
-        decoded = line.decode("utf-8", errors="replace").strip()
+        nearest = min(candidates, key=lambda k: abs(k - target))
+        if nearest > boundaries[-1]:
+            boundaries.append(nearest)
+    boundaries.append(duration)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
 
-        match = time_pattern.search(decoded)
-        if match and duration > 0 and progress_callback:
-            current_ms = int(match.group(1))
-            current_seconds = current_ms / 1_000_000
-            progress = min(int((current_seconds / duration) * 100), 99)
-            await progress_callback(progress)
+_OVERRIDE_BLOCK = re.compile(r"\{[^}]*\}")
+_KARAOKE_TAG = re.compile(r"\\(kf|ko|k|K)(\d+)")
 
-    await process.wait()
 
-    if process.returncode != 0:
-        stderr_output = await process.stderr.read()
-        stderr_text = stderr_output.decode("utf-8", errors="replace")
-        logger.error("FFmpeg failed (rc=%d): %s", process.returncode, stderr_text)
-        raise Exception(f"FFmpeg failed with return code {process.returncode}: {stderr_text[-500:]}")
+def _advance_karaoke(text: str, seconds: float) -> str:
+    """
+    Consume `seconds` from the leading \\k durations of an event's text, for
+    events whose start is clipped: the tags count from the event start.
+    """
+    remaining = int(round(seconds * 100))
 
-    if progress_callback:
-        await progress_callback(100)
+    def shift_tag(match):
+        nonlocal remaining
+        duration = int(match.group(2))
+        used = min(duration, remaining)
+        remaining -= used
+        return f"\\{match.group(1)}{duration - used}"
 
-    logger.info("Async FFmpeg completed successfully: %s", output_path)
+    return _OVERRIDE_BLOCK.sub(lambda block: _KARAOKE_TAG.sub(shift_tag, block.group(0)), text)
+
+
+def shift_ass_events(ass_content: str, start: float, end: float) -> str:
+    """
+    Keep the Dialogue events overlapping [start, end), clipped to the range
+    and shifted so the range starts at 0 (a part's own timeline).
+    """
+    lines = []
+    for line in ass_content.split("\n"):
+        if not line.startswith("Dialogue: "):
+            lines.append(line)
+            continue
+        fields = line.split(",", 9)
+        ev_start = _parse_ass_timestamp(fields[1])
+        ev_end = _parse_ass_timestamp(fields[2])
+        if ev_end <= start or ev_start >= end:
+            continue
+        if ev_start < start and "\\k" in fields[9]:
+            fields[9] = _advance_karaoke(fields[9], start - ev_start)
+        fields[1] = format_timestamp(max(ev_start, start) - start)
+        fields[2] = format_timestamp(min(ev_end, end) - start)
+        lines.append(",".join(fields))
+    return "\n".join(lines)
+
+
+async def _render_parts(
+    input_path: str,
+    output_path: str,
+    ass_content: str,
+    parts: List[tuple],
+    duration: float,
+    progress_callback: Optional[Callable] = None,
+    fontsdir: str = None,
+    threads: Optional[int] = None,
+    video_args: Optional[List[str]] = None,
+    mux_args: Optional[List[str]] = None,
+):
+    """
+    Produce each (start, end, reencode) part in its own ffmpeg process (a
+    subtitle burn with a time-shifted ASS, or a video stream copy), then
+    join them with the concat demuxer while copying the source audio once.
+    Parts are MPEG-TS so parameter sets travel in-band across the joins.
+    Progress and stats of all parts are summed into progress_callback.
+    mux_args are extra options for the joined output.
+    """
+    encoded_parts = sum(1 for _, _, reencode in parts if reencode)
+    part_threads = max(1, (threads or FFMPEG_THREAD_BUDGET) // max(1, encoded_parts))
+    stem, _ = os.path.splitext(output_path)
+    part_paths = [f"{stem}.part{i}.ts" for i in range(len(parts))]
+    part_ass_paths = [f"{stem}.part{i}.ass" for i in range(len(parts))]
+    list_path = f"{stem}.parts.txt"
+    copy_duration = sum(end - start for start, end, reencode in parts if not reencode)
+    progress = EncodeProgress(duration, progress_callback, os.path.basename(output_path), copy_duration)
+
+    async def render_part(index: int, start: float, end: float, reencode: bool):
+        if reencode:
+            with open(part_ass_paths[index], "w", encoding="utf-8") as f:
+                f.write(shift_ass_events(ass_content, start, end))
+            # Input seek lands exactly on the keyframe; audio is added at concat time
+            command = _burn_command(
+                input_path, part_paths[index], part_ass_paths[index], fontsdir, part_threads,
+                progress=True, time_range=(start, end), audio=False, video_args=video_args,
+            )
+        else:
+            command = [
+                "ffmpeg", "-y",
+                "-ss", f"{start:.6f}", "-t", f"{end - start:.6f}",
+                "-i", input_path,
+                "-map", "0:v:0", "-c:v", "copy", "-an",
+                "-progress", "pipe:1",
+                part_paths[index],
+            ]
+
+        await _run_ffmpeg(command, progress.on_time(index, limit=end - start, copy=not reencode))
+
+    logger.info(
+        "Rendering %s in %d part(s): %d re-encoded with %d thread(s) each, %d stream-copied",
+        input_path, len(parts), encoded_parts, part_threads, len(parts) - encoded_parts,
+    )
+    tasks = [asyncio.ensure_future(render_part(i, *part)) for i, part in enumerate(parts)]
+    try:
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # One part failed: stop the others before their files are removed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in part_paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        command = [
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-i", input_path,
+            "-map", "0:v:0", "-map", "1:a:0?",
+            "-c", "copy",
+            *(mux_args or []),
+            "-movflags", "+faststart",
+            "-progress", "pipe:1",
+            output_path,
+        ]
+        logger.info("Joining %d part(s): %s", len(parts), " ".join(command))
+        await _run_ffmpeg(command)
+    finally:
+        for path in part_paths + part_ass_paths + [list_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    await progress.finish()
     return output_path
 
 
-def get_video_info(file_path: str) -> Dict:
-    """Retrieves video width, height, and duration using ffprobe."""
-    command = [
-        "ffprobe", "-v", "error",
-        "-select_streams", "v:0",
-        "-show_entries", "stream=width,height,duration",
-        "-show_entries", "format=duration",
-        "-of", "json",
-        file_path
-    ]
-    defaults = {"width": 1080, "height": 1920, "duration": 0}
+async def burn_subtitles_segmented(
+    input_path: str,
+    output_path: str,
+    ass_path: str,
+    segments: List[tuple],
+    duration: float,
+    progress_callback: Optional[Callable] = None,
+    fontsdir: str = None,
+    threads: Optional[int] = None,
+):
+    """
+    Render each (start, end) segment in its own ffmpeg process with a
+    time-shifted copy of the ASS file and join the results (see _render_parts).
+    """
+    with open(ass_path, "r", encoding="utf-8") as f:
+        ass_content = f.read()
+
+    parts = [(start, end, True) for start, end in segments]
+    await _render_parts(input_path, output_path, ass_content, parts, duration, progress_callback, fontsdir, threads)
+    logger.info("Segmented render completed successfully: %s", output_path)
+    return output_path
+
+
+# ---------------------------------------------------------------------------
+# Smart render: re-encode only the GOPs that carry subtitles
+# ---------------------------------------------------------------------------
+EXPORT_SMART_RENDER = os.environ.get("EXPORT_SMART_RENDER", "1").strip().lower() not in ("0", "false", "no")
+# Below this share of stream-copyable video the join overhead isn't worth it
+SMART_RENDER_MIN_COPY_FRACTION = float(os.environ.get("EXPORT_SMART_MIN_COPY_FRACTION", 0.15))
 
-    result = subprocess.run(command, capture_output=True, text=True)
-    if result.returncode != 0:
-        logger.warning("ffprobe failed for %s, using defaults", file_path)
-        return defaults
+# ffprobe profile name -> libx264 -profile:v
+_X264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+}
 
+
+def ass_event_ranges(ass_content: str) -> List[tuple]:
+    """(start, end) of every Dialogue event in an ASS document."""
+    ranges = []
+    for line in ass_content.split("\n"):
+        if line.startswith("Dialogue: "):
+            fields = line.split(",", 3)
+            ranges.append((_parse_ass_timestamp(fields[1]), _parse_ass_timestamp(fields[2])))
+    return ranges
+
+
+def _rational(value: Optional[str]) -> Optional[Fraction]:
+    """Parse an ffprobe "num/den" or "num:den" ratio; None when absent or zero."""
+    num, _, den = (value or "").replace(":", "/").partition("/")
     try:
-        data = json.loads(result.stdout)
-    except json.JSONDecodeError:
-        logger.warning("ffprobe returned invalid JSON for %s, using defaults", file_path)
-        return defaults
+        ratio = Fraction(int(num), int(den or 1))
+    except (ValueError, ZeroDivisionError):
+        return None
+    return ratio or None
 
-    if not data.get("streams"):
-        logger.warning("ffprobe returned no streams for %s, using defaults", file_path)
-        return defaults
 
-    stream = data["streams"][0]
+def smart_render_args(info: Dict) -> Optional[List[str]]:
+    """
+    Encoder options that make re-encoded GOPs splice cleanly into the
+    source's H.264 stream: same profile, level, pixel format, frame rate
+    and sample aspect ratio, so the SPS of a re-encoded part only differs
+    where x264 must. None if the source can't be spliced (other codecs,
+    10-bit/4:2:2, rotated, variable frame rate, unknown level or no IDR
+    index).
+    """
+    profile = _X264_PROFILES.get(info.get("profile") or "")
+    frame_rate = _rational(info.get("frame_rate"))
+    avg_frame_rate = _rational(info.get("avg_frame_rate"))
+    if (
+        not EXPORT_SMART_RENDER
+        or info.get("codec") != "h264"
+        or profile is None
+        or info.get("pix_fmt") not in ("yuv420p", "yuvj420p")
+        or info.get("rotation", 0) != 0
+        or not info.get("level")
+        or frame_rate is None
+        or avg_frame_rate is None
+        or abs(float(frame_rate - avg_frame_rate)) > 0.01
+        or len(info.get("idr_keyframes") or []) < 2
+    ):
+        return None
+    level = info["level"]
+    args = [
+        "-profile:v", profile,
+        "-level:v", f"{level // 10}.{level % 10}",
+        "-pix_fmt", info["pix_fmt"],
+        "-r", f"{frame_rate.numerator}/{frame_rate.denominator}",
+    ]
+    # x264-params splits on ":", so the SAR goes in x264's "num/den" form
+    sar = _rational(info.get("sample_aspect_ratio"))
+    if sar is not None:
+        args += ["-x264-params", f"sar={sar.numerator}/{sar.denominator}"]
+    return args
 
-    duration = 0
-    if "duration" in stream:
-        duration = float(stream["duration"])
-    elif "format" in data and "duration" in data["format"]:
-        duration = float(data["format"]["duration"])
 
-    return {
-        "width": stream.get("width", defaults["width"]),
-        "height": stream.get("height", defaults["height"]),
-        "duration": duration,
-    }
+def smart_mux_args(info: Dict) -> List[str]:
+    """
+    Output options for joining a smart render: tag the track avc3 so players
+    take the SPS/PPS carried in each part's keyframes instead of only the
+    sample description, and keep the source's track timescale.
+    """
+    args = ["-tag:v", "avc3"]
+    time_base = _rational(info.get("time_base"))
+    if time_base is not None and time_base.numerator == 1:
+        args += ["-video_track_timescale", str(time_base.denominator)]
+    return args
+
+
+def plan_smart_render(
+    duration: float,
+    keyframes: List[float],
+    events: List[tuple],
+    parts: int = 1,
+) -> Optional[List[tuple]]:
+    """
+    Classify each GOP (IDR keyframe to IDR keyframe) as re-encode if any subtitle
+    event overlaps it, else copy, and merge neighbours into (start, end,
+    reencode) runs. Re-encoded runs are cut at GOP boundaries into pieces
+    of about 1/parts of the re-encoded time so they render in parallel.
+    Returns None when too little can be copied to be worth it.
+    """
+    # The first keyframe may sit a few ms after 0 (edit lists); fold it into 0
+    bounds = sorted({k for k in keyframes if 0.05 < k < duration} | {0.0}) + [duration]
+    gops = [
+        (a, b, any(ev_start < b and ev_end > a for ev_start, ev_end in events))
+        for a, b in zip(bounds[:-1], bounds[1:])
+        if b > a
+    ]
+    copied = sum(b - a for a, b, reencode in gops if not reencode)
+    if duration <= 0 or copied / duration < SMART_RENDER_MIN_COPY_FRACTION:
+        return None
+
+    piece = (duration - copied) / max(1, parts)
+    runs = []
+    for a, b, reencode in gops:
+        if runs and runs[-1][2] == reencode and not (reencode and runs[-1][1] - runs[-1][0] >= piece):
+            runs[-1] = (runs[-1][0], b, reencode)
+        else:
+            runs.append((a, b, reencode))
+    return runs
+
+
+async def burn_subtitles_smart(
+    input_path: str,
+    output_path: str,
+    ass_path: str,
+    plan: List[tuple],
+    duration: float,
+    video_args: List[str],
+    progress_callback: Optional[Callable] = None,
+    fontsdir: str = None,
+    threads: Optional[int] = None,
+    mux_args: Optional[List[str]] = None,
+):
+    """
+    Burn subtitles into the GOPs that show them and stream-copy the rest,
+    following a plan from plan_smart_render().
+    """
+    with open(ass_path, "r", encoding="utf-8") as f:
+        ass_content = f.read()
+
+    await _render_parts(
+        input_path, output_path, ass_content, plan, duration, progress_callback, fontsdir, threads, video_args,
+        mux_args,
+    )
+    logger.info("Smart render completed successfully: %s", output_path)
+    return output_path
+
+
+async def render_subtitles(
+    input_path: str,
+    output_path: str,
+    ass_path: str,
+    info: Dict,
+    progress_callback: Optional[Callable] = None,
+    fontsdir: str = None,
+    threads: Optional[int] = None,
+):
+    """
+    Burn subtitles with the cheapest applicable strategy: smart render when
+    the source allows splicing and enough of it has no subtitles, otherwise
+    a keyframe-segmented parallel render for long inputs, otherwise a single
+    encode. A failed smart render is retried as a full encode.
+    """
+    duration = info.get("duration", 0)
+    keyframes = info.get("keyframes") or []
+    parts = segment_count(duration, threads)
+
+    video_args = smart_render_args(info)
+    if video_args is not None:
+        with open(ass_path, "r", encoding="utf-8") as f:
+            events = ass_event_ranges(f.read())
+        # Only IDR frames are safe cut points (see probe._probe_idr_frames)
+        plan = plan_smart_render(duration, info["idr_keyframes"], events, parts)
+        if plan is not None:
+            try:
+                return await burn_subtitles_smart(
+                    input_path, output_path, ass_path, plan, duration, video_args,
+                    progress_callback, fontsdir, threads, smart_mux_args(info),
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Smart render failed, falling back to a full encode: %s", e)
+
+    segments = plan_segments(duration, keyframes, parts)
+    if len(segments) > 1:
+        return await burn_subtitles_segmented(
+            input_path, output_path, ass_path, segments, duration, progress_callback, fontsdir, threads,
+        )
+    return await burn_subtitles_async(input_path, output_path, ass_path, duration, progress_callback, fontsdir, threads)
+
+
+# ---------------------------------------------------------------------------
+# Preview: a short, low-resolution render of one time window
+# ---------------------------------------------------------------------------
+PREVIEW_HEIGHT = int(os.environ.get("PREVIEW_HEIGHT", 480))
+PREVIEW_MAX_SECONDS = 10.0
+PREVIEW_PRESET = "ultrafast"
+PREVIEW_CRF = "28"
+
+
+def preview_size(width: int, height: int, max_height: int = PREVIEW_HEIGHT) -> tuple:
+    """Even preview dimensions with the source's aspect ratio, never upscaled."""
+    scale = min(1.0, max_height / height) if height > 0 else 1.0
+    return max(2, int(round(width * scale / 2)) * 2), max(2, int(round(height * scale / 2)) * 2)
+
+
+def preview_encoder(width: int, height: int, start: float, duration: float) -> str:
+    """render_cache_key encoder part for a preview: size and window change the output."""
+    return f"preview|{PREVIEW_PRESET}|{PREVIEW_CRF}|{width}x{height}|{start:.3f}+{duration:.3f}"
+
+
+def preview_ass_content(
+    subtitles: List[Dict],
+    styles: Dict,
+    src_width: int,
+    src_height: int,
+    width: int,
+    height: int,
+    start: float,
+    duration: float,
+) -> str:
+    """
+    ASS for a preview window: only the subtitles overlapping it, laid out
+    at the preview size and shifted so the window starts at 0 (the input
+    is seeked, so the clip's timeline does too).
+    """
+    end = start + duration
+    window = [sub for sub in subtitles if sub["end"] > start and sub["start"] < end]
+    scaled = scale_styles_for_target(styles, src_width, src_height, width, height)
+    return shift_ass_events(generate_ass_content(window, scaled, width, height), start, end)
+
+
+def _preview_command(
+    input_path: str,
+    output_path: str,
+    ass_path: str,
+    start: float,
+    duration: float,
+    width: int,
+    height: int,
+    fontsdir: Optional[str] = None,
+    threads: Optional[int] = None,
+) -> List[str]:
+    """Input-seeked window, scaled before the subtitles so libass draws at preview size."""
+    command = [
+        "ffmpeg", "-y",
+        "-ss", f"{start:.6f}", "-t", f"{duration:.6f}",
+        "-i", input_path,
+        "-vf", f"scale={width}:{height},setsar=1,{_subtitles_filter(ass_path, fontsdir)}",
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-c:v", "libx264", "-preset", PREVIEW_PRESET, "-crf", PREVIEW_CRF, "-pix_fmt", "yuv420p",
+    ]
+    if threads:
+        command += ["-threads", str(threads)]
+    command += [
+        # Re-encoded so the audio cut matches the seeked video exactly
+        "-c:a", "aac", "-b:a", "96k",
+        "-movflags", "+faststart",
+        "-progress", "pipe:1",
+        output_path,
+    ]
+    return command
+
+
+async def render_preview(
+    input_path: str,
+    output_path: str,
+    ass_path: str,
+    start: float,
+    duration: float,
+    width: int,
+    height: int,
+    fontsdir: Optional[str] = None,
+    threads: Optional[int] = None,
+):
+    """Render [start, start + duration) at width x height with ultrafast x264."""
+    command = _preview_command(input_path, output_path, ass_path, start, duration, width, height, fontsdir, threads)
+    progress = EncodeProgress(duration, label=os.path.basename(output_path))
+
+    logger.info("Rendering preview: %s", " ".join(command))
+    await _run_ffmpeg(command, progress.on_time())
+    await progress.finish()
+    return output_path
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from core.database import get_cached_probe, save_cached_probe
+from core.process import ProcessTimeout, run_process
+
+logger = logging.getLogger(__name__)
+
+PROBE_TIMEOUT_SECONDS = 60
+PROBE_MEMORY_CACHE_SIZE = 256
+
+DEFAULT_INFO = {"width": 1080, "height": 1920, "duration": 0}
+
+# cache key -> probe result (insertion-ordered, oldest evicted first)
+_memory_cache: Dict[str, Dict] = {}
+
+SNIFF_BYTES = 1024 * 1024  # bytes inspected before accepting the rest of an upload
+PARTIAL_PROBE_TIMEOUT_SECONDS = 5
+
+# ISO BMFF / QuickTime top-level atoms that may open a file
+_ISO_BMFF_ATOMS = {b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot"}
+
+# ffprobe errors (lowercased) that a file cut off after SNIFF_BYTES can produce
+_TRUNCATION_ERRORS = ("end of file", "error reading header", "partial file", "truncat", "moov atom not found")
+
+
+def sniff_container(head: bytes) -> Optional[str]:
+    """Identify the container from its magic bytes: "mp4", "avi", "matroska" or None."""
+    if len(head) >= 8 and head[4:8] in _ISO_BMFF_ATOMS:
+        return "mp4"
+    if len(head) >= 12 and head[0:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "avi"
+    if head[0:4] == b"\x1a\x45\xdf\xa3":
+        return "matroska"
+    return None
+
+
+async def probe_partial_upload(path: str, container: str) -> bool:
+    """
+    Run a quick ffprobe over the first bytes of an upload. Returns False only
+    when ffprobe parses the head and finds no video stream, or fails in a way a
+    cut-off file cannot explain. MP4 heads are never rejected on error: a
+    faststart index (moov) longer than the sniffed bytes is truncated, and an
+    index at the end is missing. Anything inconclusive is left to ingest.
+    """
+    command = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name",
+        "-of", "csv=p=0",
+        path,
+    ]
+    try:
+        returncode, stdout, error = await run_process(command, timeout=PARTIAL_PROBE_TIMEOUT_SECONDS)
+    except FileNotFoundError:
+        logger.warning("ffprobe not found, skipping upload sniffing probe")
+        return True
+    except ProcessTimeout:
+        logger.warning("Partial ffprobe timed out for %s, accepting upload", path)
+        return True
+
+    if returncode == 0:
+        if stdout.strip():
+            return True
+        logger.info("Partial ffprobe rejected %s: no video stream", path)
+        return False
+    lowered = error.lower()
+    if container == "mp4" or any(marker in lowered for marker in _TRUNCATION_ERRORS):
+        logger.debug("Partial ffprobe inconclusive for %s: %s", path, error.strip()[:200])
+        return True
+    logger.info("Partial ffprobe rejected %s: %s", path, error.strip()[:200])
+    return False
+
+
+# ---------------------------------------------------------------------------
+# Media probe service
+# ---------------------------------------------------------------------------
+async def _run_ffprobe(args: List[str]) -> Tuple[int, str, str]:
+    try:
+        return await run_process(["ffprobe", "-v", "error", *args], timeout=PROBE_TIMEOUT_SECONDS)
+    except ProcessTimeout:
+        raise RuntimeError("ffprobe timed out")
+
+
+def _parse_rate(rate: Optional[str]) -> float:
+    """Parse an ffprobe rational like "30000/1001" into frames per second."""
+    if not rate:
+        return 0.0
+    num, _, den = rate.partition("/")
+    try:
+        return round(float(num) / float(den or 1), 3) if float(den or 1) else 0.0
+    except ValueError:
+        return 0.0
+
+
+def _stream_rotation(stream: Dict) -> int:
+    """Clockwise display rotation in degrees (0, 90, 180 or 270)."""
+    rotation = 0
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            rotation = -int(float(side_data["rotation"]))
+            break
+    else:
+        rotate_tag = stream.get("tags", {}).get("rotate")
+        if rotate_tag:
+            rotation = int(float(rotate_tag))
+    return rotation % 360
+
+
+def parse_probe_output(
+    data: Dict,
+    keyframes: Optional[List[float]] = None,
+    idr_keyframes: Optional[List[float]] = None,
+) -> Dict:
+    """
+    Build the probe result from ffprobe's -show_streams -show_format JSON.
+    idr_keyframes is None when the IDR index is unknown (non-H.264 sources).
+    """
+    streams = data.get("streams", [])
+    video = next((st for st in streams if st.get("codec_type") == "video"), None)
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
+    if video is None:
+        raise ValueError("no video stream")
+
+    duration = 0.0
+    if video.get("duration"):
+        duration = float(video["duration"])
+    elif data.get("format", {}).get("duration"):
+        duration = float(data["format"]["duration"])
+
+    coded_width = video.get("width", DEFAULT_INFO["width"])
+    coded_height = video.get("height", DEFAULT_INFO["height"])
+    rotation = _stream_rotation(video)
+    # FFmpeg autorotates on decode, so filters (and ASS) see display dimensions
+    width, height = (coded_height, coded_width) if rotation in (90, 270) else (coded_width, coded_height)
+
+    keyframes = keyframes or []
+    return {
+        "width": width,
+        "height": height,
+        "coded_width": coded_width,
+        "coded_height": coded_height,
+        "rotation": rotation,
+        "duration": duration,
+        "fps": _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate")),
+        "codec": video.get("codec_name"),
+        "profile": video.get("profile"),
+        "pix_fmt": video.get("pix_fmt"),
+        "level": video.get("level") if (video.get("level") or 0) > 0 else None,
+        "frame_rate": video.get("r_frame_rate"),
+        "avg_frame_rate": video.get("avg_frame_rate"),
+        "sample_aspect_ratio": video.get("sample_aspect_ratio"),
+        "time_base": video.get("time_base"),
+        "bit_rate": int(video["bit_rate"]) if video.get("bit_rate", "").isdigit() else None,
+        "has_audio": audio is not None,
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "format": data.get("format", {}).get("format_name"),
+        "keyframes": keyframes,
+        "keyframe_count": len(keyframes),
+        "idr_keyframes": idr_keyframes,
+    }
+
+
+def _parse_keyframes(output: str) -> List[float]:
+    """Parse "pts_time,flags" CSV lines and keep the timestamps of keyframe packets."""
+    times = []
+    for line in output.splitlines():
+        pts, _, flags = line.strip().partition(",")
+        if "K" in flags and pts not in ("", "N/A"):
+            try:
+                times.append(round(float(pts), 3))
+            except ValueError:
+                continue
+    return sorted(set(times))
+
+
+def _parse_idr_frames(output: str) -> List[float]:
+    """
+    Parse framecrc output ("#tb 0: num/den" header, then "stream, dts, pts,
+    duration, size, crc" lines) into packet timestamps in seconds.
+    """
+    num, den = 1, 1
+    times = []
+    for line in output.splitlines():
+        if line.startswith("#tb "):
+            rate = line.partition(":")[2].strip()
+            num, _, den = rate.partition("/")
+            num, den = int(num), int(den or 1)
+            continue
+        if line.startswith("#"):
+            continue
+        fields = [field.strip() for field in line.split(",")]
+        if len(fields) < 3:
+            continue
+        try:
+            times.append(round(int(fields[2]) * num / den, 3))
+        except (ValueError, ZeroDivisionError):
+            continue
+    return sorted(set(times))
+
+
+async def _probe_idr_frames(path: str) -> Optional[List[float]]:
+    """
+    Timestamps of the H.264 access units that contain an IDR slice. Packet
+    keyframe flags also mark open-GOP I-frames (recovery points), whose
+    following B-frames reference the previous GOP, so they are unsafe cut
+    points. filter_units drops every other NAL unit, and packets left empty
+    are discarded, so only IDR access units reach the output; nothing is
+    decoded. Returns None if ffmpeg can't build the index.
+    """
+    command = [
+        "ffmpeg", "-v", "error", "-copyts",
+        "-i", path,
+        "-map", "0:v:0", "-c", "copy",
+        "-bsf:v", "filter_units=pass_types=5",
+        "-f", "framecrc", "-",
+    ]
+    try:
+        returncode, stdout, stderr = await run_process(command, timeout=PROBE_TIMEOUT_SECONDS)
+    except (ProcessTimeout, FileNotFoundError) as e:
+        logger.warning("IDR index failed for %s: %s", path, e)
+        return None
+    if returncode != 0:
+        logger.warning("IDR index failed for %s: %s", path, stderr[:300])
+        return None
+    return _parse_idr_frames(stdout)
+
+
+async def _probe_uncached(path: str) -> Dict:
+    info_call = _run_ffprobe(["-show_streams", "-show_format", "-of", "json", path])
+    # Packet flags come from the demuxer, so no frames are decoded here
+    keyframe_call = _run_ffprobe([
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        path,
+    ])
+    (rc, stdout, stderr), (k_rc, k_stdout, _) = await asyncio.gather(info_call, keyframe_call)
+    if rc != 0:
+        raise RuntimeError(f"ffprobe failed: {stderr[:300]}")
+    keyframes = _parse_keyframes(k_stdout) if k_rc == 0 else []
+    data = json.loads(stdout)
+    video = next((st for st in data.get("streams", []) if st.get("codec_type") == "video"), {})
+    idr_keyframes = await _probe_idr_frames(path) if video.get("codec_name") == "h264" else None
+    return parse_probe_output(data, keyframes, idr_keyframes)
+
+
+def _cache_key(path: str, content_hash: Optional[str]) -> str:
+    if content_hash:
+        return f"sha256:{content_hash}"
+    st = os.stat(path)
+    return f"file:{os.path.realpath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _copy_info(info: Dict) -> Dict:
+    return {key: list(value) if isinstance(value, list) else value for key, value in info.items()}
+
+
+def _remember(key: str, info: Dict):
+    _memory_cache[key] = info
+    while len(_memory_cache) > PROBE_MEMORY_CACHE_SIZE:
+        del _memory_cache[next(iter(_memory_cache))]
+
+
+async def probe_media(path: str, content_hash: Optional[str] = None) -> Dict:
+    """
+    Return width/height (display), duration, fps, codec, profile, pix_fmt,
+    rotation, audio presence and the keyframe index for a media file.
+
+    Results are cached in memory and in SQLite, keyed by content hash when
+    known, otherwise by path, size and mtime. Falls back to DEFAULT_INFO
+    (uncached) if probing fails.
+    """
+    try:
+        key = _cache_key(path, content_hash)
+    except OSError:
+        logger.warning("Cannot stat %s, using default media info", path)
+        return {**DEFAULT_INFO, "keyframes": [], "keyframe_count": 0}
+
+    # Callers get copies: the cached dicts (and keyframe lists) are shared
+    if key in _memory_cache:
+        return _copy_info(_memory_cache[key])
+
+    try:
+        cached = await get_cached_probe(key)
+    except Exception as e:
+        logger.warning("Probe cache lookup failed: %s", e)
+        cached = None
+    if cached is not None:
+        _remember(key, cached)
+        return _copy_info(cached)
+
+    try:
+        info = await _probe_uncached(path)
+    except (RuntimeError, ValueError, OSError) as e:
+        logger.warning("ffprobe failed for %s, using defaults: %s", path, e)
+        return {**DEFAULT_INFO, "keyframes": [], "keyframe_count": 0}
+
+    _remember(key, info)
+    try:
+        await save_cached_probe(key, info)
+    except Exception as e:
+        logger.warning("Failed to store probe result: %s", e)
+    return _copy_info(info)
@@ -0,0 +1,252 @@
+import asyncio
+import collections
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+# Hard wall-clock limit for one ffmpeg run (0 disables)
+FFMPEG_TIMEOUT_SECONDS = float(os.environ.get("FFMPEG_TIMEOUT_SECONDS", 3 * 3600))
+# Kill an ffmpeg run whose -progress output has been silent this long (0 disables)
+FFMPEG_STALL_SECONDS = float(os.environ.get("FFMPEG_STALL_SECONDS", 120))
+# Niceness for ffmpeg/ffprobe so encodes yield the CPU to the API (0 = unchanged)
+FFMPEG_NICE = int(os.environ.get("FFMPEG_NICE", 10))
+# stderr lines kept for error messages; the rest is discarded as it arrives
+STDERR_TAIL_LINES = 200
+_MAX_PENDING_BYTES = 64 * 1024
+
+_LINE_BREAK = re.compile(rb"[\r\n]")
+
+LineCallback = Callable[[str], Awaitable[None]]
+# Watchdog poll interval of run_process_sync
+_WATCHDOG_INTERVAL = 0.25
+
+
+class ProcessTimeout(RuntimeError):
+    """Raised by run_process() after killing a process that ran too long or stalled."""
+
+
+def _lower_priority(pid: int, nice: int):
+    """
+    Raise pid's niceness by nice. Done from the parent right after the spawn:
+    a preexec_fn isn't safe to run in a threaded process, and a "nice"
+    wrapper would hide a missing binary behind exit status 127.
+    """
+    try:
+        os.setpriority(os.PRIO_PROCESS, pid, min(os.getpriority(os.PRIO_PROCESS, pid) + nice, 19))
+    except OSError as e:
+        logger.debug("Could not lower the priority of pid %s: %s", pid, e)
+
+
+async def _drain(stream: asyncio.StreamReader, tail: Deque[str]):
+    """
+    Read stream to EOF keeping only its last lines. ffmpeg redraws its stats
+    line with bare carriage returns, so both \r and \n end a line.
+    """
+    pending = b""
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        *lines, pending = _LINE_BREAK.split(pending + chunk)
+        tail.extend(line.decode("utf-8", errors="replace") for line in lines if line.strip())
+        pending = pending[-_MAX_PENDING_BYTES:]
+    if pending.strip():
+        tail.append(pending.decode("utf-8", errors="replace"))
+
+
+def _wait_budget(deadline: Optional[float], stall_timeout: Optional[float]) -> Optional[float]:
+    waits = [w for w in (stall_timeout, deadline - time.monotonic() if deadline else None) if w]
+    return max(0.0, min(waits)) if waits else None
+
+
+async def run_process(
+    command: List[str],
+    on_line: Optional[LineCallback] = None,
+    timeout: Optional[float] = None,
+    stall_timeout: Optional[float] = None,
+    nice: int = FFMPEG_NICE,
+) -> Tuple[int, str, str]:
+    """
+    Run command and return (returncode, stdout, stderr tail).
+
+    stderr is drained concurrently into a ring buffer of STDERR_TAIL_LINES,
+    so a chatty process can never block on a full pipe. With on_line,
+    stdout is streamed to it line by line (and returned empty), and
+    stall_timeout bounds the silence between lines. timeout bounds the
+    whole run. Exceeding either kills the process and raises
+    ProcessTimeout; cancelling the caller kills it too.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    if nice and hasattr(os, "setpriority"):
+        _lower_priority(process.pid, nice)
+    tail: Deque[str] = collections.deque(maxlen=STDERR_TAIL_LINES)
+    stderr_task = asyncio.ensure_future(_drain(process.stderr, tail))
+    deadline = time.monotonic() + timeout if timeout else None
+    name = os.path.basename(command[0])
+
+    stdout = b""
+    try:
+        try:
+            if on_line is None:
+                stdout = await asyncio.wait_for(process.stdout.read(), _wait_budget(deadline, None))
+            else:
+                while True:
+                    line = await asyncio.wait_for(process.stdout.readline(), _wait_budget(deadline, stall_timeout))
+                    if not line:
+                        break
+                    await on_line(line.decode("utf-8", errors="replace").strip())
+            await asyncio.wait_for(process.wait(), _wait_budget(deadline, None))
+        except asyncio.TimeoutError:
+            if deadline and time.monotonic() >= deadline:
+                reason = f"timed out after {timeout:g}s"
+            else:
+                reason = f"made no progress for {stall_timeout:g}s"
+            logger.warning("Killing %s (pid %s): %s. stderr: %s", name, process.pid, reason, "\n".join(list(tail)[-5:]))
+            raise ProcessTimeout(f"{name} {reason}")
+        await stderr_task
+    except BaseException:
+        # Timed out, cancelled or a callback failed: don't leave the process running
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        stderr_task.cancel()
+        raise
+    return process.returncode, stdout.decode("utf-8", errors="replace"), "\n".join(tail)
+
+
+# ---------------------------------------------------------------------------
+# Blocking variant for worker threads
+# ---------------------------------------------------------------------------
+def _drain_sync(
+    stream,
+    tail: Deque[str],
+    on_line: Optional[Callable[[str], None]],
+    activity: List[float],
+):
+    """Blocking _drain for a pipe read on its own thread; on_line sees every line."""
+    pending = b""
+
+    def emit(raw: bytes):
+        line = raw.decode("utf-8", errors="replace")
+        tail.append(line)
+        if on_line:
+            on_line(line)
+
+    for chunk in iter(lambda: stream.read1(65536), b""):
+        activity[0] = time.monotonic()
+        *lines, pending = _LINE_BREAK.split(pending + chunk)
+        for line in lines:
+            if line.strip():
+                emit(line)
+        pending = pending[-_MAX_PENDING_BYTES:]
+    if pending.strip():
+        emit(pending)
+
+
+def _feed_stdin(stream, data: bytes):
+    try:
+        stream.write(data)
+    except (BrokenPipeError, ValueError):
+        # The process exited (or was killed) without reading everything
+        pass
+    finally:
+        try:
+            stream.close()
+        except BrokenPipeError:
+            pass
+
+
+def run_process_sync(
+    command: List[str],
+    input: Optional[bytes] = None,
+    on_stdout: Optional[Callable[[bytes], None]] = None,
+    on_stderr_line: Optional[Callable[[str], None]] = None,
+    timeout: Optional[float] = None,
+    stall_timeout: Optional[float] = None,
+    nice: int = FFMPEG_NICE,
+) -> Tuple[int, bytes, str]:
+    """
+    Blocking counterpart of run_process() for code running in a worker
+    thread (asyncio.to_thread): returns (returncode, stdout bytes, stderr tail).
+
+    stderr is drained on its own thread, so a process that floods it can't
+    block against a caller that is still reading stdout. on_stdout receives
+    stdout block by block (and stdout is returned empty); on_stderr_line sees
+    every stderr line, not just the tail. input is written to stdin. A
+    watchdog thread kills the process when timeout (whole run) or
+    stall_timeout (no output on either pipe) runs out, and ProcessTimeout
+    is raised.
+    """
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if nice and hasattr(os, "setpriority"):
+        _lower_priority(process.pid, nice)
+    name = os.path.basename(command[0])
+    tail: Deque[str] = collections.deque(maxlen=STDERR_TAIL_LINES)
+    started = time.monotonic()
+    activity = [started]
+    finished = threading.Event()
+    killed_for: List[str] = []
+
+    def watchdog():
+        while not finished.wait(_WATCHDOG_INTERVAL):
+            now = time.monotonic()
+            if timeout and now - started >= timeout:
+                killed_for.append(f"timed out after {timeout:g}s")
+            elif stall_timeout and now - activity[0] >= stall_timeout:
+                killed_for.append(f"made no progress for {stall_timeout:g}s")
+            else:
+                continue
+            logger.warning("Killing %s (pid %s): %s. stderr: %s", name, process.pid, killed_for[0], "\n".join(list(tail)[-5:]))
+            process.kill()
+            return
+
+    helpers = [
+        threading.Thread(target=_drain_sync, args=(process.stderr, tail, on_stderr_line, activity), daemon=True),
+        threading.Thread(target=watchdog, daemon=True),
+    ]
+    if input is not None:
+        helpers.append(threading.Thread(target=_feed_stdin, args=(process.stdin, input), daemon=True))
+    for helper in helpers:
+        helper.start()
+
+    blocks = []
+    try:
+        for block in iter(lambda: process.stdout.read1(1024 * 1024), b""):
+            activity[0] = time.monotonic()
+            if on_stdout:
+                on_stdout(block)
+            else:
+                blocks.append(block)
+        process.wait()
+    except BaseException:
+        # A callback failed: don't leave the process running
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        finished.set()
+        for helper in helpers:
+            helper.join()
+        process.stdout.close()
+        process.stderr.close()
+    if killed_for:
+        raise ProcessTimeout(f"{name} {killed_for[0]}")
+    return process.returncode, b"".join(blocks), "\n".join(tail)
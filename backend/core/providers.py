@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 50))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", 20))
+HTTP_TIMEOUT_SECONDS = float(os.environ.get("HTTP_TIMEOUT_SECONDS", 600))
+
+# Max in-flight requests per provider across all jobs
+PROVIDER_CONCURRENCY = {
+    "openai": int(os.environ.get("OPENAI_MAX_CONCURRENCY", 8)),
+    "anthropic": int(os.environ.get("ANTHROPIC_MAX_CONCURRENCY", 4)),
+}
+PROVIDER_MAX_RETRIES = int(os.environ.get("PROVIDER_MAX_RETRIES", 4))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20.0
+
+_http_client: Optional[httpx.AsyncClient] = None
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive connection pool for all provider SDK clients."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=10.0),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    _semaphores.clear()
+
+
+def _get_semaphore(provider: str) -> asyncio.Semaphore:
+    if provider not in _semaphores:
+        _semaphores[provider] = asyncio.Semaphore(max(1, PROVIDER_CONCURRENCY.get(provider, 4)))
+    return _semaphores[provider]
+
+
+def _is_retryable(exc: Exception) -> bool:
+    """429s, 5xx responses and connection/timeout failures are worth retrying."""
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(exc, httpx.TransportError):
+        return True
+    # SDK connection errors (openai/anthropic APIConnectionError, APITimeoutError)
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    """Honour Retry-After when present, otherwise full-jitter exponential backoff."""
+    response = getattr(exc, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+async def call_with_retries(provider: str, fn: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+    """
+    Await fn(*args, **kwargs) under the provider's concurrency limit, retrying
+    retryable failures with jittered backoff. The slot is released while waiting.
+    """
+    attempt = 0
+    while True:
+        try:
+            async with _get_semaphore(provider):
+                return await fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= PROVIDER_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            attempt += 1
+            logger.warning(
+                "%s request failed (%s), retry %d/%d in %.1fs",
+                provider, e, attempt, PROVIDER_MAX_RETRIES, delay,
+            )
+            await asyncio.sleep(delay)
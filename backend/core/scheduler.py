@@ -0,0 +1,181 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+# Concurrent ffmpeg encodes; each libx264 encode already uses several cores
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", max(1, (os.cpu_count() or 2) // 4)))
+EXPORT_QUEUE_MAX = int(os.environ.get("EXPORT_QUEUE_MAX", 32))
+# Initial guess of encode seconds per second of media, refined as jobs finish
+DEFAULT_SECONDS_PER_COST = 1.0
+ESTIMATE_SMOOTHING = 0.3
+
+QueueCallback = Callable[[int, float], Awaitable[None]]
+
+
+class QueueFullError(RuntimeError):
+    """Raised by submit() when the queue already holds max_queued jobs."""
+
+
+class _Job:
+    __slots__ = ("job_id", "run", "cost", "on_queue_update", "started_at")
+
+    def __init__(self, job_id: str, run: Callable[[], Awaitable[None]], cost: float, on_queue_update: Optional[QueueCallback]):
+        self.job_id = job_id
+        self.run = run
+        self.cost = cost
+        self.on_queue_update = on_queue_update
+        self.started_at = 0.0
+
+
+class JobScheduler:
+    """
+    Runs at most `workers` jobs at once and queues the rest, highest priority
+    first and FIFO within a priority. Queued jobs are told their 1-based
+    position and an estimated wait in seconds whenever the queue moves.
+
+    A job's cost is its expected amount of work (seconds of media for
+    exports); the seconds-per-cost rate is learned from finished jobs.
+    """
+
+    def __init__(self, workers: int = EXPORT_WORKERS, max_queued: int = EXPORT_QUEUE_MAX, name: str = "export"):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.name = name
+        self.seconds_per_cost = DEFAULT_SECONDS_PER_COST
+        self._queue: List[tuple] = []  # heap of (-priority, seq, job)
+        self._seq = itertools.count()
+        # Keyed by job object: client-supplied ids are not guaranteed unique
+        self._running: Dict[_Job, asyncio.Task] = {}
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    async def submit(
+        self,
+        job_id: str,
+        run: Callable[[], Awaitable[None]],
+        cost: float = 1.0,
+        priority: int = 0,
+        on_queue_update: Optional[QueueCallback] = None,
+    ) -> bool:
+        """
+        Schedule run() and return True if it started immediately, False if it
+        was queued. Raises QueueFullError when the queue is at capacity.
+        """
+        if self.max_queued and len(self._queue) >= self.max_queued and len(self._running) >= self.workers:
+            raise QueueFullError(f"{self.name} queue is full ({self.max_queued} jobs waiting)")
+        job = _Job(job_id, run, max(cost, 0.0), on_queue_update)
+        heapq.heappush(self._queue, (-priority, next(self._seq), job))
+        self._dispatch()
+        if job in self._running:
+            return True
+        logger.info(
+            "Queued %s job %s (position %d, %d running)",
+            self.name, job_id, self.position(job_id), len(self._running),
+        )
+        await self._notify_queued()
+        return False
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based queue position, or None if the job is not waiting."""
+        for index, (_, _, job) in enumerate(sorted(self._queue)):
+            if job.job_id == job_id:
+                return index + 1
+        return None
+
+    def _estimated_starts(self) -> List[float]:
+        """Estimated seconds until each queued job (in queue order) starts."""
+        now = time.time()
+        slots = sorted(
+            max(0.0, job.cost * self.seconds_per_cost - (now - job.started_at))
+            for job in self._running
+        )
+        slots += [0.0] * (self.workers - len(slots))
+        heapq.heapify(slots)
+        starts = []
+        for _, _, job in sorted(self._queue):
+            start = heapq.heappop(slots)
+            starts.append(start)
+            heapq.heappush(slots, start + job.cost * self.seconds_per_cost)
+        return starts
+
+    async def _notify_queued(self):
+        ordered = sorted(self._queue)
+        for index, ((_, _, job), eta) in enumerate(zip(ordered, self._estimated_starts())):
+            if job.on_queue_update is None:
+                continue
+            try:
+                await job.on_queue_update(index + 1, round(eta, 1))
+            except Exception:
+                logger.exception("Queue update failed for %s job %s", self.name, job.job_id)
+
+    def _dispatch(self):
+        while self._queue and len(self._running) < self.workers:
+            _, _, job = heapq.heappop(self._queue)
+            job.started_at = time.time()
+            self._running[job] = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: _Job):
+        try:
+            await job.run()
+            if job.cost > 0:
+                rate = (time.time() - job.started_at) / job.cost
+                self.seconds_per_cost += ESTIMATE_SMOOTHING * (rate - self.seconds_per_cost)
+        except Exception:
+            logger.exception("%s job %s failed", self.name, job.job_id)
+        finally:
+            self._running.pop(job, None)
+            self._dispatch()
+            await self._notify_queued()
+
+    async def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Drop a waiting job ("queued") or cancel a running one and wait for it
+        to unwind ("running"). Returns None if no such job is known.
+        """
+        remaining = [entry for entry in self._queue if entry[2].job_id != job_id]
+        if len(remaining) < len(self._queue):
+            self._queue = remaining
+            heapq.heapify(self._queue)
+            logger.info("Cancelled queued %s job %s", self.name, job_id)
+            await self._notify_queued()
+            return "queued"
+        tasks = [task for job, task in self._running.items() if job.job_id == job_id]
+        if not tasks:
+            return None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info("Cancelled running %s job %s", self.name, job_id)
+        return "running"
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "queued": len(self._queue),
+            "seconds_per_cost": round(self.seconds_per_cost, 3),
+        }
+
+    async def shutdown(self):
+        """Drop queued jobs and cancel running ones."""
+        self._queue.clear()
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._running.clear()
@@ -2,6 +2,8 @@ import logging
 import os
 from typing import List, Dict, Optional
 
+from core.providers import call_with_retries, get_http_client
+
 logger = logging.getLogger(__name__)
 
 _client = None
@@ -22,7 +24,8 @@ def _get_client():
                 "ANTHROPIC_API_KEY is not set. "
                 "Add it in Settings or to backend/.env: ANTHROPIC_API_KEY=sk-ant-..."
             )
-        _client = anthropic.Anthropic(api_key=api_key)
+        # Retries are handled by call_with_retries (jittered, concurrency-aware)
+        _client = anthropic.AsyncAnthropic(api_key=api_key, http_client=get_http_client(), max_retries=0)
     return _client
 
 
@@ -49,7 +52,7 @@ def _remap_words(corrected_text: str, original_words: list) -> list:
     return original_words
 
 
-def correct_subtitles(subtitles: List[Dict], language: Optional[str] = None) -> List[Dict]:
+async def correct_subtitles(subtitles: List[Dict], language: Optional[str] = None) -> List[Dict]:
     """
     Uses Claude to fix punctuation, capitalization, and spelling in subtitle texts.
     Returns corrected subtitles with same structure (start, end, text).
@@ -81,7 +84,9 @@ Rules:
 Subtitles:
 {numbered_text}"""
 
-        response = _get_client().messages.create(
+        response = await call_with_retries(
+            "anthropic",
+            _get_client().messages.create,
             model="claude-sonnet-4-20250514",
             max_tokens=1024,
             temperature=0,
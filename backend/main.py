@@ -1,10 +1,12 @@
 import asyncio
+import hashlib
+import json
 import logging
 import os
 import time
 import uuid
 from contextlib import asynccontextmanager
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -17,9 +19,22 @@ from slowapi import Limiter
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 
-from core.asr import transcribe_audio, reset_client as reset_openai_client
-from core.database import init_db, save_project, get_projects, get_project, delete_project, get_all_settings, set_setting
-from core.export import burn_subtitles_async, generate_ass_content, get_video_info
+from core.asr import compute_audio_hash, prepare_audio, transcribe_audio, transcription_cache_key
+from core.asr_engines import get_engine, shutdown_engine, warm_up_engine, reset_client as reset_openai_client
+from core.providers import close_http_client
+from core.database import (
+    init_db, save_project, get_projects, get_project, delete_project, get_project_video_filenames,
+    get_all_settings, set_setting,
+    get_cached_transcription, save_cached_transcription, evict_probe_cache,
+    get_cached_render, save_cached_render, delete_cached_render, get_cached_render_filenames, evict_render_cache,
+)
+from core.export import (
+    KARAOKE_TAG_MODES, PREVIEW_MAX_SECONDS, burn_subtitles_multi, encoder_fingerprint, font_digest, mux_subtitles,
+    preview_ass_content, preview_encoder, preview_size, render_cache_key, render_preview, render_subtitles,
+    scale_styles_for_target, thread_budget, thread_budget_stats, write_ass,
+)
+from core.probe import SNIFF_BYTES, probe_media, probe_partial_upload, sniff_container
+from core.scheduler import JobScheduler, QueueFullError
 from core.fonts import get_available_fonts, get_font_path, get_font_info_by_name
 from core.segmentation import segment_subtitles
 from core.text_correction import correct_subtitles, reset_client as reset_anthropic_client
@@ -52,6 +67,12 @@ CLEANUP_INTERVAL_SECONDS = 30 * 60  # 30 minutes
 TASK_TTL_SECONDS = 2 * 60 * 60  # 2 hours
 TASK_CLEANUP_INTERVAL_SECONDS = 15 * 60  # 15 minutes
 WS_HEARTBEAT_INTERVAL_SECONDS = 30  # 30 seconds
+UPLOAD_CHUNK_SIZE_DEFAULT = 8 * 1024 * 1024  # resumable upload chunk size
+UPLOAD_CHUNK_SIZE_MIN = 256 * 1024
+UPLOAD_CHUNK_SIZE_MAX = 32 * 1024 * 1024
+MAX_EXPORT_TARGETS = 6
+INGEST_MAX_ENTRIES = int(os.environ.get("INGEST_MAX_ENTRIES", 16))  # prepared uploads kept in memory
+PREVIEW_WORKERS = int(os.environ.get("PREVIEW_WORKERS", 2))  # concurrent /api/preview renders
 
 def _safe_upload_path(filename: str) -> str:
     """Sanitize filename and return a safe path within UPLOAD_DIR. Raises 400 on traversal."""
@@ -72,6 +93,29 @@ task_store: Dict[str, dict] = {}
 ws_connections: Dict[str, set] = {}
 # Set of filenames currently being processed (for file cleanup race condition)
 active_files: set = set()
+# task_id -> subtitles streamed so far (snapshot for late WebSocket subscribers)
+task_partials: Dict[str, list] = {}
+# Single-flight: dedupe key -> task_id of the in-flight job doing that work
+inflight_jobs: Dict[str, str] = {}
+# task_id -> task ids of coalesced duplicate requests that mirror its progress
+task_aliases: Dict[str, set] = {}
+# Uploads: filename -> {"count": saved projects using it, "last_ref": timestamp}
+upload_refs: Dict[str, dict] = {}
+# upload_id -> resumable upload session (see /api/uploads)
+upload_sessions: Dict[str, dict] = {}
+# filename -> background ingest task (probe + ASR audio), started at upload time
+ingest_tasks: Dict[str, asyncio.Task] = {}
+# Bounded pool of concurrent ffmpeg encodes (EXPORT_WORKERS / EXPORT_QUEUE_MAX)
+export_scheduler = JobScheduler(name="export")
+# task_id -> soft export task (these bypass export_scheduler)
+export_tasks: Dict[str, asyncio.Task] = {}
+# task_id -> frees the input, ASS files and in-flight entry of an unfinished export
+export_releases: Dict[str, Callable[[], None]] = {}
+# Previews render inline (no queue), so this bounds how many share the cores at once
+preview_slots = asyncio.Semaphore(max(1, PREVIEW_WORKERS))
+# export job id -> task id that now owns it, after its first owner cancelled
+# while coalesced duplicates were still waiting (see cancel_export)
+export_owners: Dict[str, str] = {}
 
 # ---------------------------------------------------------------------------
 # Rate limiter
@@ -100,16 +144,33 @@ async def cleanup_old_files():
         try:
             now = time.time()
             count = 0
+            # Cached exports follow the render cache's own LRU/quota policy
+            await _evict_render_cache()
+            evicted_probes = await evict_probe_cache()
+            if evicted_probes:
+                logger.info("Probe cache: evicted %d entries", evicted_probes)
+            cached_renders = await get_cached_render_filenames()
             for fname in os.listdir(UPLOAD_DIR):
                 # Skip files currently being processed
-                if fname in active_files:
+                if fname in active_files or fname in cached_renders:
+                    continue
+                refs = upload_refs.get(fname, {})
+                # Files a saved project still points at are never expired
+                if refs.get("count", 0) > 0:
                     continue
                 fpath = os.path.join(UPLOAD_DIR, fname)
                 if os.path.isfile(fpath):
-                    age = now - os.path.getmtime(fpath)
+                    # Unreferenced uploads live until their newest upload or release expires
+                    age = now - max(os.path.getmtime(fpath), refs.get("last_ref", 0))
                     if age > FILE_MAX_AGE_SECONDS:
                         os.remove(fpath)
+                        _drop_ingest(fname)
+                        upload_refs.pop(fname, None)
                         count += 1
+            # Forget resumable upload sessions whose partial file expired
+            for upload_id, session in list(upload_sessions.items()):
+                if not os.path.exists(session["part_path"]):
+                    del upload_sessions[upload_id]
             if count:
                 logger.info("Cleanup: removed %d old files from %s", count, UPLOAD_DIR)
         except Exception:
@@ -130,6 +191,8 @@ async def cleanup_old_tasks():
                 del task_store[tid]
                 # Also remove any leftover ws_connections entries
                 ws_connections.pop(tid, None)
+                task_partials.pop(tid, None)
+                task_aliases.pop(tid, None)
             if expired:
                 logger.info("Task cleanup: removed %d expired tasks", len(expired))
         except Exception:
@@ -146,10 +209,18 @@ async def lifespan(app: FastAPI):
     logger.info("Started background cleanup tasks (files + tasks)")
     await init_db()
     logger.info("Database initialized")
+    await load_upload_refs()
     await sync_api_keys_from_db()
+    try:
+        await asyncio.to_thread(warm_up_engine)
+    except Exception:
+        logger.exception("ASR engine warm-up failed; jobs will retry on demand")
     yield
     file_cleanup_task.cancel()
     task_cleanup_task.cancel()
+    await export_scheduler.shutdown()
+    shutdown_engine()
+    await close_http_client()
 
 # ---------------------------------------------------------------------------
 # App
@@ -246,6 +317,44 @@ class SubtitleStyles(BaseModel):
     bold: bool = True
     highlightColor: str = "#FFFF00"
     karaokeEnabled: bool = False
+    # "word": an event per highlighted word; "k"/"kf": one \k-timed event per line
+    karaokeMode: str = "word"
+
+    @field_validator("karaokeMode")
+    @classmethod
+    def validate_karaoke_mode(cls, v):
+        if v not in ("word", *KARAOKE_TAG_MODES):
+            raise ValueError("Karaoke mode must be 'word', 'k' or 'kf'")
+        return v
+
+
+class ExportTarget(BaseModel):
+    width: int
+    height: int
+    fit: str = "crop"  # "crop" (fill the frame) or "pad" (letterbox)
+    video_bitrate: Optional[int] = None  # kbps; constant quality when unset
+    label: Optional[str] = None
+
+    @field_validator("width", "height")
+    @classmethod
+    def even_dimension(cls, v: int) -> int:
+        if v < 16 or v > 4096 or v % 2:
+            raise ValueError("Target dimensions must be even numbers between 16 and 4096")
+        return v
+
+    @field_validator("fit")
+    @classmethod
+    def validate_fit(cls, v):
+        if v not in ("crop", "pad"):
+            raise ValueError("Fit must be 'crop' or 'pad'")
+        return v
+
+    @field_validator("video_bitrate")
+    @classmethod
+    def bitrate_positive(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("Video bitrate must be positive")
+        return v
 
 
 class ExportRequest(BaseModel):
@@ -253,6 +362,11 @@ class ExportRequest(BaseModel):
     subtitles: List[SubtitleItem]
     styles: SubtitleStyles
     task_id: Optional[str] = None
+    priority: int = 0  # higher runs first when exports are queued
+    mode: str = "burn"  # "burn" (re-encode) or "soft" (caption track, stream copy)
+    container: str = "mp4"  # "mp4" or "mkv"; mkv keeps ASS styling in soft mode
+    # Several resolutions rendered from one decode (burn mode only)
+    targets: Optional[List[ExportTarget]] = None
 
     @field_validator("subtitles")
     @classmethod
@@ -261,6 +375,71 @@ class ExportRequest(BaseModel):
             raise ValueError("Subtitles list must not be empty")
         return v
 
+    @field_validator("targets")
+    @classmethod
+    def validate_targets(cls, v):
+        if v is not None and not 1 <= len(v) <= MAX_EXPORT_TARGETS:
+            raise ValueError(f"Between 1 and {MAX_EXPORT_TARGETS} targets are allowed")
+        return v
+
+    @field_validator("mode")
+    @classmethod
+    def validate_mode(cls, v):
+        if v not in ("burn", "soft"):
+            raise ValueError("Mode must be 'burn' or 'soft'")
+        return v
+
+    @field_validator("container")
+    @classmethod
+    def validate_container(cls, v):
+        if v not in ("mp4", "mkv"):
+            raise ValueError("Container must be 'mp4' or 'mkv'")
+        return v
+
+
+class PreviewRequest(BaseModel):
+    filename: str
+    subtitles: List[SubtitleItem]
+    styles: SubtitleStyles
+    start: float  # seconds into the source, e.g. a little before the playhead
+    duration: float = 3.0
+
+    @field_validator("start")
+    @classmethod
+    def start_non_negative(cls, v):
+        if v < 0:
+            raise ValueError("Start must be non-negative")
+        return v
+
+    @field_validator("duration")
+    @classmethod
+    def validate_duration(cls, v):
+        if not 0 < v <= PREVIEW_MAX_SECONDS:
+            raise ValueError(f"Duration must be between 0 and {PREVIEW_MAX_SECONDS:g} seconds")
+        return v
+
+
+class CreateUploadRequest(BaseModel):
+    filename: str
+    size: int
+    chunk_size: int = UPLOAD_CHUNK_SIZE_DEFAULT
+
+    @field_validator("size")
+    @classmethod
+    def size_positive(cls, v: int) -> int:
+        if v <= 0:
+            raise ValueError("Size must be positive")
+        return v
+
+    @field_validator("chunk_size")
+    @classmethod
+    def chunk_size_in_range(cls, v: int) -> int:
+        if not UPLOAD_CHUNK_SIZE_MIN <= v <= UPLOAD_CHUNK_SIZE_MAX:
+            raise ValueError(
+                f"chunk_size must be between {UPLOAD_CHUNK_SIZE_MIN} and {UPLOAD_CHUNK_SIZE_MAX} bytes"
+            )
+        return v
+
 
 class ProcessRequest(BaseModel):
     filename: str
@@ -308,11 +487,9 @@ class UpdateSettingsRequest(BaseModel):
 # ---------------------------------------------------------------------------
 # Helper: broadcast progress to connected WebSockets
 # ---------------------------------------------------------------------------
-async def broadcast_progress(task_id: str, progress: int, status: str, result=None):
-    """Send progress update to all WebSocket clients listening for this task."""
-    msg = {"progress": progress, "status": status}
-    if result is not None:
-        msg["result"] = result
+async def _publish(task_id: str, msg: dict):
+    """Store msg as the task's latest state and send it to the task's sockets."""
+    msg = dict(msg)
     # Preserve creation timestamp for TTL cleanup
     existing = task_store.get(task_id)
     created_at = existing["_created_at"] if existing and "_created_at" in existing else time.time()
@@ -329,6 +506,71 @@ async def broadcast_progress(task_id: str, progress: int, status: str, result=No
         except Exception:
             ws_connections.get(task_id, set()).discard(ws)
 
+
+def _task_targets(task_id: str) -> list:
+    """The task itself plus any coalesced duplicates attached to it."""
+    return [task_id, *task_aliases.get(task_id, ())]
+
+
+async def broadcast_progress(task_id: str, progress: int, status: str, result=None, **extra):
+    """Send progress update to all WebSocket clients listening for this task.
+
+    Extra keyword arguments are sent as additional top-level message fields.
+    """
+    msg = {"progress": progress, "status": status, **extra}
+    if result is not None:
+        msg["result"] = result
+    for target in _task_targets(task_id):
+        await _publish(target, msg)
+
+async def broadcast_partial_subtitles(task_id: str, progress: int, start_index: int, subtitles: list):
+    """Push newly segmented subtitles; start_index is their stable position in the final list."""
+    for target in _task_targets(task_id):
+        partials = task_partials.setdefault(target, [])
+        partials[start_index:start_index + len(subtitles)] = subtitles
+    await broadcast_progress(
+        task_id, progress, "processing",
+        partial={"index": start_index, "subtitles": subtitles},
+    )
+
+# ---------------------------------------------------------------------------
+# Helper: single-flight coalescing of duplicate jobs
+# ---------------------------------------------------------------------------
+def _attach_to_inflight(dedupe_key: str, requested_task_id: Optional[str]) -> Optional[str]:
+    """
+    If a job with dedupe_key is already running, subscribe the requested task
+    id to its progress stream and return the id the client should listen on.
+    Returns None when no such job is in flight.
+    """
+    primary = inflight_jobs.get(dedupe_key)
+    if primary is None:
+        return None
+    if not requested_task_id or requested_task_id == primary:
+        return primary
+    task_aliases.setdefault(primary, set()).add(requested_task_id)
+    if primary in task_store:
+        task_store[requested_task_id] = {**task_store[primary], "_created_at": time.time()}
+    if primary in task_partials:
+        task_partials[requested_task_id] = list(task_partials[primary])
+    return requested_task_id
+
+
+def _export_owner(job_id: str) -> str:
+    """The task id that currently receives an export job's progress."""
+    return export_owners.get(job_id, job_id)
+
+
+def _export_job_id(task_id: str) -> str:
+    """The scheduler job id of the export owned by task_id."""
+    return next((job_id for job_id, owner in export_owners.items() if owner == task_id), task_id)
+
+
+def _finish_inflight(dedupe_key: str, task_id: str):
+    if inflight_jobs.get(dedupe_key) == task_id:
+        del inflight_jobs[dedupe_key]
+    for alias in task_aliases.pop(task_id, ()):
+        task_partials.pop(alias, None)
+
 # ---------------------------------------------------------------------------
 # WebSocket helper: connection loop with heartbeat
 # ---------------------------------------------------------------------------
@@ -342,6 +584,13 @@ async def _ws_progress_loop(websocket: WebSocket, task_id: str, label: str):
         if task_id in task_store:
             client_msg = {k: v for k, v in task_store[task_id].items() if not k.startswith("_")}
             await websocket.send_json(client_msg)
+            # Replay subtitles streamed before this client subscribed
+            if task_partials.get(task_id) and client_msg.get("status") == "processing":
+                await websocket.send_json({
+                    "progress": client_msg.get("progress", 0),
+                    "status": "processing",
+                    "partial": {"index": 0, "subtitles": task_partials[task_id]},
+                })
 
         # Keep connection alive with periodic heartbeat pings
         while True:
@@ -386,52 +635,383 @@ async def ws_export_progress(websocket: WebSocket, task_id: str):
 async def ws_process_progress(websocket: WebSocket, task_id: str):
     await _ws_progress_loop(websocket, task_id, "process")
 
+# ---------------------------------------------------------------------------
+# Ingest: probe + ASR audio extraction started as soon as an upload lands
+# ---------------------------------------------------------------------------
+async def _ingest(file_path: str) -> Optional[dict]:
+    """Probe metadata, hash and extract ASR audio for an uploaded file. None on failure."""
+    filename = os.path.basename(file_path)
+    started = time.time()
+    try:
+        info = await probe_media(file_path, content_hash_for(filename))
+        audio_hash, prepared = await asyncio.gather(
+            asyncio.to_thread(compute_audio_hash, file_path),
+            prepare_audio(file_path, extract_all=True, duration=info["duration"] or None, stream=True),
+        )
+    except Exception as e:
+        logger.warning("Ingest failed for %s, jobs will prepare on demand: %s", filename, e)
+        return None
+    logger.info(
+        "Ingest ready for %s in %.1fs (%d audio chunk(s))",
+        filename, time.time() - started, len(prepared["spans"]),
+    )
+    return {"info": info, "audio_hash": audio_hash, "audio": prepared}
+
+
+def _start_ingest(file_path: str):
+    filename = os.path.basename(file_path)
+    existing = ingest_tasks.get(filename)
+    # Content-addressed names: a running or successful ingest stays valid
+    if existing and not (existing.done() and (existing.cancelled() or existing.result() is None)):
+        return
+    _drop_ingest(filename)
+    ingest_tasks[filename] = asyncio.create_task(_ingest(file_path))
+    # Bound memory: forget the oldest prepared uploads
+    while len(ingest_tasks) > INGEST_MAX_ENTRIES:
+        _drop_ingest(next(iter(ingest_tasks)))
+
+
+def _drop_ingest(filename: str):
+    task = ingest_tasks.pop(filename, None)
+    if task and not task.done():
+        task.cancel()
+
+
+async def _get_ingest(filename: str) -> Optional[dict]:
+    """Await the file's ingest result if one was started (None if absent or failed)."""
+    task = ingest_tasks.get(filename)
+    if task is None:
+        return None
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if task.cancelled():
+            return None
+        raise
+
 # ---------------------------------------------------------------------------
 # Upload
 # ---------------------------------------------------------------------------
+def _validate_upload_extension(original_name: str) -> str:
+    """Return the lowercased extension or raise 422 if the type is not allowed."""
+    file_extension = os.path.splitext(original_name or "")[1].lower()
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"File type '{file_extension}' not allowed. Accepted: {', '.join(sorted(ALLOWED_EXTENSIONS))}",
+        )
+    return file_extension
+
+
+def _upload_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=422,
+        detail=f"File too large. Maximum size is {MAX_UPLOAD_SIZE // (1024 * 1024)} MB.",
+    )
+
+
+def content_hash_for(filename: str) -> Optional[str]:
+    """SHA-256 of an upload's bytes, recovered from its content-addressed name."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+        return stem
+    return None
+
+
+def _store_content_addressed(temp_path: str, digest: str, file_extension: str) -> str:
+    """
+    Move a fully written upload to <sha256><ext>. If identical bytes are already
+    stored, drop the new copy and add a reference to the existing file.
+    Returns the stored filename.
+    """
+    filename = f"{digest}{file_extension}"
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    now = time.time()
+    if os.path.exists(file_path):
+        os.remove(temp_path)
+        os.utime(file_path)
+        logger.info("Upload deduplicated: %s", filename)
+    else:
+        os.replace(temp_path, file_path)
+    upload_refs.setdefault(filename, {"count": 0, "last_ref": now})["last_ref"] = now
+    return filename
+
+
+def _acquire_upload(filename: Optional[str]):
+    """Record that a saved project uses filename, so cleanup keeps it."""
+    if filename:
+        upload_refs.setdefault(filename, {"count": 0, "last_ref": time.time()})["count"] += 1
+
+
+def _release_upload(filename: Optional[str]):
+    """
+    Drop a project's reference to filename. Once nothing references it the
+    file gets a fresh FILE_MAX_AGE_SECONDS before cleanup may remove it.
+    """
+    refs = upload_refs.get(filename) if filename else None
+    if refs:
+        refs["count"] = max(0, refs["count"] - 1)
+        refs["last_ref"] = time.time()
+
+
+async def load_upload_refs():
+    """Rebuild project reference counts from the database after a restart."""
+    upload_refs.clear()
+    for filename in await get_project_video_filenames():
+        _acquire_upload(filename)
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_and_hash(buffer, digest, chunk: bytes):
+    digest.update(chunk)
+    buffer.write(chunk)
+
+
+def _not_a_video() -> HTTPException:
+    return HTTPException(status_code=422, detail="File does not look like a decodable video")
+
+
+def _discard(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
 @app.post("/api/upload")
 @limiter.limit("10/minute")
 async def upload_video(request: Request, file: UploadFile = File(...)):
+    temp_path = None
     try:
         # Validate extension
-        file_extension = os.path.splitext(file.filename)[1].lower()
-        if file_extension not in ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=422,
-                detail=f"File type '{file_extension}' not allowed. Accepted: {', '.join(sorted(ALLOWED_EXTENSIONS))}",
-            )
+        file_extension = _validate_upload_extension(file.filename)
 
-        # Validate file size by reading in chunks
-        filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
+        # Validate file size by reading in chunks, hashing as we write.
+        # Disk writes and hashing run in a worker thread to keep the event loop free.
+        temp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}.upload")
+        digest = hashlib.sha256()
 
         total_size = 0
-        with open(file_path, "wb") as buffer:
+        sniffed = False
+        head = bytearray()
+        buffer = await asyncio.to_thread(open, temp_path, "wb")
+        try:
             while True:
                 chunk = await file.read(1024 * 1024)  # 1 MB chunks
+                if chunk:
+                    total_size += len(chunk)
+                    if total_size > MAX_UPLOAD_SIZE:
+                        raise _upload_too_large()
+                    await asyncio.to_thread(_write_and_hash, buffer, digest, chunk)
+                    if not sniffed and len(head) < SNIFF_BYTES:
+                        head.extend(chunk[:SNIFF_BYTES - len(head)])
+
+                # Reject non-video uploads from their first megabyte
+                if not sniffed and (len(head) >= SNIFF_BYTES or not chunk):
+                    sniffed = True
+                    container = sniff_container(bytes(head))
+                    if container is None:
+                        raise _not_a_video()
+                    await asyncio.to_thread(buffer.flush)
+                    if not await probe_partial_upload(temp_path, container):
+                        raise _not_a_video()
                 if not chunk:
                     break
-                total_size += len(chunk)
-                if total_size > MAX_UPLOAD_SIZE:
-                    buffer.close()
-                    os.remove(file_path)
-                    raise HTTPException(
-                        status_code=422,
-                        detail=f"File too large. Maximum size is {MAX_UPLOAD_SIZE // (1024 * 1024)} MB.",
-                    )
-                buffer.write(chunk)
+        finally:
+            await asyncio.to_thread(buffer.close)
 
+        filename = await asyncio.to_thread(_store_content_addressed, temp_path, digest.hexdigest(), file_extension)
+        file_path = os.path.join(UPLOAD_DIR, filename)
         logger.info("Uploaded file: %s (%d bytes)", filename, total_size)
+        _start_ingest(file_path)
         return {"filename": filename, "path": file_path}
     except HTTPException:
+        if temp_path:
+            _discard(temp_path)
         raise
     except Exception:
         logger.exception("Upload failed")
+        if temp_path:
+            _discard(temp_path)
         raise HTTPException(status_code=500, detail="Upload failed")
 
+# ---------------------------------------------------------------------------
+# Resumable chunked upload: create session -> PUT chunks (any order, in
+# parallel) -> complete. Chunks are written in place into a preallocated
+# .part file, so assembly needs no second copy.
+# ---------------------------------------------------------------------------
+def _index_ranges(indices) -> List[List[int]]:
+    """Compress chunk indices into sorted [start, end) ranges."""
+    ranges: List[List[int]] = []
+    for i in sorted(indices):
+        if ranges and ranges[-1][1] == i:
+            ranges[-1][1] = i + 1
+        else:
+            ranges.append([i, i + 1])
+    return ranges
+
+
+def _get_upload_session(upload_id: str) -> dict:
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+def _upload_status(upload_id: str, session: dict) -> dict:
+    received = session["received"]
+    return {
+        "upload_id": upload_id,
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "total_chunks": session["total_chunks"],
+        "received": _index_ranges(received),
+        "bytes_received": sum(_chunk_length(session, i) for i in received),
+        "complete": len(received) == session["total_chunks"],
+    }
+
+
+def _chunk_length(session: dict, index: int) -> int:
+    start = index * session["chunk_size"]
+    return min(session["chunk_size"], session["size"] - start)
+
+
+def _write_chunk(part_path: str, offset: int, data: bytes):
+    with open(part_path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+@app.post("/api/uploads")
+@limiter.limit("10/minute")
+async def create_upload(request: Request, body: CreateUploadRequest):
+    file_extension = _validate_upload_extension(body.filename)
+    if body.size > MAX_UPLOAD_SIZE:
+        raise _upload_too_large()
+
+    upload_id = str(uuid.uuid4())
+    part_path = os.path.join(UPLOAD_DIR, f"{upload_id}.part")
+    with open(part_path, "wb") as f:
+        f.truncate(body.size)
+
+    upload_sessions[upload_id] = {
+        "extension": file_extension,
+        "size": body.size,
+        "chunk_size": body.chunk_size,
+        "total_chunks": -(-body.size // body.chunk_size),
+        "received": set(),
+        "part_path": part_path,
+        "_created_at": time.time(),
+    }
+    logger.info("Created upload session %s (%d bytes, %s)", upload_id, body.size, file_extension)
+    return _upload_status(upload_id, upload_sessions[upload_id])
+
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    return _upload_status(upload_id, _get_upload_session(upload_id))
+
+
+@app.put("/api/uploads/{upload_id}/chunks/{index}")
+@limiter.limit("600/minute")
+async def upload_chunk(request: Request, upload_id: str, index: int):
+    session = _get_upload_session(upload_id)
+    if not 0 <= index < session["total_chunks"]:
+        raise HTTPException(status_code=422, detail="Chunk index out of range")
+
+    expected_length = _chunk_length(session, index)
+    data = bytearray()
+    async for block in request.stream():
+        data.extend(block)
+        if len(data) > expected_length:
+            raise HTTPException(status_code=422, detail="Chunk larger than expected")
+    if len(data) != expected_length:
+        raise HTTPException(status_code=422, detail=f"Chunk must be {expected_length} bytes, got {len(data)}")
+
+    checksum = request.headers.get("x-chunk-sha256", "").strip().lower()
+    if not checksum:
+        raise HTTPException(status_code=422, detail="Missing X-Chunk-SHA256 header")
+    if hashlib.sha256(data).hexdigest() != checksum:
+        raise HTTPException(status_code=422, detail="Chunk checksum mismatch")
+    if index == 0 and sniff_container(bytes(data[:SNIFF_BYTES])) is None:
+        raise _not_a_video()
+
+    offset = index * session["chunk_size"]
+    await asyncio.to_thread(_write_chunk, session["part_path"], offset, bytes(data))
+    session["received"].add(index)
+    return {"index": index, "received": len(session["received"]), "total_chunks": session["total_chunks"]}
+
+
+@app.post("/api/uploads/{upload_id}/complete")
+@limiter.limit("10/minute")
+async def complete_upload(request: Request, upload_id: str):
+    session = _get_upload_session(upload_id)
+    missing = session["total_chunks"] - len(session["received"])
+    if missing:
+        raise HTTPException(status_code=409, detail=f"Upload incomplete: {missing} chunk(s) missing")
+
+    del upload_sessions[upload_id]
+    # Chunks arrive out of order, so the content hash is taken over the assembled file
+    digest = await asyncio.to_thread(_hash_file, session["part_path"])
+    filename = _store_content_addressed(session["part_path"], digest, session["extension"])
+    file_path = os.path.join(UPLOAD_DIR, filename)
+
+    logger.info("Assembled resumable upload %s -> %s (%d bytes)", upload_id, filename, session["size"])
+    _start_ingest(file_path)
+    return {"filename": filename, "path": file_path}
+
+
+@app.delete("/api/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    session = upload_sessions.pop(upload_id, None)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if os.path.exists(session["part_path"]):
+        os.remove(session["part_path"])
+    return {"status": "aborted"}
+
 # ---------------------------------------------------------------------------
 # Process (transcription)
 # ---------------------------------------------------------------------------
+async def _stream_chunk_subtitles(task_id: str, chunk_queue: asyncio.Queue, transcription: asyncio.Future) -> list:
+    """
+    Segment transcribed chunks in source order as they arrive and push each
+    batch over the progress socket. Returns the concatenated subtitle list,
+    whose indices match the ones already streamed.
+    """
+    pending = {}
+    next_index = 0
+    total = None
+    subtitles = []
+    while total is None or next_index < total:
+        getter = asyncio.ensure_future(chunk_queue.get())
+        done, _ = await asyncio.wait({getter, transcription}, return_when=asyncio.FIRST_COMPLETED)
+        if getter not in done:
+            getter.cancel()
+            transcription.result()  # re-raise transcription errors
+            if chunk_queue.empty():
+                break
+            continue
+
+        index, total, chunk_words = getter.result()
+        pending[index] = chunk_words
+        while next_index in pending:
+            segments = segment_subtitles(pending.pop(next_index))
+            start_index = len(subtitles)
+            subtitles.extend(segments)
+            next_index += 1
+            progress = 10 + int(70 * next_index / total)
+            if segments:
+                await broadcast_partial_subtitles(task_id, progress, start_index, segments)
+            else:
+                await broadcast_progress(task_id, progress, "processing")
+    return subtitles
+
 @app.post("/api/process")
 @limiter.limit("5/minute")
 async def process_video(request: Request, body: ProcessRequest):
@@ -439,9 +1019,18 @@ async def process_video(request: Request, body: ProcessRequest):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
 
-    task_id = body.task_id or str(uuid.uuid4())
     safe_filename = os.path.basename(body.filename)
 
+    # Coalesce with an identical transcription that is already running
+    dedupe_key = f"process:{safe_filename}:{body.language or ''}"
+    attached_id = _attach_to_inflight(dedupe_key, body.task_id)
+    if attached_id:
+        logger.info("Process request for %s joined in-flight task %s", safe_filename, inflight_jobs[dedupe_key])
+        return {"task_id": attached_id, "status": "processing", "deduplicated": True}
+
+    task_id = body.task_id or str(uuid.uuid4())
+    inflight_jobs[dedupe_key] = task_id
+
     # Mark file as active to prevent cleanup race
     active_files.add(safe_filename)
 
@@ -449,26 +1038,60 @@ async def process_video(request: Request, body: ProcessRequest):
     async def _run():
         try:
             await broadcast_progress(task_id, 0, "processing")
-            loop = asyncio.get_event_loop()
 
-            logger.info("Task %s: Starting transcription for %s (language=%s)", task_id, body.filename, body.language)
-            await broadcast_progress(task_id, 10, "processing")
+            # Start from audio prepared at upload time when available
+            ingest = await _get_ingest(safe_filename)
 
-            words = await loop.run_in_executor(
-                None, transcribe_audio, file_path, body.language
-            )
-            logger.info("Task %s: Transcription complete, %d words extracted", task_id, len(words))
+            # Look up the transcription cache by decoded-audio hash
+            cache_key = None
+            words = None
+            try:
+                audio_hash = ingest["audio_hash"] if ingest else await asyncio.to_thread(compute_audio_hash, file_path)
+                cache_key = transcription_cache_key(audio_hash, body.language, get_engine().model_id)
+                words = await get_cached_transcription(cache_key)
+            except Exception as e:
+                logger.warning("Task %s: Transcription cache unavailable: %s", task_id, e)
+
+            if words is not None:
+                logger.info("Task %s: Transcription cache hit (%d words)", task_id, len(words))
+                await broadcast_progress(task_id, 80, "processing", cache="hit")
+                subtitles = segment_subtitles(words)
+            else:
+                logger.info("Task %s: Starting transcription for %s (language=%s)", task_id, body.filename, body.language)
+                await broadcast_progress(task_id, 10, "processing", cache="miss")
+
+                # Chunks are segmented and streamed to the client as they finish
+                chunk_queue: asyncio.Queue = asyncio.Queue()
+
+                async def on_chunk(index, total, chunk_words):
+                    chunk_queue.put_nowait((index, total, chunk_words))
+
+                if ingest:
+                    prepared = ingest["audio"]
+                else:
+                    info = await probe_media(file_path, content_hash_for(safe_filename))
+                    prepared = await prepare_audio(file_path, duration=info["duration"] or None, stream=True)
+
+                transcription = asyncio.ensure_future(
+                    transcribe_audio(file_path, body.language, on_chunk=on_chunk, prepared=prepared)
+                )
+                subtitles = await _stream_chunk_subtitles(task_id, chunk_queue, transcription)
+                words = await transcription
+                logger.info("Task %s: Transcription complete, %d words extracted", task_id, len(words))
+
+                if cache_key:
+                    try:
+                        await save_cached_transcription(cache_key, words)
+                    except Exception as e:
+                        logger.warning("Task %s: Failed to store transcription in cache: %s", task_id, e)
 
             await broadcast_progress(task_id, 80, "processing")
-            subtitles = segment_subtitles(words)
             logger.info("Task %s: Segmentation complete, %d subtitle segments", task_id, len(subtitles))
 
             # AI text correction
             await broadcast_progress(task_id, 85, "processing")
             try:
-                subtitles = await loop.run_in_executor(
-                    None, correct_subtitles, subtitles, body.language
-                )
+                subtitles = await correct_subtitles(subtitles, body.language)
                 logger.info("Task %s: Text correction complete", task_id)
             except Exception as e:
                 logger.warning("Task %s: Text correction failed, using originals: %s", task_id, e)
@@ -481,6 +1104,8 @@ async def process_video(request: Request, body: ProcessRequest):
             await broadcast_progress(task_id, 0, "error", {"detail": str(e)})
         finally:
             active_files.discard(safe_filename)
+            task_partials.pop(task_id, None)
+            _finish_inflight(dedupe_key, task_id)
 
     asyncio.create_task(_run())
 
@@ -506,6 +1131,70 @@ async def get_font(filename: str):
         raise HTTPException(status_code=404, detail="Font not found")
     return FileResponse(path)
 
+# ---------------------------------------------------------------------------
+# Render cache: finished exports reused for identical requests
+# ---------------------------------------------------------------------------
+async def _render_cache_key(
+    filename: str, ass_hash: str, font_path: Optional[str], family_name: str, encoder: str,
+) -> Optional[str]:
+    """None when the source isn't content-addressed (its bytes are unknown)."""
+    source_hash = content_hash_for(filename)
+    if not source_hash:
+        return None
+    try:
+        font = await asyncio.to_thread(font_digest, font_path) if font_path else f"system:{family_name}"
+    except OSError:
+        return None
+    return render_cache_key(source_hash, ass_hash, [font], encoder)
+
+
+def _write_ass_file(subtitles: List[Dict], styles: Dict, width: int, height: int) -> Tuple[str, str]:
+    """Stream an ASS document into UPLOAD_DIR; returns (filename, sha256 of its content)."""
+    ass_filename = f"{uuid.uuid4()}.ass"
+    with open(os.path.join(UPLOAD_DIR, ass_filename), "w", encoding="utf-8") as f:
+        ass_hash = write_ass(f, subtitles, styles, width, height)
+    return ass_filename, ass_hash
+
+
+def _remove_upload_files(filenames: List[str]):
+    for filename in filenames:
+        active_files.discard(filename)
+        path = os.path.join(UPLOAD_DIR, filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def _lookup_cached_render(cache_key: str) -> Optional[str]:
+    try:
+        filename = await get_cached_render(cache_key)
+    except Exception as e:
+        logger.warning("Render cache lookup failed: %s", e)
+        return None
+    if filename and not os.path.isfile(os.path.join(UPLOAD_DIR, filename)):
+        await delete_cached_render(cache_key)
+        return None
+    return filename
+
+
+async def _store_cached_render(cache_key: str, filename: str):
+    try:
+        size = os.path.getsize(os.path.join(UPLOAD_DIR, filename))
+        await save_cached_render(cache_key, filename, size)
+        await _evict_render_cache()
+    except Exception as e:
+        logger.warning("Failed to store export in render cache: %s", e)
+
+
+async def _evict_render_cache():
+    """Apply the render cache's LRU/disk quota, never touching files in use."""
+    evicted = await evict_render_cache(protected=set(active_files))
+    for filename in evicted:
+        path = os.path.join(UPLOAD_DIR, filename)
+        if os.path.isfile(path):
+            os.remove(path)
+    if evicted:
+        logger.info("Render cache: evicted %d export(s)", len(evicted))
+
 # ---------------------------------------------------------------------------
 # Export
 # ---------------------------------------------------------------------------
@@ -515,68 +1204,332 @@ async def export_video(request: Request, body: ExportRequest):
     input_path = _safe_upload_path(body.filename)
     if not os.path.exists(input_path):
         raise HTTPException(status_code=404, detail="Original video not found")
+    if body.targets and body.mode == "soft":
+        raise HTTPException(status_code=400, detail="Multiple targets require burn mode")
+
+    # Coalesce with an identical export that is already encoding
+    payload = json.dumps(body.model_dump(exclude={"task_id", "priority"}), sort_keys=True)
+    dedupe_key = "export:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    attached_id = _attach_to_inflight(dedupe_key, body.task_id)
+    if attached_id:
+        primary = inflight_jobs[dedupe_key]
+        logger.info("Export request joined in-flight task %s", primary)
+        status = task_store.get(primary, {}).get("status", "encoding")
+        return {"task_id": attached_id, "status": status, "deduplicated": True}
 
     task_id = body.task_id or str(uuid.uuid4())
+    inflight_jobs[dedupe_key] = task_id
     safe_filename = os.path.basename(body.filename)
 
     # Mark input file as active to prevent cleanup race
     active_files.add(safe_filename)
+    ass_filenames = []
 
-    async def _run():
-        output_filename = None
-        ass_filename = None
-        try:
-            await broadcast_progress(task_id, 0, "encoding")
-
-            info = get_video_info(input_path)
-            duration = info.get("duration", 0)
-
-            ass_filename = f"{uuid.uuid4()}.ass"
-            ass_path = os.path.join(UPLOAD_DIR, ass_filename)
+    try:
+        # Cached after ingest; the duration also sizes the job for queue estimates
+        info = await probe_media(input_path, content_hash_for(safe_filename))
+        duration = info.get("duration", 0)
+
+        # Convert validated SubtitleItem models back to dicts for ASS generator
+        subtitles_dicts = [s.model_dump() for s in body.subtitles]
+        styles_dict = body.styles.model_dump()
+
+        # Resolve font display name to internal family name for FFmpeg/libass
+        family_name, font_path = get_font_info_by_name(styles_dict.get("fontFamily", "Arial"))
+        styles_dict["fontFamily"] = family_name
+        fontsdir = os.path.dirname(font_path) if font_path else None
+        soft = body.mode == "soft"
+        if soft and body.container == "mp4":
+            # mov_text has no styling: per-word karaoke events would only flicker
+            styles_dict["karaokeEnabled"] = False
+
+        cache_key = None
+        cached_filename = None
+        # ASS documents are streamed straight to disk; only their digests stay in memory
+        if body.targets:
+            # Each output gets positioning and sizes scaled to its own frame
+            for t in body.targets:
+                target_styles = scale_styles_for_target(styles_dict, info["width"], info["height"], t.width, t.height, t.fit)
+                ass_filename, _ = await asyncio.to_thread(
+                    _write_ass_file, subtitles_dicts, target_styles, t.width, t.height,
+                )
+                ass_filenames.append(ass_filename)
+                active_files.add(ass_filename)
+        else:
+            ass_filename, ass_hash = await asyncio.to_thread(
+                _write_ass_file, subtitles_dicts, styles_dict, info["width"], info["height"],
+            )
+            ass_filenames.append(ass_filename)
             active_files.add(ass_filename)
 
-            # Convert validated SubtitleItem models back to dicts for ASS generator
-            subtitles_dicts = [s.model_dump() for s in body.subtitles]
-            styles_dict = body.styles.model_dump()
-
-            # Resolve font display name to internal family name for FFmpeg/libass
-            family_name, font_path = get_font_info_by_name(styles_dict.get("fontFamily", "Arial"))
-            styles_dict["fontFamily"] = family_name
-            fontsdir = os.path.dirname(font_path) if font_path else None
-
-            ass_content = generate_ass_content(subtitles_dicts, styles_dict, info["width"], info["height"])
-
-            with open(ass_path, "w", encoding="utf-8") as f:
-                f.write(ass_content)
+            # An identical earlier export completes immediately, without queueing
+            cache_key = await _render_cache_key(
+                safe_filename, ass_hash, font_path, family_name,
+                encoder_fingerprint(body.mode, body.container),
+            )
+            cached_filename = await _lookup_cached_render(cache_key) if cache_key else None
+    except Exception:
+        active_files.discard(safe_filename)
+        _remove_upload_files(ass_filenames)
+        _finish_inflight(dedupe_key, task_id)
+        logger.exception("Export preparation failed for task %s", task_id)
+        raise HTTPException(status_code=500, detail="Failed to prepare export")
+
+    if cached_filename:
+        logger.info("Export task %s: render cache hit (%s)", task_id, cached_filename)
+        await broadcast_progress(task_id, 100, "complete", {"filename": cached_filename}, cache="hit")
+        active_files.discard(safe_filename)
+        _remove_upload_files(ass_filenames)
+        _finish_inflight(dedupe_key, task_id)
+        return {"task_id": task_id, "status": "complete", "cached": True}
+
+    def _release():
+        owner = export_owners.pop(task_id, task_id)
+        export_releases.pop(owner, None)
+        active_files.discard(safe_filename)
+        _remove_upload_files(ass_filenames)
+        _finish_inflight(dedupe_key, owner)
+
+    export_releases[task_id] = _release
 
-            output_filename = f"exported_{uuid.uuid4()}.mp4"
-            output_path = os.path.join(UPLOAD_DIR, output_filename)
-            active_files.add(output_filename)
+    async def _run():
+        output_filenames = []
+        final_telemetry = {}
+        try:
+            await broadcast_progress(_export_owner(task_id), 0, "encoding")
+
+            ass_paths = [os.path.join(UPLOAD_DIR, name) for name in ass_filenames]
+            extension = body.container if soft else "mp4"
+            output_filenames = [f"exported_{uuid.uuid4()}.{extension}" for _ in ass_filenames]
+            output_paths = [os.path.join(UPLOAD_DIR, name) for name in output_filenames]
+            active_files.update(output_filenames)
+
+            async def progress_cb(progress: int, telemetry: Optional[Dict] = None):
+                # fps, speed, bitrate, output size and a smoothed ETA for the encode
+                if telemetry:
+                    final_telemetry.update(telemetry)
+                    await broadcast_progress(_export_owner(task_id), progress, "encoding", telemetry=telemetry)
+                else:
+                    await broadcast_progress(_export_owner(task_id), progress, "encoding")
+
+            if soft:
+                await mux_subtitles(
+                    input_path, output_paths[0], ass_paths[0], duration, progress_cb, font_path=font_path,
+                )
+            else:
+                # Split cores across the encodes the scheduler is about to run
+                expected_jobs = min(export_scheduler.workers, export_scheduler.running + export_scheduler.queued)
+                with thread_budget(task_id, expected_jobs) as threads:
+                    if body.targets:
+                        outputs = [
+                            {
+                                "path": path, "ass_path": ass_path, "width": t.width, "height": t.height,
+                                "fit": t.fit, "video_bitrate": t.video_bitrate,
+                            }
+                            for path, ass_path, t in zip(output_paths, ass_paths, body.targets)
+                        ]
+                        await burn_subtitles_multi(
+                            input_path, outputs, duration, progress_cb, fontsdir=fontsdir, threads=threads,
+                        )
+                    else:
+                        # Smart (copy untouched GOPs), segmented-parallel or single encode
+                        await render_subtitles(
+                            input_path, output_paths[0], ass_paths[0], info, progress_cb,
+                            fontsdir=fontsdir, threads=threads,
+                        )
+
+            if cache_key:
+                await _store_cached_render(cache_key, output_filenames[0])
+
+            result = {"filename": output_filenames[0]}
+            if body.targets:
+                result["filenames"] = output_filenames
+                result["outputs"] = [
+                    {"filename": name, "width": t.width, "height": t.height, "label": t.label}
+                    for name, t in zip(output_filenames, body.targets)
+                ]
+            extra = {"telemetry": final_telemetry} if final_telemetry else {}
+            await broadcast_progress(_export_owner(task_id), 100, "complete", result, **extra)
+
+        except asyncio.CancelledError:
+            # DELETE /api/export/{task_id}: ffmpeg is already killed, drop partial output
+            logger.info("Export task %s cancelled", task_id)
+            _remove_upload_files(output_filenames)
+            await broadcast_progress(_export_owner(task_id), 0, "cancelled")
+            raise
+        except Exception as e:
+            logger.exception("Export failed for task %s", task_id)
+            await broadcast_progress(_export_owner(task_id), 0, "error", {"detail": str(e)})
+        finally:
+            _release()
+            active_files.difference_update(output_filenames)
+            export_tasks.pop(task_id, None)
 
-            async def progress_cb(progress: int):
-                await broadcast_progress(task_id, progress, "encoding")
+    if soft:
+        # A stream copy is I/O-bound: don't make it wait behind queued encodes
+        export_tasks[task_id] = asyncio.create_task(_run())
+        return {"task_id": task_id, "status": "encoding"}
 
-            await burn_subtitles_async(input_path, output_path, ass_path, duration, progress_cb, fontsdir=fontsdir)
+    async def on_queue_update(position: int, estimated_start: float):
+        await broadcast_progress(
+            task_id, 0, "queued",
+            queue_position=position, estimated_start_seconds=estimated_start,
+        )
 
-            # Clean up ASS file
-            if os.path.exists(ass_path):
-                os.remove(ass_path)
+    try:
+        started = await export_scheduler.submit(
+            task_id, _run, cost=(duration or 1.0) * len(ass_filenames), priority=body.priority,
+            on_queue_update=on_queue_update,
+        )
+    except QueueFullError:
+        _release()
+        raise HTTPException(status_code=503, detail="Export queue is full. Please try again later.")
+
+    if started:
+        return {"task_id": task_id, "status": "encoding"}
+    return {
+        "task_id": task_id,
+        "status": "queued",
+        "queue_position": task_store[task_id].get("queue_position"),
+        "estimated_start_seconds": task_store[task_id].get("estimated_start_seconds"),
+    }
+
+def _promote_export(job_id: str, owner: str) -> str:
+    """
+    Make one of owner's coalesced duplicates the owner of export job_id: it
+    inherits the in-flight entry, the remaining duplicates and the release.
+    Returns the new owner's task id.
+    """
+    aliases = task_aliases.pop(owner)
+    new_owner = min(aliases)
+    aliases.discard(new_owner)
+    if aliases:
+        task_aliases[new_owner] = aliases
+    for dedupe_key, task_id in inflight_jobs.items():
+        if task_id == owner:
+            inflight_jobs[dedupe_key] = new_owner
+    export_releases[new_owner] = export_releases.pop(owner)
+    export_owners[job_id] = new_owner
+    return new_owner
+
+@app.delete("/api/export/{task_id}")
+@limiter.limit("30/minute")
+async def cancel_export(request: Request, task_id: str):
+    """Stop a queued or running export, killing its ffmpeg processes and freeing its files."""
+    # A coalesced duplicate only stops listening; the shared encode carries on
+    for aliases in task_aliases.values():
+        if task_id in aliases:
+            aliases.discard(task_id)
+            await _publish(task_id, {"progress": 0, "status": "cancelled"})
+            return {"task_id": task_id, "status": "cancelled"}
+
+    job_id = _export_job_id(task_id)
+    if task_aliases.get(task_id) and task_id in export_releases:
+        # Duplicates still want this encode: hand it to one of them, detach only the caller
+        new_owner = _promote_export(job_id, task_id)
+        await _publish(task_id, {"progress": 0, "status": "cancelled"})
+        logger.info("Export task %s cancelled; %s now owns job %s", task_id, new_owner, job_id)
+        return {"task_id": task_id, "status": "cancelled"}
+
+    state = await export_scheduler.cancel(job_id)
+    if state is None and job_id in export_tasks:
+        task = export_tasks[job_id]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        state = "running"
+    if state is None:
+        raise HTTPException(status_code=404, detail="No queued or running export with this id")
+    if state == "queued":
+        # Never started, so _run's cleanup never runs
+        await broadcast_progress(task_id, 0, "cancelled")
+        release = export_releases.get(task_id)
+        if release:
+            release()
+    logger.info("Export task %s cancelled (%s)", task_id, state)
+    return {"task_id": task_id, "status": "cancelled"}
+
+@app.get("/api/export/stats")
+@limiter.limit("30/minute")
+async def export_stats(request: Request):
+    """Export queue depth and per-encode thread allocations."""
+    return {"queue": export_scheduler.stats(), "threads": thread_budget_stats()}
 
-            await broadcast_progress(task_id, 100, "complete", {"filename": output_filename})
+# ---------------------------------------------------------------------------
+# Preview
+# ---------------------------------------------------------------------------
+@app.post("/api/preview")
+@limiter.limit("30/minute")
+async def preview_export(request: Request, body: PreviewRequest):
+    """
+    Render a few seconds around the playhead at preview resolution and return
+    the MP4, so a style change can be checked without a full export.
+    """
+    input_path = _safe_upload_path(body.filename)
+    if not os.path.exists(input_path):
+        raise HTTPException(status_code=404, detail="Original video not found")
+    safe_filename = os.path.basename(body.filename)
 
-        except Exception as e:
-            logger.exception("Export failed for task %s", task_id)
-            await broadcast_progress(task_id, 0, "error", {"detail": str(e)})
-        finally:
-            active_files.discard(safe_filename)
-            if ass_filename:
-                active_files.discard(ass_filename)
-            if output_filename:
-                active_files.discard(output_filename)
+    info = await probe_media(input_path, content_hash_for(safe_filename))
+    # probe_media falls back to bare defaults (no stream fields) when ffprobe fails;
+    # a preview at guessed dimensions would not match the export
+    if "codec" not in info:
+        logger.warning("Preview probe failed for %s", safe_filename)
+        raise HTTPException(status_code=500, detail="Failed to read video for preview")
+    duration = body.duration
+    if info.get("duration"):
+        if body.start >= info["duration"]:
+            raise HTTPException(status_code=400, detail="Preview window starts after the end of the video")
+        duration = min(duration, info["duration"] - body.start)
+    width, height = preview_size(info["width"], info["height"])
+
+    styles_dict = body.styles.model_dump()
+    family_name, font_path = get_font_info_by_name(styles_dict.get("fontFamily", "Arial"))
+    styles_dict["fontFamily"] = family_name
+    fontsdir = os.path.dirname(font_path) if font_path else None
+    ass_content = preview_ass_content(
+        [s.model_dump() for s in body.subtitles], styles_dict,
+        info["width"], info["height"], width, height, body.start, duration,
+    )
 
-    asyncio.create_task(_run())
+    # Cached by source, window, exact ASS and font, like full exports
+    ass_hash = hashlib.sha256(ass_content.encode("utf-8")).hexdigest()
+    cache_key = await _render_cache_key(
+        safe_filename, ass_hash, font_path, family_name, preview_encoder(width, height, body.start, duration),
+    )
+    cached_filename = await _lookup_cached_render(cache_key) if cache_key else None
+    if cached_filename:
+        return FileResponse(
+            os.path.join(UPLOAD_DIR, cached_filename), media_type="video/mp4", headers={"X-Preview-Cache": "hit"},
+        )
+
+    ass_filename = f"{uuid.uuid4()}.ass"
+    output_filename = f"preview_{uuid.uuid4()}.mp4"
+    output_path = os.path.join(UPLOAD_DIR, output_filename)
+    active_files.update((safe_filename, ass_filename, output_filename))
+    try:
+        ass_path = os.path.join(UPLOAD_DIR, ass_filename)
+        with open(ass_path, "w", encoding="utf-8") as f:
+            f.write(ass_content)
+        async with preview_slots:
+            # Share cores with the exports the scheduler is running or about to start
+            expected_jobs = min(export_scheduler.workers, export_scheduler.running + export_scheduler.queued) + 1
+            with thread_budget(output_filename, expected_jobs) as threads:
+                await render_preview(
+                    input_path, output_path, ass_path, body.start, duration, width, height,
+                    fontsdir=fontsdir, threads=threads,
+                )
+    except Exception:
+        logger.exception("Preview render failed for %s", safe_filename)
+        _remove_upload_files([output_filename])
+        raise HTTPException(status_code=500, detail="Failed to render preview")
+    finally:
+        active_files.discard(safe_filename)
+        _remove_upload_files([ass_filename])
 
-    return {"task_id": task_id, "status": "encoding"}
+    if cache_key:
+        await _store_cached_render(cache_key, output_filename)
+    active_files.discard(output_filename)
+    return FileResponse(output_path, media_type="video/mp4", headers={"X-Preview-Cache": "miss"})
 
 # ---------------------------------------------------------------------------
 # Download
@@ -586,6 +1539,8 @@ async def download_video(filename: str):
     path = _safe_upload_path(filename)
     if not os.path.exists(path):
         raise HTTPException(status_code=404, detail="File not found")
+    if path.lower().endswith(".mkv"):
+        return FileResponse(path, filename="reels_subtitles.mkv", media_type="video/x-matroska")
     return FileResponse(path, filename="reels_subtitles.mp4", media_type="video/mp4")
 
 # ---------------------------------------------------------------------------
@@ -594,6 +1549,7 @@ async def download_video(filename: str):
 @app.post("/api/projects")
 async def create_or_update_project(request: SaveProjectRequest):
     project_id = request.id or str(uuid.uuid4())
+    previous = await get_project(project_id) if request.id else None
     subtitles_dicts = [s.model_dump() for s in request.subtitles] if request.subtitles else []
     styles_dict = request.styles.model_dump() if request.styles else {}
     await save_project(
@@ -601,6 +1557,10 @@ async def create_or_update_project(request: SaveProjectRequest):
         subtitles_dicts, styles_dict, request.language,
         request.duration, request.width, request.height
     )
+    previous_filename = previous["video_filename"] if previous else None
+    if previous_filename != request.video_filename:
+        _acquire_upload(request.video_filename)
+        _release_upload(previous_filename)
     logger.info("Saved project: %s (%s)", project_id, request.name)
     return {"id": project_id, "status": "saved"}
 
@@ -620,7 +1580,10 @@ async def get_project_by_id(request: Request, project_id: str):
 @app.delete("/api/projects/{project_id}")
 @limiter.limit("10/minute")
 async def delete_project_by_id(request: Request, project_id: str):
+    project = await get_project(project_id)
     await delete_project(project_id)
+    if project:
+        _release_upload(project["video_filename"])
     return {"status": "deleted"}
 
 # ---------------------------------------------------------------------------
@@ -22,6 +22,8 @@ from main import app
 async def client():
     """Async HTTP client for testing FastAPI endpoints."""
     await db_module.init_db()
+    # Each test starts with fresh rate-limit windows
+    app.state.limiter.reset()
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         yield ac
@@ -37,6 +39,9 @@ async def db():
     async with aiosqlite.connect(db_module.DB_PATH) as conn:
         await conn.execute("DELETE FROM projects")
         await conn.execute("DELETE FROM settings")
+        await conn.execute("DELETE FROM transcription_cache")
+        await conn.execute("DELETE FROM probe_cache")
+        await conn.execute("DELETE FROM render_cache")
         await conn.commit()
 
 
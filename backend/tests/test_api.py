@@ -1,14 +1,18 @@
 """Tests for FastAPI API endpoints in main.py"""
+import asyncio
 import os
 import pytest
 
+# Minimal ISO BMFF header so uploads pass container sniffing
+MP4_HEAD = b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2"
+
 
 @pytest.mark.asyncio
 class TestUploadEndpoint:
     async def test_upload_valid_mp4(self, client, upload_dir):
         # Create a dummy mp4 file
         test_file = upload_dir / "test.mp4"
-        test_file.write_bytes(b"\x00" * 1024)
+        test_file.write_bytes(MP4_HEAD + b"\x00" * 1024)
 
         with open(test_file, "rb") as f:
             response = await client.post(
@@ -20,6 +24,52 @@ class TestUploadEndpoint:
         assert "filename" in data
         assert data["filename"].endswith(".mp4")
 
+    async def test_upload_is_content_addressed(self, client, upload_dir):
+        import hashlib
+        import main
+
+        payload = MP4_HEAD + b"\x01\x02" * 700
+        first = await client.post("/api/upload", files={"file": ("a.mp4", payload, "video/mp4")})
+        second = await client.post("/api/upload", files={"file": ("b.mp4", payload, "video/mp4")})
+        filename = first.json()["filename"]
+
+        assert filename == f"{hashlib.sha256(payload).hexdigest()}.mp4"
+        assert second.json()["filename"] == filename
+        # Uploads only refresh the expiry; saved projects hold the references
+        assert main.upload_refs[filename]["count"] == 0
+        assert main.upload_refs[filename]["last_ref"] > 0
+        assert main.content_hash_for(filename) == hashlib.sha256(payload).hexdigest()
+        # Only one stored copy, no leftover temp files
+        assert sorted(p.name for p in upload_dir.iterdir()) == [filename]
+        main._drop_ingest(filename)
+        main.upload_refs.pop(filename, None)
+
+    async def test_upload_starts_ingest(self, client, upload_dir):
+        import main
+
+        response = await client.post(
+            "/api/upload",
+            files={"file": ("clip.mp4", MP4_HEAD + b"\x00" * 1024, "video/mp4")},
+        )
+        filename = response.json()["filename"]
+        assert filename in main.ingest_tasks
+        # Undecodable input: ingest fails softly and jobs fall back to on-demand work
+        assert await main._get_ingest(filename) is None
+        main._drop_ingest(filename)
+
+    async def test_get_ingest_without_upload(self):
+        import main
+        assert await main._get_ingest("never-uploaded.mp4") is None
+
+    async def test_upload_rejects_non_video_bytes(self, client, upload_dir):
+        response = await client.post(
+            "/api/upload",
+            files={"file": ("fake.mp4", b"<html>not a video</html>" * 100, "video/mp4")},
+        )
+        assert response.status_code == 422
+        # The partial upload is discarded
+        assert list(upload_dir.iterdir()) == []
+
     async def test_upload_invalid_extension(self, client, upload_dir):
         response = await client.post(
             "/api/upload",
@@ -32,6 +82,83 @@ class TestUploadEndpoint:
         assert response.status_code == 422
 
 
+@pytest.mark.asyncio
+class TestResumableUpload:
+    CHUNK = 256 * 1024
+
+    async def _create(self, client, size, filename="big.mp4"):
+        response = await client.post(
+            "/api/uploads",
+            json={"filename": filename, "size": size, "chunk_size": self.CHUNK},
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    async def _put(self, client, upload_id, index, data, checksum=None):
+        import hashlib
+        return await client.put(
+            f"/api/uploads/{upload_id}/chunks/{index}",
+            content=data,
+            headers={"X-Chunk-SHA256": checksum or hashlib.sha256(data).hexdigest()},
+        )
+
+    async def test_out_of_order_chunks_assemble(self, client, upload_dir):
+        import hashlib
+        payload = MP4_HEAD + bytes(range(256)) * 2049  # 3 chunks, last one partial
+        session = await self._create(client, len(payload))
+        upload_id = session["upload_id"]
+        assert session["total_chunks"] == 3
+
+        chunks = [payload[i:i + self.CHUNK] for i in range(0, len(payload), self.CHUNK)]
+        for index in (2, 0):
+            assert (await self._put(client, upload_id, index, chunks[index])).status_code == 200
+
+        status = (await client.get(f"/api/uploads/{upload_id}")).json()
+        assert status["received"] == [[0, 1], [2, 3]]
+        assert status["complete"] is False
+
+        incomplete = await client.post(f"/api/uploads/{upload_id}/complete")
+        assert incomplete.status_code == 409
+
+        assert (await self._put(client, upload_id, 1, chunks[1])).status_code == 200
+        response = await client.post(f"/api/uploads/{upload_id}/complete")
+        assert response.status_code == 200
+        filename = response.json()["filename"]
+        assert filename == hashlib.sha256(payload).hexdigest() + ".mp4"
+        assert (upload_dir / filename).read_bytes() == payload
+        assert not (upload_dir / f"{upload_id}.part").exists()
+
+    async def test_checksum_mismatch_rejected(self, client, upload_dir):
+        session = await self._create(client, self.CHUNK)
+        response = await self._put(client, session["upload_id"], 0, MP4_HEAD + b"\x01" * (self.CHUNK - len(MP4_HEAD)), checksum="0" * 64)
+        assert response.status_code == 422
+
+    async def test_wrong_chunk_length_rejected(self, client, upload_dir):
+        session = await self._create(client, self.CHUNK * 2)
+        response = await self._put(client, session["upload_id"], 0, b"\x01" * 10)
+        assert response.status_code == 422
+
+    async def test_first_chunk_sniffed(self, client, upload_dir):
+        session = await self._create(client, self.CHUNK)
+        response = await self._put(client, session["upload_id"], 0, b"\x01" * self.CHUNK)
+        assert response.status_code == 422
+
+    async def test_invalid_extension(self, client, upload_dir):
+        response = await client.post("/api/uploads", json={"filename": "a.txt", "size": 10})
+        assert response.status_code == 422
+
+    async def test_too_large(self, client, upload_dir):
+        import main
+        response = await client.post(
+            "/api/uploads", json={"filename": "a.mp4", "size": main.MAX_UPLOAD_SIZE + 1}
+        )
+        assert response.status_code == 422
+
+    async def test_unknown_session(self, client, upload_dir):
+        response = await client.get("/api/uploads/does-not-exist")
+        assert response.status_code == 404
+
+
 @pytest.mark.asyncio
 class TestFontsEndpoint:
     async def test_list_fonts(self, client):
@@ -134,6 +261,500 @@ class TestExportEndpoint:
         )
         assert response.status_code == 422
 
+    async def test_export_queued_when_workers_busy(self, client, upload_dir, db, monkeypatch):
+        import asyncio
+        import main
+        from core.scheduler import JobScheduler
+
+        scheduler = JobScheduler(workers=1, max_queued=1)
+        monkeypatch.setattr(main, "export_scheduler", scheduler)
+        gate = asyncio.Event()
+        await scheduler.submit("busy", gate.wait)
+
+        (upload_dir / "queued.mp4").write_bytes(MP4_HEAD)
+        response = await client.post(
+            "/api/export",
+            json={
+                "filename": "queued.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Hello"}],
+                "styles": {"position": {"x": 0, "y": 0}},
+                "task_id": "queued-task",
+            },
+        )
+        try:
+            assert response.status_code == 200
+            data = response.json()
+            assert data["status"] == "queued"
+            assert data["queue_position"] == 1
+            assert main.task_store["queued-task"]["status"] == "queued"
+        finally:
+            await scheduler.shutdown()
+            main.active_files.discard("queued.mp4")
+            main.inflight_jobs.clear()
+            main.task_store.pop("queued-task", None)
+
+
+    async def test_repeat_export_served_from_render_cache(self, client, upload_dir, db, monkeypatch):
+        import asyncio
+        import hashlib
+        import main
+        from core.scheduler import JobScheduler
+
+        monkeypatch.setattr(main, "export_scheduler", JobScheduler(workers=1))
+        renders = []
+
+        async def fake_render(input_path, output_path, ass_path, info, progress_cb, **kwargs):
+            renders.append(output_path)
+            await progress_cb(50, {"fps": 30.0, "speed": 1.2, "eta_seconds": 4.0})
+            with open(output_path, "wb") as f:
+                f.write(b"rendered")
+
+        monkeypatch.setattr(main, "render_subtitles", fake_render)
+        filename = hashlib.sha256(MP4_HEAD).hexdigest() + ".mp4"
+        (upload_dir / filename).write_bytes(MP4_HEAD)
+        request = {
+            "filename": filename,
+            "subtitles": [{"start": 0.0, "end": 1.0, "text": "Cached"}],
+            "styles": {"position": {"x": 0, "y": 0}},
+        }
+
+        first = await client.post("/api/export", json={**request, "task_id": "render-1"})
+        assert first.json()["status"] == "encoding"
+        for _ in range(50):
+            if main.task_store.get("render-1", {}).get("status") == "complete":
+                break
+            await asyncio.sleep(0.01)
+        output = main.task_store["render-1"]["result"]["filename"]
+        # The last encode telemetry rides along with the completion message
+        assert main.task_store["render-1"]["telemetry"]["fps"] == 30.0
+
+        second = await client.post("/api/export", json={**request, "task_id": "render-2"})
+        assert second.json() == {"task_id": "render-2", "status": "complete", "cached": True}
+        assert main.task_store["render-2"]["result"] == {"filename": output}
+        assert main.task_store["render-2"]["cache"] == "hit"
+        assert len(renders) == 1
+        assert filename not in main.active_files
+        for tid in ("render-1", "render-2"):
+            main.task_store.pop(tid, None)
+
+    async def test_cancel_queued_export_frees_files(self, client, upload_dir, db, monkeypatch):
+        import asyncio
+        import main
+        from core.scheduler import JobScheduler
+
+        scheduler = JobScheduler(workers=1, max_queued=2)
+        monkeypatch.setattr(main, "export_scheduler", scheduler)
+        gate = asyncio.Event()
+        await scheduler.submit("busy", gate.wait)
+
+        (upload_dir / "cancel.mp4").write_bytes(MP4_HEAD)
+        response = await client.post(
+            "/api/export",
+            json={
+                "filename": "cancel.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Bye"}],
+                "styles": {"position": {"x": 0, "y": 0}},
+                "task_id": "cancel-queued",
+            },
+        )
+        try:
+            assert response.json()["status"] == "queued"
+            assert list(upload_dir.glob("*.ass"))
+
+            cancel = await client.delete("/api/export/cancel-queued")
+            assert cancel.json() == {"task_id": "cancel-queued", "status": "cancelled"}
+            assert scheduler.queued == 0
+            assert main.task_store["cancel-queued"]["status"] == "cancelled"
+            assert "cancel.mp4" not in main.active_files
+            assert not list(upload_dir.glob("*.ass"))
+            assert not main.inflight_jobs
+        finally:
+            await scheduler.shutdown()
+            main.task_store.pop("cancel-queued", None)
+
+    async def test_cancel_running_export(self, client, upload_dir, db, monkeypatch):
+        import asyncio
+        import main
+        from core.scheduler import JobScheduler
+
+        monkeypatch.setattr(main, "export_scheduler", JobScheduler(workers=1))
+        started = asyncio.Event()
+
+        async def hanging_render(input_path, output_path, *args, **kwargs):
+            with open(output_path, "wb") as f:
+                f.write(b"partial")
+            started.set()
+            await asyncio.Event().wait()
+
+        monkeypatch.setattr(main, "render_subtitles", hanging_render)
+        (upload_dir / "running.mp4").write_bytes(MP4_HEAD)
+        response = await client.post(
+            "/api/export",
+            json={
+                "filename": "running.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Stop"}],
+                "styles": {"position": {"x": 0, "y": 0}},
+                "task_id": "cancel-running",
+            },
+        )
+        assert response.json()["status"] == "encoding"
+        await asyncio.wait_for(started.wait(), 1)
+
+        cancel = await client.delete("/api/export/cancel-running")
+        assert cancel.status_code == 200
+        assert main.task_store["cancel-running"]["status"] == "cancelled"
+        assert main.active_files.isdisjoint({"running.mp4", *(p.name for p in upload_dir.iterdir())})
+        # Partial output and ASS are removed, the source stays
+        assert [p.name for p in upload_dir.iterdir()] == ["running.mp4"]
+        main.task_store.pop("cancel-running", None)
+
+        missing = await client.delete("/api/export/cancel-running")
+        assert missing.status_code == 404
+
+    async def test_cancel_owner_hands_export_to_duplicate(self, client, upload_dir, db, monkeypatch):
+        import asyncio
+        import main
+        from core.scheduler import JobScheduler
+
+        monkeypatch.setattr(main, "export_scheduler", JobScheduler(workers=1))
+        started, finish = asyncio.Event(), asyncio.Event()
+
+        async def gated_render(input_path, output_path, *args, **kwargs):
+            started.set()
+            await finish.wait()
+            with open(output_path, "wb") as f:
+                f.write(b"video")
+
+        monkeypatch.setattr(main, "render_subtitles", gated_render)
+        (upload_dir / "shared.mp4").write_bytes(MP4_HEAD)
+        request = {
+            "filename": "shared.mp4",
+            "subtitles": [{"start": 0.0, "end": 1.0, "text": "Shared"}],
+            "styles": {"position": {"x": 0, "y": 0}},
+        }
+        await client.post("/api/export", json={**request, "task_id": "owner"})
+        await asyncio.wait_for(started.wait(), 1)
+        for tid in ("dup-a", "dup-b"):
+            response = await client.post("/api/export", json={**request, "task_id": tid})
+            assert response.json()["deduplicated"] is True
+        try:
+            cancel = await client.delete("/api/export/owner")
+            assert cancel.json() == {"task_id": "owner", "status": "cancelled"}
+            assert main.task_store["owner"]["status"] == "cancelled"
+            # The encode keeps running for the duplicates, now owned by one of them
+            assert list(main.inflight_jobs.values()) == ["dup-a"]
+            assert main.task_aliases["dup-a"] == {"dup-b"}
+            assert "dup-a" in main.export_releases and "owner" not in main.export_releases
+
+            finish.set()
+            for _ in range(100):
+                if main.task_store["dup-a"]["status"] == "complete":
+                    break
+                await asyncio.sleep(0.01)
+            assert main.task_store["dup-a"]["status"] == "complete"
+            assert main.task_store["dup-b"]["status"] == "complete"
+            assert main.task_store["owner"]["status"] == "cancelled"
+            assert not main.inflight_jobs and not main.export_owners
+            assert main.export_releases.keys().isdisjoint({"owner", "dup-a", "dup-b"})
+            assert "shared.mp4" not in main.active_files
+        finally:
+            finish.set()
+            await main.export_scheduler.shutdown()
+            for tid in ("owner", "dup-a", "dup-b"):
+                main.task_store.pop(tid, None)
+
+    async def test_soft_export_skips_queue(self, client, upload_dir, db, monkeypatch):
+        import asyncio
+        import main
+        from core.scheduler import JobScheduler
+
+        scheduler = JobScheduler(workers=1, max_queued=1)
+        monkeypatch.setattr(main, "export_scheduler", scheduler)
+        gate = asyncio.Event()
+        await scheduler.submit("busy", gate.wait)
+        muxed = []
+
+        async def fake_mux(input_path, output_path, ass_path, duration, progress_callback=None, font_path=None):
+            muxed.append(output_path)
+            with open(output_path, "wb") as f:
+                f.write(b"muxed")
+
+        monkeypatch.setattr(main, "mux_subtitles", fake_mux)
+        (upload_dir / "soft.mp4").write_bytes(MP4_HEAD)
+        response = await client.post(
+            "/api/export",
+            json={
+                "filename": "soft.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Soft"}],
+                "styles": {"position": {"x": 0, "y": 0}},
+                "task_id": "soft-task",
+                "mode": "soft",
+                "container": "mkv",
+            },
+        )
+        try:
+            assert response.json()["status"] == "encoding"
+            for _ in range(50):
+                if main.task_store.get("soft-task", {}).get("status") == "complete":
+                    break
+                await asyncio.sleep(0.01)
+            output = main.task_store["soft-task"]["result"]["filename"]
+            assert output.endswith(".mkv") and len(muxed) == 1
+
+            download = await client.get(f"/api/download/{output}")
+            assert download.headers["content-type"] == "video/x-matroska"
+            assert "reels_subtitles.mkv" in download.headers["content-disposition"]
+        finally:
+            await scheduler.shutdown()
+            main.task_store.pop("soft-task", None)
+
+    async def test_export_invalid_mode(self, client, upload_dir):
+        response = await client.post(
+            "/api/export",
+            json={
+                "filename": "test.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Hello"}],
+                "styles": {"position": {"x": 0, "y": 0}},
+                "mode": "hologram",
+            },
+        )
+        assert response.status_code == 422
+
+    async def test_multi_target_export_returns_all_outputs(self, client, upload_dir, db, monkeypatch):
+        import asyncio
+        import main
+        from core.scheduler import JobScheduler
+
+        monkeypatch.setattr(main, "export_scheduler", JobScheduler(workers=1))
+        seen = []
+
+        async def fake_multi(input_path, outputs, duration, progress_callback=None, fontsdir=None, threads=None):
+            seen.extend(outputs)
+
+        monkeypatch.setattr(main, "burn_subtitles_multi", fake_multi)
+        (upload_dir / "multi.mp4").write_bytes(MP4_HEAD)
+        response = await client.post(
+            "/api/export",
+            json={
+                "filename": "multi.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Multi"}],
+                "styles": {"position": {"x": 0, "y": 0}},
+                "task_id": "multi-task",
+                "targets": [
+                    {"width": 1080, "height": 1920, "label": "9:16"},
+                    {"width": 1080, "height": 1080, "label": "1:1"},
+                    {"width": 360, "height": 640, "video_bitrate": 400, "label": "preview"},
+                ],
+            },
+        )
+        assert response.status_code == 200
+        for _ in range(50):
+            if main.task_store.get("multi-task", {}).get("status") == "complete":
+                break
+            await asyncio.sleep(0.01)
+        result = main.task_store.pop("multi-task")["result"]
+        assert len(result["filenames"]) == 3 and result["filename"] == result["filenames"][0]
+        assert [o["label"] for o in result["outputs"]] == ["9:16", "1:1", "preview"]
+        assert [(o["width"], o["height"]) for o in seen] == [(1080, 1920), (1080, 1080), (360, 640)]
+        # Temporary ASS files are removed
+        assert not list(upload_dir.glob("*.ass"))
+
+    async def test_invalid_karaoke_mode(self, client, upload_dir):
+        response = await client.post(
+            "/api/export",
+            json={
+                "filename": "video.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Hi"}],
+                "styles": {"position": {"x": 0, "y": 0}, "karaokeEnabled": True, "karaokeMode": "ko"},
+            },
+        )
+        assert response.status_code == 422
+
+    async def test_multi_target_rejects_soft_mode(self, client, upload_dir):
+        (upload_dir / "multi.mp4").write_bytes(MP4_HEAD)
+        response = await client.post(
+            "/api/export",
+            json={
+                "filename": "multi.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Multi"}],
+                "styles": {"position": {"x": 0, "y": 0}},
+                "mode": "soft",
+                "targets": [{"width": 1080, "height": 1080}],
+            },
+        )
+        assert response.status_code == 400
+
+    async def test_multi_target_odd_dimension(self, client, upload_dir):
+        response = await client.post(
+            "/api/export",
+            json={
+                "filename": "multi.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Multi"}],
+                "styles": {"position": {"x": 0, "y": 0}},
+                "targets": [{"width": 1081, "height": 1080}],
+            },
+        )
+        assert response.status_code == 422
+
+@pytest.mark.asyncio
+class TestPreviewEndpoint:
+    @staticmethod
+    def _fake_probe(monkeypatch, **overrides):
+        import main
+
+        async def fake_probe(path, content_hash=None):
+            info = {"width": 1080, "height": 1920, "duration": 0, "codec": "h264", "keyframes": [], "keyframe_count": 0}
+            return {**info, **overrides}
+
+        monkeypatch.setattr(main, "probe_media", fake_probe)
+
+    async def test_preview_rendered_then_cached(self, client, upload_dir, db, monkeypatch):
+        import hashlib
+        import main
+
+        renders = []
+        self._fake_probe(monkeypatch)
+
+        async def fake_preview(input_path, output_path, ass_path, start, duration, width, height, **kwargs):
+            renders.append((start, duration, width, height))
+            with open(ass_path, encoding="utf-8") as f:
+                assert "Peek" in f.read()
+            with open(output_path, "wb") as f:
+                f.write(b"preview")
+
+        monkeypatch.setattr(main, "render_preview", fake_preview)
+        filename = hashlib.sha256(MP4_HEAD + b"preview").hexdigest() + ".mp4"
+        (upload_dir / filename).write_bytes(MP4_HEAD)
+        request = {
+            "filename": filename,
+            "subtitles": [{"start": 4.0, "end": 6.0, "text": "Peek"}],
+            "styles": {"position": {"x": 0, "y": 0}},
+            "start": 4.0,
+            "duration": 3.0,
+        }
+
+        first = await client.post("/api/preview", json=request)
+        assert first.status_code == 200
+        assert first.headers["content-type"] == "video/mp4"
+        assert first.headers["x-preview-cache"] == "miss"
+        assert first.content == b"preview"
+        # 1080x1920 source: previews are 480 lines high
+        assert renders == [(4.0, 3.0, 270, 480)]
+
+        second = await client.post("/api/preview", json=request)
+        assert second.headers["x-preview-cache"] == "hit"
+        assert second.content == b"preview"
+        assert len(renders) == 1
+
+        moved = await client.post("/api/preview", json={**request, "start": 5.0})
+        assert moved.headers["x-preview-cache"] == "miss"
+        assert len(renders) == 2
+        assert not list(upload_dir.glob("*.ass"))
+        assert filename not in main.active_files
+
+    async def test_previews_bounded_and_share_cores(self, client, upload_dir, db, monkeypatch):
+        import asyncio
+        import main
+        from core.scheduler import JobScheduler
+
+        scheduler = JobScheduler(workers=2)
+        monkeypatch.setattr(main, "export_scheduler", scheduler)
+        gate = asyncio.Event()
+        await scheduler.submit("export", gate.wait)
+        monkeypatch.setattr(main, "preview_slots", asyncio.Semaphore(1))
+        running, peak, budgets = [0], [0], []
+        real_budget = main.thread_budget
+
+        def recording_budget(job_id, expected_jobs=1):
+            budgets.append(expected_jobs)
+            return real_budget(job_id, expected_jobs)
+
+        async def slow_preview(input_path, output_path, *args, **kwargs):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.05)
+            running[0] -= 1
+            with open(output_path, "wb") as f:
+                f.write(b"preview")
+
+        monkeypatch.setattr(main, "thread_budget", recording_budget)
+        monkeypatch.setattr(main, "render_preview", slow_preview)
+        self._fake_probe(monkeypatch)
+        (upload_dir / "busy.mp4").write_bytes(MP4_HEAD)
+        request = {
+            "filename": "busy.mp4",
+            "subtitles": [{"start": 0.0, "end": 1.0, "text": "Hi"}],
+            "styles": {"position": {"x": 0, "y": 0}},
+            "duration": 1.0,
+        }
+        try:
+            responses = await asyncio.gather(*(
+                client.post("/api/preview", json={**request, "start": float(i)}) for i in range(3)
+            ))
+        finally:
+            gate.set()
+            await scheduler.shutdown()
+        assert [r.status_code for r in responses] == [200, 200, 200]
+        assert peak[0] == 1
+        # One running export plus the preview itself
+        assert budgets == [2, 2, 2]
+
+    async def test_preview_probe_failure(self, client, upload_dir, monkeypatch):
+        import main
+
+        renders = []
+
+        async def fake_preview(*args, **kwargs):
+            renders.append(args)
+
+        async def failed_ffprobe(path):
+            raise RuntimeError("ffprobe failed: Invalid data found when processing input")
+
+        # The real probe_media swallows the failure and returns its defaults
+        monkeypatch.setattr("core.probe._probe_uncached", failed_ffprobe)
+        monkeypatch.setattr("core.probe._memory_cache", {})
+        monkeypatch.setattr(main, "render_preview", fake_preview)
+        (upload_dir / "broken.mp4").write_bytes(MP4_HEAD)
+        response = await client.post(
+            "/api/preview",
+            json={
+                "filename": "broken.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Hi"}],
+                "styles": {"position": {"x": 0, "y": 0}},
+                "start": 0.0,
+                "duration": 1.0,
+            },
+        )
+        assert response.status_code == 500
+        assert not renders
+
+    async def test_preview_window_too_long(self, client, upload_dir):
+        response = await client.post(
+            "/api/preview",
+            json={
+                "filename": "video.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Hi"}],
+                "styles": {"position": {"x": 0, "y": 0}},
+                "start": 0.0,
+                "duration": 60.0,
+            },
+        )
+        assert response.status_code == 422
+
+    async def test_preview_starts_after_end(self, client, upload_dir, monkeypatch):
+        self._fake_probe(monkeypatch, duration=5.0)
+        (upload_dir / "short.mp4").write_bytes(MP4_HEAD)
+        response = await client.post(
+            "/api/preview",
+            json={
+                "filename": "short.mp4",
+                "subtitles": [{"start": 0.0, "end": 1.0, "text": "Hi"}],
+                "styles": {"position": {"x": 0, "y": 0}},
+                "start": 6.0,
+            },
+        )
+        assert response.status_code == 400
+
 
 @pytest.mark.asyncio
 class TestProjectsEndpoint:
@@ -179,6 +800,43 @@ class TestProjectsEndpoint:
         assert response.status_code == 200
         assert response.json()["status"] == "deleted"
 
+    async def test_project_holds_upload_reference(self, client):
+        import main
+
+        resp = await client.post("/api/projects", json={"name": "Ref", "video_filename": "ref.mp4", "subtitles": []})
+        pid = resp.json()["id"]
+        try:
+            assert main.upload_refs["ref.mp4"]["count"] == 1
+            # Switching the video moves the reference
+            await client.post("/api/projects", json={"id": pid, "name": "Ref", "video_filename": "other.mp4", "subtitles": []})
+            assert main.upload_refs["ref.mp4"]["count"] == 0
+            assert main.upload_refs["other.mp4"]["count"] == 1
+            await client.delete(f"/api/projects/{pid}")
+            assert main.upload_refs["other.mp4"]["count"] == 0
+        finally:
+            main.upload_refs.pop("ref.mp4", None)
+            main.upload_refs.pop("other.mp4", None)
+
+    async def test_cleanup_keeps_referenced_uploads(self, client, upload_dir, monkeypatch):
+        import main
+
+        for name in ("kept.mp4", "stale.mp4"):
+            (upload_dir / name).write_bytes(b"\x00")
+            os.utime(upload_dir / name, (0, 0))
+        main.upload_refs["kept.mp4"] = {"count": 1, "last_ref": 0}
+        monkeypatch.setattr(main, "FILE_MAX_AGE_SECONDS", 60)
+        task = asyncio.create_task(main.cleanup_old_files())
+        try:
+            for _ in range(100):
+                if not (upload_dir / "stale.mp4").exists():
+                    break
+                await asyncio.sleep(0.02)
+            assert not (upload_dir / "stale.mp4").exists()
+            assert (upload_dir / "kept.mp4").exists()
+        finally:
+            task.cancel()
+            main.upload_refs.pop("kept.mp4", None)
+
 
 @pytest.mark.asyncio
 class TestSettingsEndpoint:
@@ -221,3 +879,86 @@ class TestDownloadEndpoint:
 
         response = await client.get("/api/download/exported_test.mp4")
         assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+class TestStreamChunkSubtitles:
+    async def test_out_of_order_chunks_streamed_in_order(self):
+        import asyncio
+        import main
+
+        task_id = "stream-test"
+        chunk_queue = asyncio.Queue()
+        chunk_queue.put_nowait((1, 2, [{"word": "Second.", "start": 130.0, "end": 130.5}]))
+        chunk_queue.put_nowait((0, 2, [{"word": "First.", "start": 0.0, "end": 0.5}]))
+        transcription = asyncio.get_running_loop().create_future()
+        transcription.set_result([])
+
+        subtitles = await main._stream_chunk_subtitles(task_id, chunk_queue, transcription)
+        assert [s["text"] for s in subtitles] == ["First", "Second"]
+        assert [s["text"] for s in main.task_partials[task_id]] == ["First", "Second"]
+        assert main.task_store[task_id]["partial"]["index"] == 1
+        main.task_partials.pop(task_id, None)
+        main.task_store.pop(task_id, None)
+
+    async def test_transcription_error_propagates(self):
+        import asyncio
+        import main
+
+        transcription = asyncio.get_running_loop().create_future()
+        transcription.set_exception(RuntimeError("boom"))
+        with pytest.raises(RuntimeError):
+            await main._stream_chunk_subtitles("stream-err", asyncio.Queue(), transcription)
+
+
+@pytest.mark.asyncio
+class TestSingleFlight:
+    async def test_duplicate_mirrors_progress(self):
+        import main
+
+        main.inflight_jobs["k"] = "primary"
+        try:
+            assert main._attach_to_inflight("k", None) == "primary"
+            assert main._attach_to_inflight("k", "dup") == "dup"
+
+            await main.broadcast_progress("primary", 50, "processing")
+            assert main.task_store["dup"]["progress"] == 50
+            assert main.task_store["primary"]["progress"] == 50
+
+            main._finish_inflight("k", "primary")
+            assert "k" not in main.inflight_jobs
+            assert "primary" not in main.task_aliases
+        finally:
+            main.inflight_jobs.pop("k", None)
+            main.task_aliases.pop("primary", None)
+            for tid in ("primary", "dup"):
+                main.task_store.pop(tid, None)
+
+    async def test_no_inflight_job(self):
+        import main
+        assert main._attach_to_inflight("missing", "t1") is None
+
+    async def test_process_request_joins_inflight(self, client, upload_dir):
+        import main
+
+        (upload_dir / "dup.mp4").write_bytes(b"\x00" * 100)
+        main.inflight_jobs["process:dup.mp4:en"] = "running-task"
+        try:
+            response = await client.post(
+                "/api/process",
+                json={"filename": "dup.mp4", "language": "en", "task_id": "second-task"},
+            )
+            assert response.status_code == 200
+            data = response.json()
+            assert data["task_id"] == "second-task"
+            assert data["deduplicated"] is True
+            assert "second-task" in main.task_aliases["running-task"]
+        finally:
+            main.inflight_jobs.pop("process:dup.mp4:en", None)
+            main.task_aliases.pop("running-task", None)
+
+
+class TestContentHash:
+    def test_non_content_addressed_name(self):
+        import main
+        assert main.content_hash_for("exported_1234.mp4") is None
@@ -0,0 +1,309 @@
+"""Tests for core/asr.py and core/asr_engines.py"""
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import core.asr as asr
+import core.asr_engines as asr_engines
+from core.asr import _choose_audio_encoding, _offset_words, _plan_chunks
+
+
+def _word(text, start, end):
+    """Helper to create a word dict."""
+    return {"word": text, "start": start, "end": end}
+
+
+class TestPlanChunks:
+    def test_zero_duration(self):
+        assert _plan_chunks(0, []) == []
+
+    def test_short_input_single_chunk(self):
+        assert _plan_chunks(90.0, [], max_chunk=120) == [(0.0, 90.0)]
+
+    def test_hard_cuts_without_silence(self):
+        chunks = _plan_chunks(250.0, [], max_chunk=100, min_chunk=20)
+        assert chunks == [(0.0, 100.0), (100.0, 200.0), (200.0, 250.0)]
+
+    def test_cuts_at_latest_silence(self):
+        silences = [(40.0, 41.0), (90.0, 92.0), (130.0, 131.0)]
+        chunks = _plan_chunks(200.0, silences, max_chunk=100, min_chunk=20)
+        # First cut at middle of silence 90-92, second at hard limit 191
+        assert chunks[0] == (0.0, 91.0)
+        assert chunks[1][0] == 91.0
+
+    def test_ignores_silence_too_close_to_start(self):
+        silences = [(5.0, 6.0)]
+        chunks = _plan_chunks(150.0, silences, max_chunk=100, min_chunk=20)
+        assert chunks[0] == (0.0, 100.0)
+
+    def test_short_first_chunk(self):
+        chunks = _plan_chunks(250.0, [], max_chunk=100, min_chunk=20, first_chunk=30)
+        assert chunks == [(0.0, 30.0), (30.0, 130.0), (130.0, 230.0), (230.0, 250.0)]
+
+    def test_short_first_chunk_cuts_at_silence(self):
+        # min_chunk shrinks to half the first chunk so the silence at 18s is usable
+        chunks = _plan_chunks(60.0, [(17.5, 18.5), (40.0, 41.0)], max_chunk=100, min_chunk=20, first_chunk=30)
+        assert chunks == [(0.0, 18.0), (18.0, 60.0)]
+
+    def test_chunks_are_contiguous_and_bounded(self):
+        silences = [(float(t), t + 0.5) for t in range(10, 600, 37)]
+        chunks = _plan_chunks(600.0, silences, max_chunk=120, min_chunk=20)
+        assert chunks[0][0] == 0.0
+        assert chunks[-1][1] == 600.0
+        for (s1, e1), (s2, _) in zip(chunks, chunks[1:]):
+            assert e1 == s2
+        for s, e in chunks:
+            assert e - s <= 120
+
+
+class TestChooseAudioEncoding:
+    def test_unknown_duration_uses_best(self):
+        assert _choose_audio_encoding(0) == ("libopus", "ogg", "ogg", 32)
+
+    def test_short_clip_uses_best(self):
+        assert _choose_audio_encoding(60)[3] == 32
+
+    def test_long_clip_lowers_bitrate(self):
+        # 2 hours: 25MB * 0.9 budget -> ~26 kbps
+        codec, container, ext, kbps = _choose_audio_encoding(2 * 3600)
+        assert kbps == 24
+        assert ext == "ogg"
+
+    def test_fits_limit(self):
+        for duration in (30, 600, 3600, 4 * 3600):
+            kbps = _choose_audio_encoding(duration)[3]
+            if kbps > 8:
+                assert kbps * 1000 / 8 * duration <= asr.OPENAI_FILE_LIMIT
+
+    def test_mp3_ladder(self):
+        codec, container, ext, kbps = _choose_audio_encoding(60, codec="mp3")
+        assert (codec, ext, kbps) == ("libmp3lame", "mp3", 64)
+
+
+class TestOffsetWords:
+    def test_offset_applied(self):
+        result = _offset_words([_word("hi", 0.5, 1.0)], 10.0)
+        assert result == [_word("hi", 10.5, 11.0)]
+
+    def test_clamped_to_limit(self):
+        result = _offset_words([_word("hi", 0.5, 3.0)], 10.0, limit=12.0)
+        assert result[0]["end"] == 12.0
+
+
+@pytest.mark.asyncio
+class TestChunkedTranscription:
+    def _fake_engine(self, monkeypatch):
+        class FakeEngine:
+            name = "fake"
+            max_concurrency = 2
+
+            async def transcribe(self, audio, filename, language):
+                index = int(float(audio.decode()) // 100)
+                return [_word(f"w{index}", 1.0, 2.0)]
+
+        monkeypatch.setattr(asr, "get_engine", lambda: FakeEngine())
+
+    async def test_words_stitched_in_order(self, monkeypatch):
+        self._fake_engine(monkeypatch)
+        monkeypatch.setattr(asr, "_prepare_audio", lambda path, duration, start, end: (str(start).encode(), "audio.ogg", None))
+        prepared = {
+            "file_path": "video.mp4",
+            "duration": 250.0,
+            "spans": [(0.0, 100.0), (100.0, 200.0), (200.0, 250.0)],
+            "uploads": {},
+        }
+        seen = []
+
+        async def on_chunk(index, total, words):
+            seen.append((index, total))
+
+        words = await asr.transcribe_prepared(prepared, None, on_chunk)
+        assert [w["word"] for w in words] == ["w0", "w1", "w2"]
+        assert [w["start"] for w in words] == [1.0, 101.0, 201.0]
+        assert sorted(seen) == [(0, 3), (1, 3), (2, 3)]
+
+    async def test_uses_prepared_uploads(self, monkeypatch):
+        self._fake_engine(monkeypatch)
+
+        def fail(*args):
+            raise AssertionError("audio should not be re-extracted")
+
+        monkeypatch.setattr(asr, "_prepare_audio", fail)
+        prepared = {
+            "file_path": "video.mp4",
+            "duration": 50.0,
+            "spans": [None],
+            "uploads": {0: (b"0", "audio.ogg", None)},
+        }
+        words = await asr.transcribe_audio("video.mp4", prepared=prepared)
+        assert words == [_word("w0", 1.0, 2.0)]
+
+    async def test_prepare_long_input_is_chunked(self, monkeypatch):
+        monkeypatch.setattr(asr, "_get_media_duration", lambda path: 300.0)
+        monkeypatch.setattr(asr, "_detect_silences", lambda path: [])
+        monkeypatch.setattr(asr, "_prepare_audio", lambda path, duration, start=None, end=None: (b"x", "audio.ogg", None))
+
+        prepared = await asr.prepare_audio("video.mp4", extract_all=True)
+        assert len(prepared["spans"]) == 3
+        assert sorted(prepared["uploads"]) == [0, 1, 2]
+
+    async def test_prepare_short_input_single_request(self, monkeypatch):
+        monkeypatch.setattr(asr, "_get_media_duration", lambda path: 30.0)
+        monkeypatch.setattr(asr, "_prepare_audio", lambda path, duration, start=None, end=None: (b"x", "audio.ogg", None))
+
+        prepared = await asr.prepare_audio("video.mp4")
+        assert prepared["spans"] == [None]
+        assert prepared["uploads"][0][0] == b"x"
+
+
+    async def test_prepare_streamed_reel_is_chunked(self, monkeypatch):
+        monkeypatch.setattr(asr, "FIRST_CHUNK_SECONDS", 30.0)
+        monkeypatch.setattr(asr, "_get_media_duration", lambda path: 75.0)
+        monkeypatch.setattr(asr, "_detect_silences", lambda path: [])
+        monkeypatch.setattr(asr, "_prepare_audio", lambda path, duration, start=None, end=None: (b"x", "audio.ogg", None))
+
+        assert (await asr.prepare_audio("video.mp4"))["spans"] == [None]
+        prepared = await asr.prepare_audio("video.mp4", stream=True)
+        assert prepared["spans"] == [(0.0, 30.0), (30.0, 75.0)]
+
+    async def test_prepare_streamed_short_clip_single_request(self, monkeypatch):
+        monkeypatch.setattr(asr, "FIRST_CHUNK_SECONDS", 30.0)
+        monkeypatch.setattr(asr, "_get_media_duration", lambda path: 45.0)
+        monkeypatch.setattr(asr, "_prepare_audio", lambda path, duration, start=None, end=None: (b"x", "audio.ogg", None))
+
+        prepared = await asr.prepare_audio("video.mp4", stream=True)
+        assert prepared["spans"] == [None]
+
+
+class TestComputeAudioHash:
+    def _fake_ffmpeg(self, tmp_path, monkeypatch, body):
+        script = tmp_path / "ffmpeg"
+        script.write_text(f"#!{sys.executable}\nimport sys\n{body}\n", encoding="utf-8")
+        script.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ.get('PATH', '')}")
+
+    def test_decode_error_flood_does_not_block(self, tmp_path, monkeypatch):
+        # A corrupt upload: ~180 KB of decode errors on stderr before the PCM ends
+        body = "sys.stderr.write('[aac] decode error\\n' * 10000)\nsys.stdout.buffer.write(b'\\x00' * 200000)"
+        self._fake_ffmpeg(tmp_path, monkeypatch, body)
+        assert asr.compute_audio_hash("video.mp4") == hashlib.sha256(b"\x00" * 200000).hexdigest()
+
+    def test_failure_raises(self, tmp_path, monkeypatch):
+        self._fake_ffmpeg(tmp_path, monkeypatch, "sys.stderr.write('Invalid data found\\n')\nsys.exit(1)")
+        with pytest.raises(RuntimeError, match="Invalid data found"):
+            asr.compute_audio_hash("video.mp4")
+
+
+class TestTranscriptionCacheKey:
+    def test_stable(self):
+        assert asr.transcription_cache_key("abc", "en", "m") == asr.transcription_cache_key("abc", "en", "m")
+
+    def test_language_changes_key(self):
+        assert asr.transcription_cache_key("abc", "en", "m") != asr.transcription_cache_key("abc", "ru", "m")
+
+    def test_auto_language(self):
+        assert asr.transcription_cache_key("abc", None, "m") != asr.transcription_cache_key("abc", "en", "m")
+
+    def test_model_changes_key(self):
+        assert asr.transcription_cache_key("abc", "en", "a") != asr.transcription_cache_key("abc", "en", "b")
+
+    def test_vad_setting_changes_key(self, monkeypatch):
+        monkeypatch.setattr(asr, "ASR_VAD_ENABLED", True)
+        with_vad = asr.transcription_cache_key("abc", "en", "m")
+        monkeypatch.setattr(asr, "ASR_VAD_ENABLED", False)
+        assert asr.transcription_cache_key("abc", "en", "m") != with_vad
+
+
+class TestEngines:
+    def test_default_engine_is_openai(self, monkeypatch):
+        monkeypatch.setattr(asr_engines, "_engine", None)
+        monkeypatch.setattr(asr_engines, "ASR_ENGINE", "openai")
+        engine = asr_engines.get_engine()
+        assert isinstance(engine, asr_engines.OpenAIEngine)
+        assert engine.model_id == "whisper-1"
+
+    def test_local_engine_model_id(self):
+        engine = asr_engines.LocalWhisperEngine(model_name="small", workers=3, threads=2)
+        assert engine.model_id == "local:small"
+        assert engine.max_concurrency == 3
+
+    def test_base_engine_is_abstract(self):
+        with pytest.raises(TypeError):
+            asr_engines.ASREngine()
+
+    def test_local_engine_gets_raw_pcm(self, monkeypatch):
+        pcm = _pcm((1, True))
+        monkeypatch.setattr(asr, "get_engine", lambda: asr_engines.LocalWhisperEngine(workers=1, threads=1))
+        monkeypatch.setattr(asr, "ASR_VAD_ENABLED", False)
+        monkeypatch.setattr(asr, "_decode_pcm", lambda path, start=None, end=None: pcm)
+
+        def no_encode(*args):
+            raise AssertionError("PCM engines must not get an encoded upload")
+
+        monkeypatch.setattr(asr, "_encode_pcm", no_encode)
+        monkeypatch.setattr(asr, "_extract_audio", no_encode)
+        audio, filename, offset_map = asr._prepare_audio("video.mp4", 1.0)
+        assert audio == pcm.tobytes() and filename == "audio.pcm" and offset_map is None
+
+    def test_unknown_engine(self, monkeypatch):
+        monkeypatch.setattr(asr_engines, "_engine", None)
+        monkeypatch.setattr(asr_engines, "ASR_ENGINE", "nope")
+        with pytest.raises(RuntimeError):
+            asr_engines.get_engine()
+
+
+def _pcm(*parts):
+    """Build 16 kHz int16 PCM from (seconds, is_speech) parts."""
+    rng = np.random.default_rng(0)
+    pieces = []
+    for seconds, speech in parts:
+        n = int(seconds * asr.SAMPLE_RATE)
+        if speech:
+            t = np.arange(n) / asr.SAMPLE_RATE
+            pieces.append((np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16))
+        else:
+            pieces.append(rng.normal(0, 20, n).astype(np.int16))
+    return np.concatenate(pieces)
+
+
+class TestVoiceActivity:
+    def test_detects_speech_regions(self):
+        pcm = _pcm((3, False), (1, True), (4, False), (1, True), (3, False))
+        regions = asr._detect_speech(pcm)
+        assert len(regions) == 2
+        assert regions[0][0] == pytest.approx(3 - asr.VAD_PAD_SECONDS, abs=0.05)
+        assert regions[1][1] == pytest.approx(9 + asr.VAD_PAD_SECONDS, abs=0.05)
+
+    def test_short_pauses_merged(self):
+        pcm = _pcm((2, False), (1, True), (0.5, False), (1, True), (2, False))
+        assert len(asr._detect_speech(pcm)) == 1
+
+    def test_silence_only(self):
+        assert asr._detect_speech(_pcm((3, False))) == []
+
+    def test_offset_map_skips_negligible_saving(self):
+        assert asr._build_offset_map([(0.0, 9.8)], 10.0) is None
+
+    def test_offset_map_and_trim(self):
+        regions = [(2.0, 3.0), (10.0, 12.0)]
+        offset_map = asr._build_offset_map(regions, 20.0)
+        assert offset_map == [(0.0, 2.0, 1.0), (1.0 + asr.VAD_KEEP_GAP, 10.0, 2.0)]
+
+        pcm = _pcm((20, False))
+        trimmed = asr._trim_pcm(pcm, offset_map)
+        assert len(trimmed) == int((3.0 + asr.VAD_KEEP_GAP) * asr.SAMPLE_RATE)
+
+    def test_map_to_source(self):
+        offset_map = [(0.0, 2.0, 1.0), (1.4, 10.0, 2.0)]
+        assert asr._map_to_source(0.5, offset_map) == 2.5
+        assert asr._map_to_source(1.9, offset_map) == 10.5
+        # Inside the inserted gap -> end of the first region
+        assert asr._map_to_source(1.2, offset_map) == 3.0
+
+    def test_words_mapped_back(self):
+        offset_map = [(0.0, 5.0, 2.0)]
+        words = asr._map_words_to_source([_word("hi", 0.5, 1.0)], offset_map)
+        assert words == [_word("hi", 5.5, 6.0)]
@@ -9,6 +9,16 @@ from core.database import (
     get_setting,
     set_setting,
     get_all_settings,
+    get_cached_transcription,
+    save_cached_transcription,
+    evict_transcription_cache,
+    get_cached_probe,
+    save_cached_probe,
+    evict_probe_cache,
+    get_cached_render,
+    save_cached_render,
+    get_cached_render_filenames,
+    evict_render_cache,
 )
 
 
@@ -115,3 +125,85 @@ class TestSettingsCRUD:
         await set_setting("complex", value)
         result = await get_setting("complex")
         assert result == value
+
+
+@pytest.mark.asyncio
+class TestTranscriptionCache:
+    async def test_miss_returns_none(self, db):
+        assert await get_cached_transcription("missing") is None
+
+    async def test_save_and_hit(self, db):
+        words = [{"word": "Hello", "start": 0.0, "end": 0.5}]
+        await save_cached_transcription("k1", words)
+        assert await get_cached_transcription("k1") == words
+
+    async def test_size_eviction_drops_least_recently_used(self, db):
+        words = [{"word": "x" * 100, "start": 0.0, "end": 1.0}]
+        await save_cached_transcription("old", words)
+        await save_cached_transcription("new", words)
+        # Touch "old" so "new" becomes the least recently used entry
+        await get_cached_transcription("old")
+
+        removed = await evict_transcription_cache(max_bytes=200)
+        assert removed == 1
+        assert await get_cached_transcription("old") == words
+        assert await get_cached_transcription("new") is None
+
+    async def test_age_eviction(self, db):
+        await save_cached_transcription("aged", [])
+        await evict_transcription_cache(max_age_seconds=-1)
+        assert await get_cached_transcription("aged") is None
+
+
+@pytest.mark.asyncio
+class TestProbeCache:
+    async def test_save_and_get(self, db):
+        info = {"width": 1920, "height": 1080, "duration": 12.5, "keyframes": [0.0, 2.0]}
+        assert await get_cached_probe("sha256:abc") is None
+        await save_cached_probe("sha256:abc", info)
+        assert await get_cached_probe("sha256:abc") == info
+
+    async def test_size_eviction_keeps_recently_used(self, db):
+        await save_cached_probe("old", {"keyframes": [0.0] * 20})
+        await save_cached_probe("new", {"keyframes": [0.0] * 20})
+        # Touch "old" so "new" becomes the least recently used entry
+        await get_cached_probe("old")
+
+        removed = await evict_probe_cache(max_bytes=150)
+        assert removed == 1
+        assert await get_cached_probe("old") is not None
+        assert await get_cached_probe("new") is None
+
+    async def test_age_eviction(self, db):
+        await save_cached_probe("aged", {})
+        await evict_probe_cache(max_age_seconds=-1)
+        assert await get_cached_probe("aged") is None
+
+
+@pytest.mark.asyncio
+class TestRenderCache:
+    async def test_save_and_hit(self, db):
+        assert await get_cached_render("k") is None
+        await save_cached_render("k", "exported_a.mp4", 1000)
+        assert await get_cached_render("k") == "exported_a.mp4"
+        assert await get_cached_render_filenames() == {"exported_a.mp4"}
+
+    async def test_quota_evicts_least_recently_used(self, db):
+        await save_cached_render("old", "old.mp4", 600)
+        await save_cached_render("new", "new.mp4", 600)
+        await get_cached_render("old")
+
+        assert await evict_render_cache(max_bytes=1000) == ["new.mp4"]
+        assert await get_cached_render("old") == "old.mp4"
+
+    async def test_protected_files_are_kept(self, db):
+        await save_cached_render("a", "a.mp4", 600)
+        await save_cached_render("b", "b.mp4", 600)
+        await get_cached_render("a")
+
+        assert await evict_render_cache(max_bytes=1000, protected={"b.mp4"}) == ["a.mp4"]
+        assert await get_cached_render_filenames() == {"b.mp4"}
+
+    async def test_unused_entries_expire(self, db):
+        await save_cached_render("a", "a.mp4", 10)
+        assert await evict_render_cache(max_age_seconds=-1) == ["a.mp4"]
@@ -1,5 +1,17 @@
 """Tests for core/export.py"""
-from core.export import format_timestamp, generate_ass_content
+import hashlib
+import io
+import sys
+
+import pytest
+
+import core.export as export
+from core.export import (
+    _burn_command, _multi_output_command, _mux_command, _preview_command, ass_event_ranges, burn_subtitles_segmented,
+    font_digest, format_timestamp, generate_ass_content, parse_progress_block, plan_segments, plan_smart_render,
+    preview_ass_content, preview_size, render_cache_key, render_subtitles, scale_styles_for_target, segment_count,
+    shift_ass_events, smart_mux_args, smart_render_args, thread_budget, thread_budget_stats, write_ass,
+)
 
 
 class TestFormatTimestamp:
@@ -245,3 +257,562 @@ class TestGenerateAssContentPositioning:
         subtitles = [{"start": 0.0, "end": 1.0, "text": "Test"}]
         content = generate_ass_content(subtitles, styles, 1080, 1920)
         assert "\\an5" in content
+
+
+class TestWriteAss:
+    def _make_styles(self, **overrides):
+        styles = {
+            "fontFamily": "Arial",
+            "fontSize": 24,
+            "textColor": "#FFFFFF",
+            "outlineColor": "#000000",
+            "outlineWidth": 2.0,
+            "shadowDepth": 2.0,
+            "bold": True,
+            "uppercase": False,
+            "position": {"x": 0, "y": 0},
+            "karaokeEnabled": True,
+            "highlightColor": "#FF0000",
+        }
+        styles.update(overrides)
+        return styles
+
+    def _subtitle(self):
+        return {
+            "start": 0.0, "end": 2.0, "text": "one two three",
+            "words": [
+                {"word": "one", "start": 0.0, "end": 0.5},
+                {"word": "two", "start": 0.8, "end": 1.2},
+                {"word": "three", "start": 1.2, "end": 2.0},
+            ],
+        }
+
+    def test_returns_digest_of_written_document(self):
+        out = io.StringIO()
+        digest = write_ass(out, [self._subtitle()], self._make_styles(), 1080, 1920)
+        assert digest == hashlib.sha256(out.getvalue().encode("utf-8")).hexdigest()
+        assert out.getvalue() == generate_ass_content([self._subtitle()], self._make_styles(), 1080, 1920)
+        assert not out.getvalue().endswith("\n")
+
+    def test_karaoke_highlights_one_word_per_line(self):
+        content = generate_ass_content([self._subtitle()], self._make_styles(), 1080, 1920)
+        lines = [line.split(",", 9)[9] for line in content.split("\n") if line.startswith("Dialogue:")]
+        prefix = "{\\an5\\pos(540,960)}"
+        assert lines == [
+            prefix + "{\\c&H0000FF&}one{\\c&HFFFFFF&} two three",
+            prefix + "one two three",  # gap between 0.5 and 0.8
+            prefix + "one {\\c&H0000FF&}two{\\c&HFFFFFF&} three",
+            prefix + "one two {\\c&H0000FF&}three{\\c&HFFFFFF&}",
+        ]
+
+    def test_karaoke_escapes_and_uppercases_words(self):
+        subtitle = {
+            "start": 0.0, "end": 1.0, "text": "a {b}",
+            "words": [{"word": "a", "start": 0.0, "end": 0.5}, {"word": "{b}", "start": 0.5, "end": 1.0}],
+        }
+        content = generate_ass_content([subtitle], self._make_styles(uppercase=True), 1080, 1920)
+        assert "A {\\c&H0000FF&}\uff5bB\uff5d{\\c&HFFFFFF&}" in content
+
+    def test_header_cached_per_styles_and_resolution(self):
+        export._ass_header.cache_clear()
+        for _ in range(3):
+            write_ass(io.StringIO(), [], self._make_styles(), 1080, 1920)
+        write_ass(io.StringIO(), [], self._make_styles(), 720, 1280)
+        info = export._ass_header.cache_info()
+        assert info.misses == 2 and info.hits == 2
+
+    def test_k_mode_emits_one_event_per_subtitle(self):
+        content = generate_ass_content([self._subtitle()], self._make_styles(karaokeMode="k"), 1080, 1920)
+        events = [line for line in content.split("\n") if line.startswith("Dialogue:")]
+        assert events == [
+            "Dialogue: 0,0:00:00.00,0:00:02.00,Karaoke,,0,0,0,,"
+            "{\\an5\\pos(540,960)}{\\k80}one {\\k40}two {\\k80}three"
+        ]
+        # Highlight is the fill (primary) colour, text colour is shown before each word
+        assert "Style: Karaoke,Arial,24,&H0000FF&,&HFFFFFF&," in content
+
+    def test_kf_mode_leads_in_before_first_word(self):
+        subtitle = self._subtitle()
+        subtitle["words"][0]["start"] = 0.3
+        content = generate_ass_content([subtitle], self._make_styles(karaokeMode="kf"), 1080, 1920)
+        assert "{\\kf30}{\\kf50}one {\\kf40}two {\\kf80}three" in content
+
+    def test_karaoke_style_only_for_tag_modes(self):
+        content = generate_ass_content([self._subtitle()], self._make_styles(), 1080, 1920)
+        assert "Style: Karaoke" not in content
+
+
+class TestThreadBudget:
+    def test_lone_encode_gets_whole_budget(self, monkeypatch):
+        monkeypatch.setattr(export, "FFMPEG_THREAD_BUDGET", 8)
+        with thread_budget("a") as threads:
+            assert threads == 8
+        assert thread_budget_stats()["encodes"] == {}
+
+    def test_split_between_active_encodes(self, monkeypatch):
+        monkeypatch.setattr(export, "FFMPEG_THREAD_BUDGET", 8)
+        with thread_budget("a", expected_jobs=2) as first:
+            with thread_budget("b") as second:
+                assert (first, second) == (4, 4)
+                stats = thread_budget_stats()
+                assert stats["allocated"] == 8
+                assert set(stats["encodes"]) == {"a", "b"}
+
+    def test_never_below_one_thread(self, monkeypatch):
+        monkeypatch.setattr(export, "FFMPEG_THREAD_BUDGET", 2)
+        with thread_budget("a", expected_jobs=5) as threads:
+            assert threads == 1
+
+
+class TestBurnCommand:
+    def test_without_threads(self):
+        command = _burn_command("in.mp4", "out.mp4", "subs.ass")
+        assert "-threads" not in command
+        assert "-progress" not in command
+        assert command[-1] == "out.mp4"
+
+    def test_thread_limits_applied(self):
+        command = _burn_command("in.mp4", "out.mp4", "subs.ass", threads=4, progress=True)
+        # Decoder and filter limits precede the input, encoder limit follows the codec
+        assert command[command.index("-filter_threads") + 1] == "2"
+        assert command.index("-threads") < command.index("-i")
+        encoder_threads = command.index("-threads", command.index("libx264"))
+        assert command[encoder_threads + 1] == "4"
+        assert "-progress" in command
+
+
+class TestPlanSegments:
+    def test_boundaries_snap_to_keyframes(self):
+        keyframes = [float(k) for k in range(0, 180, 2)] + [59.5, 121.0]
+        segments = plan_segments(180.0, sorted(keyframes), 3)
+        assert segments == [(0.0, 60.0), (60.0, 120.0), (120.0, 180.0)]
+
+    def test_single_range_without_keyframes(self):
+        assert plan_segments(180.0, [], 4) == [(0.0, 180.0)]
+        assert plan_segments(180.0, [0.0, 90.0], 1) == [(0.0, 180.0)]
+
+    def test_sparse_keyframes_give_fewer_parts(self):
+        segments = plan_segments(60.0, [0.0, 30.0], 4)
+        assert segments == [(0.0, 30.0), (30.0, 60.0)]
+
+    def test_segment_count(self, monkeypatch):
+        monkeypatch.setattr(export, "EXPORT_SEGMENTED", True)
+        monkeypatch.setattr(export, "SEGMENT_THREADS", 2)
+        monkeypatch.setattr(export, "SEGMENT_MIN_SECONDS", 10)
+        assert segment_count(180.0, threads=16) == 8
+        assert segment_count(25.0, threads=16) == 2
+        assert segment_count(180.0, threads=2) == 1
+        monkeypatch.setattr(export, "EXPORT_SEGMENTED", False)
+        assert segment_count(180.0, threads=16) == 1
+
+
+class TestShiftAssEvents:
+    def test_clips_and_shifts(self):
+        content = "\n".join([
+            "[Events]",
+            "Dialogue: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,{\\an5}Before",
+            "Dialogue: 0,0:00:09.00,0:00:12.00,Default,,0,0,0,,{\\an5}Across, boundary",
+            "Dialogue: 0,0:00:15.00,0:00:16.50,Default,,0,0,0,,{\\an5}Inside",
+            "Dialogue: 0,0:00:21.00,0:00:22.00,Default,,0,0,0,,{\\an5}After",
+        ])
+        shifted = shift_ass_events(content, 10.0, 20.0).split("\n")
+        assert shifted[0] == "[Events]"
+        assert shifted[1] == "Dialogue: 0,0:00:00.00,0:00:02.00,Default,,0,0,0,,{\\an5}Across, boundary"
+        assert shifted[2] == "Dialogue: 0,0:00:05.00,0:00:06.50,Default,,0,0,0,,{\\an5}Inside"
+        assert len(shifted) == 3
+
+    def test_clipped_karaoke_event_consumes_elapsed_durations(self):
+        content = "Dialogue: 0,0:00:08.00,0:00:12.00,Karaoke,,0,0,0,,{\\an5}{\\k100}one {\\k150}two {\\k150}three"
+        shifted = shift_ass_events(content, 10.0, 20.0)
+        # 2s of the line already played in the previous part
+        assert shifted == "Dialogue: 0,0:00:00.00,0:00:02.00,Karaoke,,0,0,0,,{\\an5}{\\k0}one {\\k50}two {\\k150}three"
+
+
+@pytest.mark.asyncio
+class TestEncodeProgress:
+    def _clock(self, monkeypatch, start=100.0):
+        clock = [start]
+        monkeypatch.setattr(export.time, "monotonic", lambda: clock[0])
+        return clock
+
+    async def test_parse_progress_block(self):
+        stats = parse_progress_block({
+            "frame": "240", "fps": "59.94", "bitrate": "2048.5kbits/s", "total_size": "2621440",
+            "out_time_us": "8000000", "out_time_ms": "8000000", "speed": "1.98x", "progress": "continue",
+        })
+        assert stats == {
+            "out_time": 8.0, "frame": 240, "fps": 59.94, "bitrate_kbps": 2048.5,
+            "total_size": 2621440, "speed": 1.98,
+        }
+        empty = parse_progress_block({"bitrate": "N/A", "speed": "N/A", "out_time_us": "N/A", "progress": "continue"})
+        assert empty["out_time"] is None and empty["bitrate_kbps"] is None and empty["speed"] is None
+
+    async def test_coalesces_updates_and_smooths_eta(self, monkeypatch):
+        clock = self._clock(monkeypatch)
+        monkeypatch.setattr(export, "EXPORT_PROGRESS_INTERVAL", 1.0)
+        reports = []
+
+        async def on_progress(value, telemetry=None):
+            reports.append((value, telemetry))
+
+        progress = export.EncodeProgress(100.0, on_progress)
+        update = progress.on_time()
+        await update(2.0, {"frame": 60, "fps": 30.0, "speed": 2.0, "total_size": 250_000})
+        clock[0] += 0.5
+        await update(3.0, {"frame": 90, "fps": 30.0, "speed": 2.0, "total_size": 375_000})  # coalesced
+        clock[0] += 0.5
+        await update(4.0, {"frame": 120, "fps": 30.0, "speed": 2.0, "total_size": 500_000})
+
+        assert [value for value, _ in reports] == [2, 4]
+        first, second = reports[0][1], reports[1][1]
+        # Seeded from ffmpeg's speed, then 2s of media in 1s of wall time
+        assert first["eta_seconds"] == 49.0
+        assert second["eta_seconds"] == 48.0
+        assert second["frame"] == 120 and second["bitrate_kbps"] == 1000.0
+
+        await progress.finish()
+        assert reports[-1][0] == 100 and reports[-1][1]["eta_seconds"] == 0.0
+
+    async def test_run_ffmpeg_reports_each_progress_block(self):
+        script = "print('frame=10\\nfps=25.0\\nout_time_us=N/A\\nprogress=continue\\n"
+        script += "frame=50\\nfps=25.0\\nout_time_us=2000000\\nspeed=1.5x\\nprogress=end')"
+        seen = []
+
+        async def on_time(seconds, stats=None):
+            seen.append((seconds, stats["frame"], stats["speed"]))
+
+        await export._run_ffmpeg([sys.executable, "-c", script], on_time)
+        assert seen == [(2.0, 50, 1.5)]
+
+    async def test_sums_concurrent_sources(self, monkeypatch):
+        self._clock(monkeypatch)
+        monkeypatch.setattr(export, "EXPORT_PROGRESS_INTERVAL", 0)
+        reports = []
+
+        async def on_progress(value, telemetry=None):
+            reports.append((value, telemetry))
+
+        progress = export.EncodeProgress(20.0, on_progress)
+        await progress.on_time(0, limit=10.0)(12.0, {"frame": 300, "fps": 40.0, "speed": 1.5})
+        await progress.on_time(1, limit=10.0)(5.0, {"frame": 150, "fps": 35.0, "speed": 1.0})
+        value, telemetry = reports[-1]
+        assert value == 75
+        assert telemetry["frame"] == 450 and telemetry["fps"] == 75.0 and telemetry["speed"] == 2.5
+
+    async def test_copied_parts_only_advance_the_percentage(self, monkeypatch):
+        clock = self._clock(monkeypatch)
+        monkeypatch.setattr(export, "EXPORT_PROGRESS_INTERVAL", 0)
+        reports = []
+
+        async def on_progress(value, telemetry=None):
+            reports.append((value, telemetry))
+
+        # 100s source: 80s stream-copied, 20s re-encoded
+        progress = export.EncodeProgress(100.0, on_progress, copy_duration=80.0)
+        await progress.on_time(0, limit=20.0)(2.0, {"frame": 60, "fps": 30.0, "speed": 1.0})
+        clock[0] += 1.0
+        await progress.on_time(1, limit=80.0, copy=True)(80.0, {"frame": 2400, "fps": 2400.0, "speed": 80.0})
+        clock[0] += 1.0
+        await progress.on_time(0, limit=20.0)(4.0, {"frame": 120, "fps": 30.0, "speed": 1.0})
+        value, telemetry = reports[-1]
+        assert value == 84
+        assert telemetry["fps"] == 30.0 and telemetry["speed"] == 1.0 and telemetry["frame"] == 120
+        assert (telemetry["encoded_seconds"], telemetry["copied_seconds"]) == (4.0, 80.0)
+        # 16s left to encode at ~1s of media per wall second
+        assert telemetry["eta_seconds"] == 16.0
+
+
+@pytest.mark.asyncio
+class TestSingleProcessRenders:
+    @pytest.fixture
+    def runs(self, monkeypatch):
+        runs = []
+
+        async def fake_run(command, on_time=None):
+            runs.append(command)
+            if on_time:
+                await on_time(5.0, {"frame": 150, "fps": 30.0, "speed": 1.0})
+
+        monkeypatch.setattr(export, "_run_ffmpeg", fake_run)
+        monkeypatch.setattr(export, "EXPORT_PROGRESS_INTERVAL", 0)
+        return runs
+
+    async def test_burn_reports_progress(self, runs, tmp_path):
+        progress = []
+
+        async def on_progress(value, telemetry=None):
+            progress.append(value)
+
+        output = str(tmp_path / "out.mp4")
+        assert await export.burn_subtitles_async("in.mp4", output, "subs.ass", 10.0, on_progress, threads=2) == output
+        assert len(runs) == 1 and runs[0][-1] == output and "libx264" in runs[0]
+        assert progress == [50, 100]
+
+    async def test_mux_reports_progress(self, runs, tmp_path):
+        progress = []
+
+        async def on_progress(value, telemetry=None):
+            progress.append(value)
+
+        output = str(tmp_path / "out.mkv")
+        assert await export.mux_subtitles("in.mp4", output, "subs.ass", 10.0, on_progress) == output
+        assert len(runs) == 1 and runs[0][-1] == output
+        assert progress == [50, 100]
+
+
+@pytest.mark.asyncio
+class TestBurnSubtitlesSegmented:
+    async def test_renders_parts_then_concats(self, tmp_path, monkeypatch):
+        commands = []
+
+        async def fake_run(command, on_time=None):
+            commands.append(command)
+            if on_time:
+                await on_time(10.0)
+
+        monkeypatch.setattr(export, "_run_ffmpeg", fake_run)
+        monkeypatch.setattr(export, "EXPORT_PROGRESS_INTERVAL", 0)
+        ass_path = tmp_path / "subs.ass"
+        ass_path.write_text("[Events]\nDialogue: 0,0:00:05.00,0:00:15.00,Default,,0,0,0,,Hi", encoding="utf-8")
+        progress = []
+
+        async def on_progress(value, telemetry=None):
+            progress.append(value)
+
+        output = tmp_path / "out.mp4"
+        await burn_subtitles_segmented(
+            "in.mp4", str(output), str(ass_path), [(0.0, 10.0), (10.0, 20.0)], 20.0, on_progress, threads=4,
+        )
+
+        part_commands, concat = commands[:2], commands[2]
+        assert [c[c.index("-ss") + 1] for c in part_commands] == ["0.000000", "10.000000"]
+        assert all("-an" in c for c in part_commands)
+        assert "concat" in concat and concat[-1] == str(output)
+        assert concat[concat.index("-map", concat.index("0:v:0")) + 1] == "1:a:0?"
+        assert progress[:2] == [50, 99] and progress[-1] == 100
+        # Part files, part ASS files and the concat list are removed
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["subs.ass"]
+
+    async def test_part_failure_propagates_and_cleans_up(self, tmp_path, monkeypatch):
+        async def failing_run(command, on_time=None):
+            raise Exception("FFmpeg failed with return code 1")
+
+        monkeypatch.setattr(export, "_run_ffmpeg", failing_run)
+        ass_path = tmp_path / "subs.ass"
+        ass_path.write_text("[Events]", encoding="utf-8")
+
+        with pytest.raises(Exception, match="FFmpeg failed"):
+            await burn_subtitles_segmented(
+                "in.mp4", str(tmp_path / "out.mp4"), str(ass_path), [(0.0, 10.0), (10.0, 20.0)], 20.0,
+            )
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["subs.ass"]
+
+
+H264_INFO = {
+    "duration": 30.0, "codec": "h264", "profile": "High", "pix_fmt": "yuv420p", "rotation": 0, "level": 40,
+    "frame_rate": "30000/1001", "avg_frame_rate": "30000/1001", "sample_aspect_ratio": "1:1", "time_base": "1/30000",
+    "keyframes": [0.0, 2.5, 5.0, 7.5, 10.0, 12.5, 15.0, 17.5, 20.0, 22.5, 25.0, 27.5],
+    "idr_keyframes": [0.0, 5.0, 10.0, 15.0, 20.0, 25.0],
+}
+
+
+class TestSmartRenderPlanning:
+    def test_event_ranges(self):
+        content = "[Events]\nDialogue: 0,0:00:01.50,0:00:03.00,Default,,0,0,0,,{\\an5}Hi, there"
+        assert ass_event_ranges(content) == [(1.5, 3.0)]
+
+    def test_compatible_source(self, monkeypatch):
+        monkeypatch.setattr(export, "EXPORT_SMART_RENDER", True)
+        assert smart_render_args(H264_INFO) == [
+            "-profile:v", "high", "-level:v", "4.0", "-pix_fmt", "yuv420p",
+            "-r", "30000/1001", "-x264-params", "sar=1/1",
+        ]
+
+    def test_unknown_sar_left_to_the_filter_graph(self, monkeypatch):
+        monkeypatch.setattr(export, "EXPORT_SMART_RENDER", True)
+        assert "-x264-params" not in smart_render_args({**H264_INFO, "sample_aspect_ratio": "0:1"})
+
+    def test_mux_args(self):
+        assert smart_mux_args(H264_INFO) == ["-tag:v", "avc3", "-video_track_timescale", "30000"]
+        assert smart_mux_args({**H264_INFO, "time_base": None}) == ["-tag:v", "avc3"]
+
+    def test_incompatible_sources(self, monkeypatch):
+        monkeypatch.setattr(export, "EXPORT_SMART_RENDER", True)
+        assert smart_render_args({**H264_INFO, "codec": "hevc"}) is None
+        assert smart_render_args({**H264_INFO, "pix_fmt": "yuv420p10le"}) is None
+        assert smart_render_args({**H264_INFO, "rotation": 90}) is None
+        assert smart_render_args({**H264_INFO, "level": None}) is None
+        assert smart_render_args({**H264_INFO, "avg_frame_rate": "24000/1001"}) is None
+        # Open-GOP I-frames don't count: without an IDR index nothing can be spliced
+        assert smart_render_args({**H264_INFO, "idr_keyframes": None}) is None
+        assert smart_render_args({**H264_INFO, "idr_keyframes": [0.0]}) is None
+
+    def test_only_gops_with_subtitles_reencoded(self):
+        plan = plan_smart_render(30.0, H264_INFO["idr_keyframes"], [(6.0, 8.0), (11.0, 12.0), (26.0, 27.0)])
+        assert plan == [
+            (0.0, 5.0, False),
+            (5.0, 15.0, True),
+            (15.0, 25.0, False),
+            (25.0, 30.0, True),
+        ]
+
+    def test_reencoded_runs_split_for_parallelism(self):
+        plan = plan_smart_render(30.0, H264_INFO["idr_keyframes"], [(5.0, 20.0)], parts=3)
+        assert plan == [
+            (0.0, 5.0, False),
+            (5.0, 10.0, True),
+            (10.0, 15.0, True),
+            (15.0, 20.0, True),
+            (20.0, 30.0, False),
+        ]
+
+    def test_not_worth_it_when_subtitles_everywhere(self):
+        assert plan_smart_render(30.0, H264_INFO["idr_keyframes"], [(0.0, 30.0)]) is None
+
+
+@pytest.mark.asyncio
+class TestRenderSubtitles:
+    @pytest.fixture
+    def calls(self, monkeypatch, tmp_path):
+        calls = []
+
+        async def fake_smart(*args, **kwargs):
+            calls.append("smart")
+
+        async def fake_segmented(*args, **kwargs):
+            calls.append("segmented")
+
+        async def fake_single(*args, **kwargs):
+            calls.append("single")
+
+        monkeypatch.setattr(export, "burn_subtitles_smart", fake_smart)
+        monkeypatch.setattr(export, "burn_subtitles_segmented", fake_segmented)
+        monkeypatch.setattr(export, "burn_subtitles_async", fake_single)
+        monkeypatch.setattr(export, "EXPORT_SMART_RENDER", True)
+        monkeypatch.setattr(export, "EXPORT_SEGMENTED", True)
+        return calls
+
+    async def test_smart_when_gaps_exist(self, calls, tmp_path):
+        ass = tmp_path / "subs.ass"
+        ass.write_text("Dialogue: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,Hi", encoding="utf-8")
+        await render_subtitles("in.mp4", "out.mp4", str(ass), H264_INFO, threads=8)
+        assert calls == ["smart"]
+
+    async def test_segmented_when_incompatible(self, calls, tmp_path):
+        ass = tmp_path / "subs.ass"
+        ass.write_text("Dialogue: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,Hi", encoding="utf-8")
+        await render_subtitles("in.mp4", "out.mp4", str(ass), {**H264_INFO, "codec": "vp9"}, threads=8)
+        assert calls == ["segmented"]
+
+    async def test_full_encode_after_smart_failure(self, calls, tmp_path, monkeypatch):
+        async def failing_smart(*args, **kwargs):
+            raise Exception("FFmpeg failed")
+
+        monkeypatch.setattr(export, "burn_subtitles_smart", failing_smart)
+        ass = tmp_path / "subs.ass"
+        ass.write_text("Dialogue: 0,0:00:01.00,0:00:02.00,Default,,0,0,0,,Hi", encoding="utf-8")
+        await render_subtitles("in.mp4", "out.mp4", str(ass), H264_INFO, threads=1)
+        assert calls == ["single"]
+
+
+class TestRenderCacheKey:
+    def test_changes_with_every_component(self):
+        base = render_cache_key("src", "ass", ["font"], "enc")
+        assert render_cache_key("src", "ass", ["font"], "enc") == base
+        assert render_cache_key("src2", "ass", ["font"], "enc") != base
+        assert render_cache_key("src", "ass2", ["font"], "enc") != base
+        assert render_cache_key("src", "ass", ["font2"], "enc") != base
+        assert render_cache_key("src", "ass", ["font"], "enc2") != base
+
+    def test_font_digest(self, tmp_path):
+        import hashlib
+
+        font = tmp_path / "font.ttf"
+        font.write_bytes(b"font bytes")
+        assert font_digest(str(font)) == hashlib.sha256(b"font bytes").hexdigest()
+
+
+class TestMuxCommand:
+    def test_mp4_uses_mov_text_and_copies_streams(self):
+        command = _mux_command("in.mp4", "out.mp4", "subs.ass")
+        assert command[command.index("-c:v") + 1] == "copy"
+        assert command[command.index("-c:a") + 1] == "copy"
+        assert command[command.index("-c:s") + 1] == "mov_text"
+        assert "libx264" not in command
+
+    def test_mkv_keeps_ass_and_attaches_font(self):
+        command = _mux_command("in.mp4", "out.mkv", "subs.ass", font_path="/fonts/Inter.ttf")
+        assert command[command.index("-c:s") + 1] == "ass"
+        assert command[command.index("-attach") + 1] == "/fonts/Inter.ttf"
+        assert "mimetype=application/x-truetype-font" in command
+
+
+class TestMultiOutput:
+    STYLES = {"fontSize": 40, "outlineWidth": 2.0, "shadowDepth": 2.0, "position": {"x": 100, "y": -800}}
+
+    def test_styles_scale_with_target(self):
+        # 1080x1920 -> 540x960: everything halves
+        styles = scale_styles_for_target(self.STYLES, 1080, 1920, 540, 960)
+        assert styles["fontSize"] == 20
+        assert styles["outlineWidth"] == 1.0
+        assert styles["position"] == {"x": 50.0, "y": -400.0}
+
+    def test_crop_clamps_position_into_frame(self):
+        # 9:16 -> 1:1 crop keeps width scale (1.0) and cuts the top/bottom
+        styles = scale_styles_for_target(self.STYLES, 1080, 1920, 1080, 1080, "crop")
+        assert styles["fontSize"] == 40
+        # Centre kept half a line plus outline (20 + 2) inside the 1080px frame
+        assert styles["position"] == {"x": 100.0, "y": -518.0}
+
+    def test_pad_fits_inside(self):
+        styles = scale_styles_for_target(self.STYLES, 1080, 1920, 1080, 1080, "pad")
+        assert styles["fontSize"] == 22  # 40 * 1080/1920
+        assert styles["position"]["y"] == -450.0
+
+    def test_command_decodes_once_and_splits(self):
+        outputs = [
+            {"path": "a.mp4", "ass_path": "a.ass", "width": 1080, "height": 1920},
+            {"path": "b.mp4", "ass_path": "b.ass", "width": 1080, "height": 1080, "fit": "pad"},
+            {"path": "c.mp4", "ass_path": "c.ass", "width": 360, "height": 640, "video_bitrate": 500},
+        ]
+        command = _multi_output_command("in.mp4", outputs, threads=6)
+        assert command.count("-i") == 1
+        graph = command[command.index("-filter_complex") + 1]
+        assert graph.startswith("[0:v]split=3[s0][s1][s2]")
+        assert "crop=1080:1920" in graph and "pad=1080:1080" in graph
+        assert [command[i + 1] for i, arg in enumerate(command) if arg == "-map" and command[i + 1].startswith("[")] == [
+            "[v0]", "[v1]", "[v2]",
+        ]
+        assert "500k" in command
+        assert command[-1] == "c.mp4"
+
+
+class TestPreview:
+    def test_preview_size_keeps_aspect_and_never_upscales(self):
+        assert preview_size(1080, 1920, 480) == (270, 480)
+        assert preview_size(1920, 1080, 480) == (854, 480)
+        assert preview_size(480, 270, 480) == (480, 270)
+
+    def test_ass_trimmed_scaled_and_shifted_to_window(self):
+        styles = {"fontSize": 48, "position": {"x": 0, "y": -400}}
+        subtitles = [
+            {"start": 0.0, "end": 2.0, "text": "Before"},
+            {"start": 9.0, "end": 11.0, "text": "Across"},
+            {"start": 11.5, "end": 12.5, "text": "Inside"},
+            {"start": 20.0, "end": 21.0, "text": "After"},
+        ]
+        content = preview_ass_content(subtitles, styles, 1080, 1920, 270, 480, 10.0, 3.0)
+        events = [line for line in content.split("\n") if line.startswith("Dialogue:")]
+        assert len(events) == 2
+        assert events[0].startswith("Dialogue: 0,0:00:00.00,0:00:01.00,")
+        assert events[1].startswith("Dialogue: 0,0:00:01.50,0:00:02.50,")
+        assert "PlayResX: 270" in content and "Style: Default,Arial,12," in content
+        assert "\\pos(135,340)" in content
+
+    def test_command_seeks_input_and_scales_before_subtitles(self):
+        command = _preview_command("in.mp4", "out.mp4", "subs.ass", 10.0, 3.0, 270, 480, threads=2)
+        assert command.index("-ss") < command.index("-i")
+        assert command[command.index("-t") + 1] == "3.000000"
+        assert command[command.index("-vf") + 1].startswith("scale=270:480,setsar=1,subtitles=")
+        assert command[command.index("-preset") + 1] == "ultrafast"
+        assert command[-1] == "out.mp4"
@@ -0,0 +1,194 @@
+"""Tests for core/probe.py"""
+import pytest
+
+import core.probe as probe
+from core.probe import _parse_idr_frames, _parse_keyframes, parse_probe_output, probe_media, probe_partial_upload, sniff_container
+
+FFPROBE_JSON = {
+    "streams": [
+        {
+            "codec_type": "video", "codec_name": "h264", "profile": "High", "level": 40,
+            "sample_aspect_ratio": "1:1", "time_base": "1/30000",
+            "width": 1920, "height": 1080, "pix_fmt": "yuv420p",
+            "avg_frame_rate": "30000/1001", "r_frame_rate": "30/1", "duration": "12.5",
+            "side_data_list": [{"side_data_type": "Display Matrix", "rotation": -90}],
+        },
+        {"codec_type": "audio", "codec_name": "aac"},
+    ],
+    "format": {"format_name": "mov,mp4,m4a,3gp,3g2,mj2", "duration": "12.6"},
+}
+
+
+class TestSniffContainer:
+    def test_mp4(self):
+        assert sniff_container(b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00") == "mp4"
+
+    def test_quicktime_mdat_first(self):
+        assert sniff_container(b"\x00\x00\x00\x08wide\x00\x00") == "mp4"
+
+    def test_matroska(self):
+        assert sniff_container(b"\x1a\x45\xdf\xa3" + b"\x00" * 20) == "matroska"
+
+    def test_avi(self):
+        assert sniff_container(b"RIFF\x00\x00\x00\x00AVI LIST") == "avi"
+
+    def test_unknown(self):
+        assert sniff_container(b"\x00" * 64) is None
+        assert sniff_container(b"") is None
+
+
+@pytest.mark.asyncio
+class TestProbePartialUpload:
+    def _fake_ffprobe(self, monkeypatch, result):
+        async def fake_run(command, timeout=None):
+            return result
+
+        monkeypatch.setattr(probe, "run_process", fake_run)
+
+    async def test_video_stream_found(self, monkeypatch):
+        self._fake_ffprobe(monkeypatch, (0, "h264\n", ""))
+        assert await probe_partial_upload("head.mkv", "matroska") is True
+
+    async def test_no_video_stream_rejected(self, monkeypatch):
+        self._fake_ffprobe(monkeypatch, (0, "", ""))
+        assert await probe_partial_upload("head.mp4", "mp4") is False
+
+    async def test_truncated_faststart_mp4_accepted(self, monkeypatch):
+        # moov runs past the sniffed head: ffprobe hits EOF mid-index
+        self._fake_ffprobe(monkeypatch, (1, "", "[mov,mp4,m4a,3gp,3g2,mj2 @ 0x1] error reading header\nhead.mp4: End of file\n"))
+        assert await probe_partial_upload("head.mp4", "mp4") is True
+
+    async def test_truncated_matroska_accepted(self, monkeypatch):
+        self._fake_ffprobe(monkeypatch, (1, "", "head.mkv: End of file\n"))
+        assert await probe_partial_upload("head.mkv", "matroska") is True
+
+    async def test_corrupt_header_rejected(self, monkeypatch):
+        self._fake_ffprobe(monkeypatch, (1, "", "head.avi: Invalid data found when processing input\n"))
+        assert await probe_partial_upload("head.avi", "avi") is False
+
+
+class TestParseProbeOutput:
+    def test_fields(self):
+        info = parse_probe_output(FFPROBE_JSON, [0.0, 2.0])
+        assert info["duration"] == 12.5
+        assert info["fps"] == 29.97
+        assert info["codec"] == "h264"
+        assert info["has_audio"] is True
+        assert info["audio_codec"] == "aac"
+        assert info["keyframe_count"] == 2
+        assert info["level"] == 40
+        assert (info["frame_rate"], info["avg_frame_rate"]) == ("30/1", "30000/1001")
+        assert (info["sample_aspect_ratio"], info["time_base"]) == ("1:1", "1/30000")
+        assert info["idr_keyframes"] is None
+
+    def test_rotation_swaps_display_dimensions(self):
+        info = parse_probe_output(FFPROBE_JSON)
+        assert info["rotation"] == 90
+        assert (info["width"], info["height"]) == (1080, 1920)
+        assert (info["coded_width"], info["coded_height"]) == (1920, 1080)
+
+    def test_format_duration_fallback_and_no_audio(self):
+        data = {
+            "streams": [{"codec_type": "video", "width": 640, "height": 360, "avg_frame_rate": "0/0", "r_frame_rate": "25/1"}],
+            "format": {"duration": "3.0"},
+        }
+        info = parse_probe_output(data)
+        assert info["duration"] == 3.0
+        assert info["fps"] == 25.0
+        assert info["has_audio"] is False
+        assert info["rotation"] == 0
+
+    def test_no_video_stream(self):
+        with pytest.raises(ValueError):
+            parse_probe_output({"streams": [{"codec_type": "audio"}]})
+
+
+class TestParseKeyframes:
+    def test_keeps_keyframe_packets(self):
+        output = "0.000000,K__\n0.033367,___\n2.002000,K__\nN/A,K__\n"
+        assert _parse_keyframes(output) == [0.0, 2.002]
+
+
+class TestParseIdrFrames:
+    def test_framecrc_timestamps(self):
+        output = (
+            "#software: Lavf60.3.100\n"
+            "#tb 0: 1/15360\n"
+            "#media_type 0: video\n"
+            "0,      -1024,          0,      512,    40213, 0x1c2d3e4f\n"
+            "0,      29696,      30720,      512,    39002, 0x5a6b7c8d\n"
+        )
+        assert _parse_idr_frames(output) == [0.0, 2.0]
+
+    def test_empty(self):
+        assert _parse_idr_frames("#tb 0: 1/90000\n") == []
+
+
+@pytest.mark.asyncio
+class TestProbeMedia:
+    async def test_cached_in_memory_and_sqlite(self, db, tmp_path, monkeypatch):
+        video = tmp_path / "video.mp4"
+        video.write_bytes(b"data")
+        calls = []
+
+        async def fake_probe(path):
+            calls.append(path)
+            return parse_probe_output(FFPROBE_JSON, [0.0])
+
+        monkeypatch.setattr(probe, "_probe_uncached", fake_probe)
+        monkeypatch.setattr(probe, "_memory_cache", {})
+
+        first = await probe_media(str(video), "abc")
+        assert await probe_media(str(video), "abc") == first
+        # Memory cache gone (e.g. restart): served from SQLite
+        probe._memory_cache.clear()
+        assert await probe_media(str(video), "abc") == first
+        assert len(calls) == 1
+
+    async def test_callers_get_copies(self, db, tmp_path, monkeypatch):
+        video = tmp_path / "video.mp4"
+        video.write_bytes(b"data")
+
+        async def fake_probe(path):
+            return parse_probe_output(FFPROBE_JSON, [0.0, 2.0])
+
+        monkeypatch.setattr(probe, "_probe_uncached", fake_probe)
+        monkeypatch.setattr(probe, "_memory_cache", {})
+
+        first = await probe_media(str(video), "abc")
+        first["width"] = 1
+        first["keyframes"].append(99.0)
+        second = await probe_media(str(video), "abc")
+        assert second["width"] != 1
+        assert second["keyframes"] == [0.0, 2.0]
+
+    async def test_file_key_changes_with_content(self, db, tmp_path, monkeypatch):
+        video = tmp_path / "video.mp4"
+        video.write_bytes(b"data")
+        calls = []
+
+        async def fake_probe(path):
+            calls.append(path)
+            return parse_probe_output(FFPROBE_JSON)
+
+        monkeypatch.setattr(probe, "_probe_uncached", fake_probe)
+        monkeypatch.setattr(probe, "_memory_cache", {})
+
+        await probe_media(str(video))
+        video.write_bytes(b"longer data")
+        await probe_media(str(video))
+        assert len(calls) == 2
+
+    async def test_failure_returns_defaults_uncached(self, db, tmp_path, monkeypatch):
+        video = tmp_path / "video.mp4"
+        video.write_bytes(b"data")
+
+        async def failing_probe(path):
+            raise RuntimeError("ffprobe failed")
+
+        monkeypatch.setattr(probe, "_probe_uncached", failing_probe)
+        monkeypatch.setattr(probe, "_memory_cache", {})
+
+        info = await probe_media(str(video), "abc")
+        assert (info["width"], info["height"], info["duration"]) == (1080, 1920, 0)
+        assert probe._memory_cache == {}
@@ -0,0 +1,143 @@
+"""Tests for core/process.py"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+from core.process import STDERR_TAIL_LINES, ProcessTimeout, run_process, run_process_sync
+
+
+def _python(code):
+    return [sys.executable, "-c", code]
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+@pytest.mark.asyncio
+class TestRunProcess:
+    async def test_collects_stdout_and_returncode(self):
+        returncode, stdout, stderr = await run_process(_python("import sys; print('out'); sys.exit(3)"))
+        assert returncode == 3
+        assert stdout.strip() == "out"
+        assert stderr == ""
+
+    async def test_stderr_kept_as_bounded_tail(self):
+        # ffmpeg redraws its stats line with \r; a flood must not block the pipe
+        code = "import sys\nfor i in range(5000): sys.stderr.write(f'line {i}\\r' if i % 2 else f'line {i}\\n')"
+        returncode, _, stderr = await run_process(_python(code), timeout=10)
+        lines = stderr.split("\n")
+        assert returncode == 0
+        assert len(lines) == STDERR_TAIL_LINES
+        assert lines[-1] == "line 4999"
+
+    async def test_streams_lines(self):
+        seen = []
+
+        async def on_line(line):
+            seen.append(line)
+
+        returncode, stdout, _ = await run_process(_python("print('a=1'); print('progress=end')"), on_line)
+        assert returncode == 0 and stdout == ""
+        assert seen == ["a=1", "progress=end"]
+
+    async def test_stall_timeout_kills_silent_process(self):
+        pids = []
+
+        async def on_line(line):
+            pids.append(int(line))
+
+        code = "import os, time; print(os.getpid(), flush=True); time.sleep(30)"
+        with pytest.raises(ProcessTimeout, match="no progress"):
+            await run_process(_python(code), on_line, stall_timeout=0.3)
+        assert not _alive(pids[0])
+
+    async def test_wall_clock_timeout(self):
+        code = "import time\nwhile True:\n    print('tick', flush=True); time.sleep(0.05)"
+
+        async def on_line(line):
+            pass
+
+        with pytest.raises(ProcessTimeout, match="timed out"):
+            await run_process(_python(code), on_line, timeout=0.3, stall_timeout=5)
+
+    async def test_cancellation_kills_process(self):
+        pids = []
+        running = asyncio.Event()
+
+        async def on_line(line):
+            pids.append(int(line))
+            running.set()
+
+        code = "import os, time; print(os.getpid(), flush=True); time.sleep(30)"
+        task = asyncio.ensure_future(run_process(_python(code), on_line))
+        await asyncio.wait_for(running.wait(), 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not _alive(pids[0])
+
+    @pytest.mark.skipif(not hasattr(os, "setpriority"), reason="no process priorities")
+    async def test_runs_niced(self):
+        # The priority is lowered from the parent after the spawn; give it a moment
+        script = "import os, time; time.sleep(0.2); print(os.nice(0))"
+        _, stdout, _ = await run_process(_python(script), nice=5)
+        assert int(stdout) == min(os.nice(0) + 5, 19)
+
+
+class TestRunProcessSync:
+    def test_collects_stdout_and_returncode(self):
+        returncode, stdout, stderr = run_process_sync(_python("import sys; print('out'); sys.exit(3)"))
+        assert returncode == 3
+        assert stdout.strip() == b"out"
+        assert stderr == ""
+
+    def test_stderr_flood_while_streaming_stdout(self):
+        # Plenty more than a pipe buffer on stderr before stdout closes
+        code = "import sys\nsys.stderr.write('decode error\\n' * 20000)\nsys.stdout.write('x' * 100000)"
+        blocks = []
+        returncode, stdout, stderr = run_process_sync(_python(code), on_stdout=blocks.append, timeout=10)
+        assert returncode == 0 and stdout == b""
+        assert sum(len(block) for block in blocks) == 100000
+        assert len(stderr.split("\n")) == STDERR_TAIL_LINES
+
+    def test_stdin_and_every_stderr_line(self):
+        code = "import sys\ndata = sys.stdin.buffer.read()\nsys.stdout.buffer.write(data[::-1])\nfor i in range(500): print(i, file=sys.stderr)"
+        lines = []
+        returncode, stdout, _ = run_process_sync(_python(code), input=b"abc", on_stderr_line=lines.append)
+        assert returncode == 0 and stdout == b"cba"
+        assert lines == [str(i) for i in range(500)]
+
+    def test_stall_timeout_kills_silent_process(self):
+        code = "import time; time.sleep(30)"
+        with pytest.raises(ProcessTimeout, match="no progress"):
+            run_process_sync(_python(code), stall_timeout=0.5)
+
+    def test_wall_clock_timeout(self):
+        code = "import time\nwhile True:\n    print('tick', flush=True); time.sleep(0.05)"
+        with pytest.raises(ProcessTimeout, match="timed out"):
+            run_process_sync(_python(code), timeout=0.5, stall_timeout=5)
+
+    def test_callback_failure_kills_process(self):
+        code = "import os, sys, time; print(os.getpid(), flush=True); time.sleep(30)"
+        pids = []
+
+        def on_stdout(block):
+            pids.append(int(block))
+            raise ValueError("bad block")
+
+        with pytest.raises(ValueError):
+            run_process_sync(_python(code), on_stdout=on_stdout)
+        assert not _alive(pids[0])
+
+    @pytest.mark.skipif(not hasattr(os, "setpriority"), reason="no process priorities")
+    def test_runs_niced(self):
+        script = "import os, time; time.sleep(0.2); print(os.nice(0))"
+        _, stdout, _ = run_process_sync(_python(script), nice=5)
+        assert int(stdout) == min(os.nice(0) + 5, 19)
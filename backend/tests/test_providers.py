@@ -0,0 +1,71 @@
+"""Tests for core/providers.py"""
+import pytest
+
+import core.providers as providers
+from core.providers import call_with_retries
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    async def _sleep(delay):
+        pass
+    monkeypatch.setattr(providers.asyncio, "sleep", _sleep)
+    providers._semaphores.clear()
+    yield
+    providers._semaphores.clear()
+
+
+@pytest.mark.asyncio
+class TestCallWithRetries:
+    async def test_success_first_try(self):
+        async def fn(x):
+            return x * 2
+        assert await call_with_retries("openai", fn, 21) == 42
+
+    async def test_retries_on_429_then_succeeds(self):
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            if len(calls) < 3:
+                raise _StatusError(429)
+            return "ok"
+
+        assert await call_with_retries("openai", fn) == "ok"
+        assert len(calls) == 3
+
+    async def test_no_retry_on_client_error(self):
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            raise _StatusError(400)
+
+        with pytest.raises(_StatusError):
+            await call_with_retries("openai", fn)
+        assert len(calls) == 1
+
+    async def test_gives_up_after_max_retries(self, monkeypatch):
+        monkeypatch.setattr(providers, "PROVIDER_MAX_RETRIES", 2)
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            raise _StatusError(503)
+
+        with pytest.raises(_StatusError):
+            await call_with_retries("anthropic", fn)
+        assert len(calls) == 3
+
+
+class TestRetryDelay:
+    def test_backoff_is_bounded(self):
+        for attempt in range(10):
+            delay = providers._retry_delay(_StatusError(500), attempt)
+            assert 0 <= delay <= providers.RETRY_MAX_DELAY
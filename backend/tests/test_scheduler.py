@@ -0,0 +1,116 @@
+"""Tests for core/scheduler.py"""
+import asyncio
+
+import pytest
+
+from core.scheduler import JobScheduler, QueueFullError
+
+
+def _gated_job(order, name, gate):
+    async def run():
+        order.append(f"start:{name}")
+        await gate.wait()
+        order.append(f"end:{name}")
+    return run
+
+
+@pytest.mark.asyncio
+class TestJobScheduler:
+    async def test_runs_up_to_workers_and_queues_rest(self):
+        scheduler = JobScheduler(workers=2, max_queued=10)
+        gate = asyncio.Event()
+        order = []
+
+        assert await scheduler.submit("a", _gated_job(order, "a", gate)) is True
+        assert await scheduler.submit("b", _gated_job(order, "b", gate)) is True
+        assert await scheduler.submit("c", _gated_job(order, "c", gate)) is False
+        await asyncio.sleep(0)
+        assert scheduler.running == 2
+        assert scheduler.position("c") == 1
+
+        gate.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert "start:c" in order
+        assert scheduler.running == 0 and scheduler.queued == 0
+
+    async def test_priority_then_fifo(self):
+        scheduler = JobScheduler(workers=1, max_queued=10)
+        gate = asyncio.Event()
+        order = []
+
+        await scheduler.submit("busy", _gated_job(order, "busy", gate))
+        await scheduler.submit("low1", _gated_job(order, "low1", gate))
+        await scheduler.submit("low2", _gated_job(order, "low2", gate))
+        await scheduler.submit("high", _gated_job(order, "high", gate), priority=5)
+        assert [scheduler.position(j) for j in ("high", "low1", "low2")] == [1, 2, 3]
+
+        gate.set()
+        for _ in range(20):
+            await asyncio.sleep(0)
+        starts = [o.split(":")[1] for o in order if o.startswith("start:")]
+        assert starts == ["busy", "high", "low1", "low2"]
+
+    async def test_queue_updates_report_position_and_estimate(self):
+        scheduler = JobScheduler(workers=1, max_queued=10)
+        gate = asyncio.Event()
+        updates = {}
+
+        def recorder(name):
+            async def on_update(position, estimated_start):
+                updates.setdefault(name, []).append((position, estimated_start))
+            return on_update
+
+        await scheduler.submit("a", _gated_job([], "a", gate), cost=10)
+        await scheduler.submit("b", _gated_job([], "b", gate), cost=20, on_queue_update=recorder("b"))
+        await scheduler.submit("c", _gated_job([], "c", gate), cost=5, on_queue_update=recorder("c"))
+
+        position, eta = updates["c"][-1]
+        assert position == 2
+        # Waits for the rest of "a" (~10s) plus all of "b" (20s) at 1s per cost unit
+        assert 29 < eta <= 30
+        gate.set()
+        for _ in range(20):
+            await asyncio.sleep(0)
+
+    async def test_queue_full(self):
+        scheduler = JobScheduler(workers=1, max_queued=1)
+        gate = asyncio.Event()
+        await scheduler.submit("a", _gated_job([], "a", gate))
+        await scheduler.submit("b", _gated_job([], "b", gate))
+        with pytest.raises(QueueFullError):
+            await scheduler.submit("c", _gated_job([], "c", gate))
+        await scheduler.shutdown()
+        assert scheduler.running == 0 and scheduler.queued == 0
+
+    async def test_failed_job_frees_worker(self):
+        scheduler = JobScheduler(workers=1, max_queued=10)
+        ran = []
+
+        async def failing():
+            raise RuntimeError("boom")
+
+        async def ok():
+            ran.append("ok")
+
+        await scheduler.submit("a", failing)
+        await scheduler.submit("b", ok)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert ran == ["ok"]
+
+    async def test_cancel_queued_and_running(self):
+        scheduler = JobScheduler(workers=1, max_queued=10)
+        gate = asyncio.Event()
+        order = []
+
+        await scheduler.submit("a", _gated_job(order, "a", gate))
+        await scheduler.submit("b", _gated_job(order, "b", gate))
+        await asyncio.sleep(0)
+
+        assert await scheduler.cancel("b") == "queued"
+        assert scheduler.queued == 0
+        assert await scheduler.cancel("a") == "running"
+        assert scheduler.running == 0
+        assert await scheduler.cancel("a") is None
+        assert order == ["start:a"]